@@ -0,0 +1,209 @@
+import json
+import os
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from sqlmodel import Session, select
+
+from config import PROFILE_BATCH_ROWS, UPLOAD_DIRECTORY
+from database.models import Dataset, SavedAggregation
+
+AGGREGATE_FUNCTIONS = ("sum", "count", "min", "max", "mean")
+
+# The partial aggregates each function keeps per group, and how two partials combine
+_PARTIALS = {
+    "sum": ["sum"],
+    "count": ["count"],
+    "min": ["min"],
+    "max": ["max"],
+    "mean": ["sum", "count"],
+}
+_MERGE = {"sum": "sum", "count": "sum", "count_all": "sum", "min": "min", "max": "max"}
+
+_dataset_locks = defaultdict(threading.Lock)
+_dataset_locks_lock = threading.Lock()
+
+
+def aggregation_state_path(aggregation_id: int) -> str:
+    return os.path.join(UPLOAD_DIRECTORY, "aggregations", f"{aggregation_id}.parquet")
+
+
+@contextmanager
+def dataset_lock(session: Session, dataset_id: int):
+    """
+    Serializes appends to a dataset and refreshes of its saved aggregations,
+    which both read the last segment position and write after it. Holds a
+    lock per dataset in this process and, where the database supports it,
+    a row lock on the dataset (SELECT ... FOR UPDATE) for other workers.
+    Yields the dataset re-read under the lock, or None if it is gone; the
+    caller commits before leaving the block, which releases the row lock.
+    """
+    with _dataset_locks_lock:
+        lock = _dataset_locks[dataset_id]
+    with lock:
+        dataset = session.exec(select(Dataset).where(Dataset.id == dataset_id).with_for_update()).first()
+        # Anything loaded before the lock was taken may be out of date; pending changes were flushed by the query
+        session.expire_all()
+        try:
+            yield dataset
+        except BaseException:
+            session.rollback()
+            raise
+
+
+def normalize_aggregates(columns: list, group_by: list, aggregates: list) -> list:
+    """
+    Checks an aggregation against a dataset's columns and fills in the
+    output names. Raises ValueError for anything that cannot be kept
+    up to date incrementally.
+    """
+    unknown = [name for name in group_by if name not in columns]
+    if unknown:
+        raise ValueError(f"Unknown group-by columns: {unknown}")
+    if not aggregates:
+        raise ValueError("At least one aggregate is required")
+    specs = []
+    for aggregate in aggregates:
+        function, column = aggregate["function"], aggregate.get("column")
+        if function not in AGGREGATE_FUNCTIONS:
+            raise ValueError(f"Unsupported function {function!r}; use one of {', '.join(AGGREGATE_FUNCTIONS)}")
+        if column is None and function != "count":
+            raise ValueError(f"{function} needs a column")
+        if column is not None and column not in columns:
+            raise ValueError(f"Unknown column: {column}")
+        alias = aggregate.get("alias") or (f"{function}_{column}" if column else "count")
+        specs.append({"function": function, "column": column, "alias": alias})
+    names = [*group_by, *(spec["alias"] for spec in specs)]
+    if len(set(names)) != len(names):
+        raise ValueError("Output column names must be unique")
+    return specs
+
+
+def _state_columns(specs: list) -> list:
+    """The (column, function) pairs the partial state is made of."""
+    pairs = []
+    for spec in specs:
+        for partial in _PARTIALS[spec["function"]]:
+            pair = ([], "count_all") if spec["column"] is None else (spec["column"], partial)
+            if pair not in pairs:
+                pairs.append(pair)
+    return pairs
+
+
+def _state_name(pair: tuple) -> str:
+    column, function = pair
+    return function if function == "count_all" else f"{column}_{function}"
+
+
+def partial_state(table: pa.Table, group_by: list, specs: list) -> pa.Table:
+    """The partial aggregates of `table`, one row per group."""
+    pairs = _state_columns(specs)
+    grouped = table.group_by(group_by, use_threads=False).aggregate(pairs)
+    return grouped.select([*group_by, *(_state_name(pair) for pair in pairs)])
+
+
+def merge_states(states: List[pa.Table], group_by: list, specs: list) -> pa.Table:
+    """Combines partial states computed over different rows into one."""
+    states = [state for state in states if state is not None]
+    if len(states) == 1:
+        return states[0]
+    names = [_state_name(pair) for pair in _state_columns(specs)]
+    functions = {_state_name(pair): _MERGE[pair[1]] for pair in _state_columns(specs)}
+    merged = pa.concat_tables(states).group_by(group_by, use_threads=False).aggregate(
+        [(name, functions[name]) for name in names]
+    )
+    return merged.select([*group_by, *(f"{name}_{functions[name]}" for name in names)]).rename_columns(
+        [*group_by, *names]
+    )
+
+
+def final_result(state: pa.Table, group_by: list, specs: list) -> pa.Table:
+    """Turns a partial state into the aggregation's output, sorted by the group keys."""
+    columns = {name: state[name] for name in group_by}
+    for spec in specs:
+        if spec["column"] is None:
+            columns[spec["alias"]] = state["count_all"]
+        elif spec["function"] == "mean":
+            total = pc.cast(state[f"{spec['column']}_sum"], pa.float64())
+            count = state[f"{spec['column']}_count"]
+            columns[spec["alias"]] = pc.if_else(pc.equal(count, 0), None, pc.divide(total, count))
+        else:
+            columns[spec["alias"]] = state[f"{spec['column']}_{spec['function']}"]
+    result = pa.table(columns)
+    if group_by:
+        result = result.sort_by([(name, "ascending") for name in group_by])
+    return result
+
+
+def fold_files(state: Optional[pa.Table], files: list, group_by: list, specs: list,
+               batch_rows: int = PROFILE_BATCH_ROWS) -> pa.Table:
+    """Folds the rows of `files` into `state` batch by batch, reading only the columns used."""
+    needed = list(dict.fromkeys([*group_by, *(spec["column"] for spec in specs if spec["column"])]))
+    for path in files:
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=batch_rows, columns=needed or None):
+            table = pa.Table.from_batches([batch])
+            state = merge_states([state, partial_state(table, group_by, specs)], group_by, specs)
+    if state is None:  # No rows at all
+        empty = pq.read_schema(files[0]).empty_table().select(needed) if files else pa.table({})
+        state = partial_state(empty, group_by, specs)
+    return state
+
+
+def _write_state(path: str, state: pa.Table):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    pq.write_table(state, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def refresh_aggregation(dataset: Dataset, aggregation: SavedAggregation, rebuild: bool = False):
+    """
+    Brings a saved aggregation up to date. Only segments appended since the
+    last refresh are read; with `rebuild`, or on the first build, every file
+    of the dataset is. The caller commits.
+    """
+    group_by = json.loads(aggregation.group_by_json)
+    specs = json.loads(aggregation.aggregates_json)
+    files = [(0, dataset.parquet_path), *((segment.position, segment.file_path) for segment in dataset.segments)]
+    state = None
+    if rebuild or aggregation.applied_position is None or not aggregation.state_path:
+        applied = -1
+    else:
+        applied = aggregation.applied_position
+        state = pq.read_table(aggregation.state_path)
+    pending = [path for position, path in files if position > applied]
+    try:
+        if pending or state is None:
+            state = fold_files(state, pending, group_by, specs)
+            aggregation.state_path = aggregation_state_path(aggregation.id)
+            _write_state(aggregation.state_path, state)
+        aggregation.applied_position = files[-1][0]
+        aggregation.status, aggregation.error = "ready", None
+    except Exception as e:
+        print(f"Could not refresh aggregation {aggregation.id}: {e}")
+        aggregation.status, aggregation.error = "failed", str(e)
+
+
+def read_aggregation(aggregation: SavedAggregation) -> Optional[pa.Table]:
+    """The current output of a saved aggregation, or None if it was never built."""
+    if aggregation.status != "ready" or not aggregation.state_path:
+        return None
+    state = pq.read_table(aggregation.state_path)
+    return final_result(state, json.loads(aggregation.group_by_json), json.loads(aggregation.aggregates_json))
+
+
+def refresh_aggregations(engine, dataset_id: int, rebuild: bool = False):
+    """Refreshes every saved aggregation of a dataset in its own session."""
+    with Session(engine) as session, dataset_lock(session, dataset_id) as dataset:
+        if dataset is None:
+            return
+        for aggregation in dataset.aggregations:
+            refresh_aggregation(dataset, aggregation, rebuild)
+            session.add(aggregation)
+        session.commit()
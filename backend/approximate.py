@@ -0,0 +1,193 @@
+import warnings
+from statistics import NormalDist
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from config import APPROXIMATE_CONFIDENCE, APPROXIMATE_REPLICATES
+from result_store import result_writer_code
+
+REPLICATE_COLUMN = "_replicate"
+
+# Runs the aggregation on the whole stage sample and again on each of its
+# disjoint sub-samples (rows labelled by `_approx_labels`). The spread of the
+# sub-sample answers is what the error bounds are derived from.
+_REPLICATE_TEMPLATE = """
+def _approx_frame(_value):
+    if isinstance(_value, pd.Series):
+        return _value.to_frame()
+    if isinstance(_value, pd.DataFrame):
+        return _value
+    return pd.DataFrame({{'value': [_value]}})
+_approx_body = {body!r}
+exec(_approx_body, globals())
+_approx_estimate = ans_df
+_approx_full = {table}_df
+_approx_parts = []
+for _approx_i in range({replicates}):
+    {table}_df = _approx_full[_approx_labels == _approx_i].reset_index(drop=True)
+    try:
+        exec(_approx_body, globals())
+    except Exception:
+        continue
+    _approx_parts.append(_approx_frame(ans_df).assign({replicate_column}=_approx_i))
+{table}_df = _approx_full
+ans_df = _approx_estimate
+_approx_replicates = (
+    pd.concat(_approx_parts, ignore_index=True) if _approx_parts else pd.DataFrame({{{replicate_column!r}: []}})
+)
+"""
+
+
+def sample_load_code(table: str, sample_path: str, columns: Optional[list], replicates: int = APPROXIMATE_REPLICATES) -> str:
+    """
+    Kernel code that loads a dataset's stored row sample as `<table>_df`.
+    The sample is in random order, so consecutive rows form the sub-samples.
+    """
+    columns_arg = f", columns={columns!r}" if columns is not None else ""
+    return (
+        f"{table}_df = pd.read_parquet(r'{sample_path}'{columns_arg})\n"
+        f"_approx_labels = np.arange(len({table}_df)) % {replicates}"
+    )
+
+
+def choose_row_groups(files: list, fraction: float, seed: int = 0) -> Optional[tuple]:
+    """
+    Picks a random `fraction` of the row groups across a dataset's Parquet
+    files. Returns ([(path, group), ...], rows), or None if that would be
+    the whole dataset.
+    """
+    groups = []
+    for path in files:
+        metadata = pq.ParquetFile(path).metadata
+        groups += [(path, index, metadata.row_group(index).num_rows) for index in range(metadata.num_row_groups)]
+    count = max(1, round(fraction * len(groups)))
+    if count >= len(groups):
+        return None
+    picked = np.random.default_rng(seed).choice(len(groups), size=count, replace=False)
+    selection = [groups[i] for i in picked]
+    return [(path, index) for path, index, _ in selection], sum(rows for _, _, rows in selection)
+
+
+def row_group_load_code(table: str, selection: list, columns: Optional[list], replicates: int = APPROXIMATE_REPLICATES) -> str:
+    """
+    Kernel code that loads the chosen row groups as `<table>_df`. With enough
+    groups each sub-sample is a set of whole row groups, so rows stored next
+    to each other (and likely correlated) stay in the same sub-sample.
+    """
+    columns_arg = f", columns={columns!r}" if columns is not None else ""
+    by_group = "True" if len(selection) >= replicates else "False"
+    return f"""
+import pyarrow as _pa
+import pyarrow.parquet as _pq
+_approx_tables = [_pq.ParquetFile(_path).read_row_group(_group{columns_arg}) for _path, _group in {selection!r}]
+{table}_df = _pa.concat_tables(_approx_tables).to_pandas()
+if {by_group}:
+    _approx_labels = np.concatenate([np.full(_t.num_rows, _i % {replicates}) for _i, _t in enumerate(_approx_tables)])
+else:
+    _approx_labels = np.random.default_rng(0).permutation(len({table}_df)) % {replicates}
+del _approx_tables
+"""
+
+
+def replicate_code(
+    table: str, body: str, estimate_id: str, replicates_id: str, replicates: int = APPROXIMATE_REPLICATES
+) -> str:
+    """
+    Kernel code that runs `body` (which sets ans_df from the `<table>_df`
+    frames) on the stage sample and its sub-samples, and writes both answers
+    to the result store.
+    """
+    code = _REPLICATE_TEMPLATE.format(
+        body=body, table=table, replicates=replicates, replicate_column=REPLICATE_COLUMN
+    )
+    return "\n".join([
+        code, result_writer_code(estimate_id), result_writer_code(replicates_id, "_approx_replicates")
+    ])
+
+
+def _aligned_replicates(sample: pd.DataFrame, replicates: pd.DataFrame, keys: list) -> list:
+    """Each sub-sample's answer, row-aligned with the answer on the whole sample."""
+    by_key = bool(keys) and not sample.duplicated(keys).any()
+    aligned = []
+    for replicate, part in replicates.groupby(REPLICATE_COLUMN, sort=True):
+        part = part.drop(columns=[REPLICATE_COLUMN])
+        if by_key and not part.duplicated(keys).any():
+            aligned.append(sample[keys].merge(part, on=keys, how="left"))
+        else:
+            aligned.append(part.reset_index(drop=True).reindex(range(len(sample))))
+    return aligned
+
+
+def _key_columns(sample: pd.DataFrame, replicates: pd.DataFrame) -> list:
+    """
+    The columns that identify the rows of an answer: non-numeric ones, and
+    integer ones (group ids, years) that are unique in the answer and only
+    take values the answer has in every sub-sample answer too.
+    """
+    keys = []
+    for column in sample.columns:
+        values = sample[column]
+        if not pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+            keys.append(column)
+        elif pd.api.types.is_integer_dtype(values) and values.is_unique and column in replicates \
+                and replicates[column].isin(values).all():
+            keys.append(column)
+    return keys
+
+
+def estimate_result(
+    sample: pd.DataFrame, replicates: pd.DataFrame, scale: float,
+    replicate_count: int = APPROXIMATE_REPLICATES, confidence: float = APPROXIMATE_CONFIDENCE,
+) -> tuple:
+    """
+    Turns the answer on a sample into estimates for the whole dataset.
+
+    Numeric columns whose sub-sample answers add up to the sample answer
+    (sums, counts) are totals and are scaled up by `scale` (dataset rows per
+    sample row); the others (means, ratios, extremes) are kept as they are.
+    Non-numeric and id-like integer columns identify the rows of the answer. Returns
+    (estimates, bounds, scaled_columns); `bounds` holds `<column>_low` and
+    `<column>_high` for every numeric column at the given confidence.
+    """
+    keys = _key_columns(sample, replicates)
+    numeric = [column for column in sample.columns if column not in keys]
+    if not numeric:
+        return sample, None, []
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    aligned = _aligned_replicates(sample, replicates, keys) if len(replicates) else []
+
+    estimates = sample.copy()
+    bounds = sample[keys].copy()
+    scaled = []
+    for column in numeric:
+        value = sample[column].to_numpy(dtype=float, na_value=np.nan)
+        if aligned:
+            matrix = np.column_stack([
+                pd.to_numeric(part[column], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+                if column in part else np.full(len(sample), np.nan)
+                for part in aligned
+            ])
+        else:
+            matrix = np.full((len(sample), 0), np.nan)
+        with np.errstate(all="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            total_error = np.nansum(np.abs(np.nansum(matrix, axis=1) - value))
+            mean_error = np.nansum(np.abs(np.nanmean(matrix, axis=1) - value)) if matrix.shape[1] else np.inf
+            is_total = bool(matrix.shape[1]) and total_error < mean_error
+            if is_total:
+                # A sub-sample missing a group contributed nothing to it
+                estimate = value * scale
+                spread = np.nan_to_num(matrix) * replicate_count * scale
+                error = np.std(spread, axis=1, ddof=1) / np.sqrt(matrix.shape[1]) if matrix.shape[1] > 1 else np.nan
+                estimates[column] = estimate
+                scaled.append(column)
+            else:
+                estimate = value
+                present = np.sum(~np.isnan(matrix), axis=1)
+                error = np.where(present > 1, np.nanstd(matrix, axis=1, ddof=1) / np.sqrt(np.maximum(present, 1)), np.nan)
+        bounds[f"{column}_low"] = estimate - z * error
+        bounds[f"{column}_high"] = estimate + z * error
+    return estimates, bounds, scaled
@@ -1,3 +1,8 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
@@ -5,6 +10,8 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from pydantic import BaseModel
 
+from config import AUTH_HASH_WORKERS, AUTH_PRINCIPAL_CACHE_SIZE, AUTH_PRINCIPAL_TTL
+
 # --- Configuration ---
 # These should be in your config.py and loaded from environment variables in a real app
 SECRET_KEY = "your-super-secret-key-that-is-long-and-random"
@@ -13,6 +20,8 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 # Password hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt gets its own bounded threads, so a burst of logins cannot take every worker of the app
+_password_executor = ThreadPoolExecutor(max_workers=AUTH_HASH_WORKERS, thread_name_prefix="bcrypt")
 
 
 # --- Pydantic Models ---
@@ -30,6 +39,18 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the password threads, without blocking the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _password_executor, verify_password, plain_password, hashed_password
+    )
+
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash on the password threads, without blocking the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(_password_executor, get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Creates a new JWT access token."""
     to_encode = data.copy()
@@ -43,22 +64,88 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlmodel import Session, select
+from sqlalchemy import event
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 # This needs to be imported to avoid circular import errors with main.py
-from database.db import get_session 
+from database.db import get_async_session
 from database.models import User
 
 # This tells FastAPI where to look for the token
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token")
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)
+class PrincipalCache:
+    """
+    The users behind token subjects, reused for `ttl` seconds so that
+    authenticated requests do not each read the user table. A user's entries
+    are dropped as soon as the ORM updates or deletes them in this process
+    (other processes see the change once their entry expires); the least
+    recently used go first beyond `max_entries`. Cached users are shared
+    between requests, so they must not be modified.
+    """
+
+    def __init__(self, ttl: float = AUTH_PRINCIPAL_TTL, max_entries: int = AUTH_PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, subject: str) -> Optional[User]:
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                self._entries.pop(subject, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(subject)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, subject: str, user: User) -> User:
+        """Caches a detached copy of `user` and returns it."""
+        if self.ttl <= 0:
+            return user
+        copy = User.model_validate(user.model_dump())
+        with self._lock:
+            self._entries[subject] = (copy, time.monotonic())
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return copy
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for subject in [subject for subject, (user, _) in self._entries.items() if user.id == user_id]:
+                del self._entries[subject]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+principal_cache = PrincipalCache()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target: User):
+    principal_cache.invalidate_user(target.id)
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_async_session)
 ) -> User:
     """
     Dependency to get the current user from a JWT token.
-    Decodes the token, validates the user, and fetches them from the database.
+    Decodes the token, validates the user, and fetches them from the database,
+    or from the principal cache if they were fetched in the last few seconds.
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -74,7 +161,10 @@ def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    user = session.exec(select(User).where(User.username == token_data.username)).first()
+    user = principal_cache.get(token_data.username)
+    if user is not None:
+        return user
+    user = (await session.exec(select(User).where(User.username == token_data.username))).first()
     if user is None:
         raise credentials_exception
-    return user
+    return principal_cache.put(token_data.username, user)
@@ -0,0 +1,80 @@
+"""
+Measures what authentication adds to a request: the latency of GET
+/api/users/me (which does nothing but authenticate) and the database
+statements it runs, with the principal cache off and on.
+
+    cd backend && python -m benchmarks.auth_overhead [requests]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import auth
+from main import app, get_async_session, get_session
+
+
+def measure(client: TestClient, headers: dict, requests: int, statements: list) -> dict:
+    latencies = []
+    before = len(statements)
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = client.get("/api/users/me", headers=headers)
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.text
+    latencies.sort()
+    return {
+        "mean_ms": statistics.fmean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+        "queries_per_request": (len(statements) - before) / requests,
+    }
+
+
+def main(requests: int = 2000):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    sessions = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+    SQLModel.metadata.create_all(engine)
+    statements = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    def sync_session():
+        with Session(engine) as session:
+            yield session
+
+    async def async_session():
+        async with sessions() as session:
+            yield session
+
+    app.dependency_overrides[get_session] = sync_session
+    app.dependency_overrides[get_async_session] = async_session
+    client = TestClient(app)
+    client.post("/api/users/", json={"username": "bench", "email": "bench@example.com", "password": "bench"})
+    token = client.post("/api/token", data={"username": "bench", "password": "bench"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    ttl = auth.principal_cache.ttl
+    print(f"{requests} authenticated requests per run")
+    for label, cache_ttl in [("no principal cache", 0), (f"principal cache (ttl {ttl:g}s)", ttl or 30)]:
+        auth.principal_cache.clear()
+        auth.principal_cache.ttl = cache_ttl
+        measure(client, headers, min(requests, 100), statements)  # Warm up
+        result = measure(client, headers, requests, statements)
+        print(
+            f"{label:<28} mean {result['mean_ms']:.3f} ms  p50 {result['p50_ms']:.3f} ms  "
+            f"p99 {result['p99_ms']:.3f} ms  {result['queries_per_request']:.2f} queries/request"
+        )
+    auth.principal_cache.ttl = ttl
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
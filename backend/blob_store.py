@@ -0,0 +1,122 @@
+import hashlib
+import os
+import tempfile
+import time
+from typing import BinaryIO, Tuple
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from config import INGEST_CHUNK_BYTES, UPLOAD_DIRECTORY
+from database.models import Blob, DatasetProfile
+
+# Samples younger than this may belong to a profile that is still being written
+SAMPLE_GRACE_SECONDS = 600
+
+
+def blob_path(content_hash: str) -> str:
+    """Where a blob lives; two levels of shards keep directories small."""
+    return os.path.join(UPLOAD_DIRECTORY, "blobs", content_hash[:2], content_hash[2:4], f"{content_hash}.csv")
+
+
+def store_upload(session: Session, source: BinaryIO, chunk_size: int = INGEST_CHUNK_BYTES) -> Tuple[Blob, bool]:
+    """
+    Streams an upload to a uniquely named temporary file while hashing it,
+    takes a reference to the blob with that content and, unless the file is
+    already at its content address, moves it there. Returns (blob, created).
+    Identical content is still streamed to disk once; only the copy is dropped.
+
+    The blob's row stays locked until the caller commits, and
+    collect_garbage() only deletes files while it holds that lock on a row
+    it has re-checked, so a file found here cannot disappear before then.
+    """
+    tmp_dir = os.path.join(UPLOAD_DIRECTORY, "blobs", "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                buffer.write(chunk)
+                size += len(chunk)
+        content_hash = digest.hexdigest()
+        path = blob_path(content_hash)
+        blob = acquire_blob(session, content_hash, path, size)
+        created = not os.path.exists(blob.file_path)
+        if created:
+            os.makedirs(os.path.dirname(blob.file_path), exist_ok=True)
+            os.replace(tmp_path, blob.file_path)
+        return blob, created
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def acquire_blob(session: Session, content_hash: str, file_path: str, size: int) -> Blob:
+    """
+    Adds a reference to a blob, registering it on first use. The counter is
+    updated in the database rather than read and written back, so concurrent
+    uploads of the same content neither lose a reference nor fail on the
+    duplicate key. The caller commits.
+    """
+    increment = update(Blob).where(Blob.content_hash == content_hash).values(ref_count=Blob.ref_count + 1)
+    if session.exec(increment).rowcount == 0:
+        try:
+            with session.begin_nested():
+                session.add(Blob(content_hash=content_hash, file_path=file_path, size=size, ref_count=1))
+        except IntegrityError:
+            # Another upload registered it first; this one is a reference like any other
+            session.exec(increment)
+    return session.get(Blob, content_hash, populate_existing=True)
+
+
+def release_blob(session: Session, content_hash: str):
+    """Drops a reference; unreferenced blobs are removed by collect_garbage(). The caller commits."""
+    session.exec(
+        update(Blob).where(Blob.content_hash == content_hash, Blob.ref_count > 0).values(ref_count=Blob.ref_count - 1)
+    )
+
+
+def collect_garbage(engine) -> int:
+    """Deletes the files and rows of blobs no dataset refers to. Returns how many were removed."""
+    removed = 0
+    with Session(engine) as session:
+        for content_hash in session.exec(select(Blob.content_hash).where(Blob.ref_count <= 0)).all():
+            unreferenced = (Blob.content_hash == content_hash, Blob.ref_count <= 0)
+            # Re-checked under the row lock: an upload may have taken a reference since
+            blob = session.exec(select(Blob).where(*unreferenced).with_for_update()).first()
+            if blob is None or session.exec(delete(Blob).where(*unreferenced)).rowcount == 0:
+                session.rollback()
+                continue
+            # The files go before the commit releases the lock, so an upload of the same
+            # content waits for them to be gone and then stores the file afresh.
+            for path in (blob.file_path, blob.parquet_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            session.commit()
+            removed += 1
+        removed += _collect_samples(session)
+    if removed:
+        print(f"Removed {removed} unreferenced upload blob(s) and sample(s)")
+    return removed
+
+
+def _collect_samples(session: Session) -> int:
+    """Deletes row samples no dataset profile points at any more."""
+    directory = os.path.join(UPLOAD_DIRECTORY, "samples")
+    if not os.path.isdir(directory):
+        return 0
+    referenced = set(session.exec(select(DatasetProfile.sample_path)).all())
+    removed = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if path not in referenced and time.time() - os.path.getmtime(path) > SAMPLE_GRACE_SECONDS:
+            os.remove(path)
+            removed += 1
+    return removed
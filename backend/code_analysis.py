@@ -0,0 +1,219 @@
+import ast
+import re
+from typing import Dict, List, Optional
+
+from database.models import QueryLanguage
+
+# A projection plan maps each table the code needs to the columns to load, or
+# to None when the whole table has to be loaded. Tables left out are not used.
+ProjectionPlan = Dict[str, Optional[List[str]]]
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+# Frame methods whose result keeps the rows' columns as they are, so a column
+# selection later in the chain still decides which columns matter.
+_ROW_METHODS = {
+    "copy", "head", "tail", "sort_values", "sort_index", "nlargest", "nsmallest", "query",
+    "reset_index", "set_index", "fillna", "astype", "rename", "merge", "join",
+}
+# Methods that compare whole rows; only safe when told which columns to use.
+_SUBSET_METHODS = {"dropna", "drop_duplicates", "duplicated"}
+# The variable holding the query's answer; everything assigned to it is kept.
+RESULT_VARIABLE = "ans_df"
+# Anything that can reach a frame without naming it makes the analysis unsafe.
+_DYNAMIC_NAMES = {"globals", "locals", "vars", "eval", "exec", "getattr", "__import__"}
+
+
+def _full_plan(schemas: dict) -> ProjectionPlan:
+    return {table: None for table in schemas}
+
+
+def _is_column_selector(node: ast.AST) -> bool:
+    """`'col'` or `['a', 'b']`, as used in `df['col']` or `df[['a', 'b']]`."""
+    if isinstance(node, ast.Constant):
+        return isinstance(node.value, str)
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return all(isinstance(elt, ast.Constant) and isinstance(elt.value, str) for elt in node.elts)
+    return False
+
+
+def _is_merge(node: ast.AST) -> bool:
+    """`pd.merge(a, b)` or `a.merge(b)`: the result keeps the columns of both frames."""
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in ("merge", "join")
+
+
+class _FrameUses:
+    """Walks the expression chain around each use of a DataFrame variable."""
+
+    def __init__(self, tree: ast.AST):
+        self.parents = {}
+        for node in ast.walk(tree):
+            for child in ast.iter_child_nodes(node):
+                self.parents[child] = node
+
+    def _after_groupby(self, node: ast.AST):
+        """A groupby is safe when it goes on to select or name the columns it aggregates."""
+        parent = self.parents.get(node)
+        if isinstance(parent, ast.Subscript) and parent.value is node:
+            return _is_column_selector(parent.slice)
+        if isinstance(parent, ast.Attribute) and parent.value is node:
+            call = self.parents.get(parent)
+            if parent.attr == "size":
+                return True
+            if parent.attr in ("agg", "aggregate") and isinstance(call, ast.Call) and call.func is parent:
+                if call.args:
+                    return len(call.args) == 1 and isinstance(call.args[0], ast.Dict) and not call.keywords
+                return bool(call.keywords) and all(isinstance(kw.value, ast.Tuple) for kw in call.keywords)
+        return False
+
+    def classify(self, name_node: ast.Name):
+        """
+        Returns True if this use only needs the columns the code names, the
+        Name of a new variable if the frame is assigned on unchanged (an alias
+        to follow), or False if the use may need every column.
+        """
+        node = name_node
+        while True:
+            parent = self.parents.get(node)
+            if isinstance(parent, ast.Subscript) and parent.value is node:
+                if isinstance(parent.ctx, (ast.Store, ast.Del)):
+                    return True  # Creating or deleting a column
+                if _is_column_selector(parent.slice):
+                    return True
+                node = parent  # A row filter such as df[df['x'] > 1]
+                continue
+            if isinstance(parent, ast.Attribute) and parent.value is node:
+                grandparent = self.parents.get(parent)
+                called = isinstance(grandparent, ast.Call) and grandparent.func is parent
+                if isinstance(parent.ctx, ast.Store):
+                    return parent.attr != "columns"
+                if parent.attr in ("loc", "iloc") and isinstance(grandparent, ast.Subscript):
+                    if isinstance(grandparent.ctx, (ast.Store, ast.Del)):
+                        return True
+                    if isinstance(grandparent.slice, ast.Tuple):
+                        return parent.attr == "loc" and _is_column_selector(grandparent.slice.elts[-1])
+                    node = grandparent
+                    continue
+                if not called:
+                    # df.col selects a column; df.shape, df.values and friends need them all
+                    return parent.attr not in ("shape", "size", "ndim", "values", "columns", "dtypes", "T", "axes")
+                if parent.attr in _ROW_METHODS:
+                    node = grandparent
+                    continue
+                if parent.attr in _SUBSET_METHODS and any(kw.arg == "subset" for kw in grandparent.keywords):
+                    node = grandparent
+                    continue
+                if parent.attr == "groupby":
+                    return self._after_groupby(grandparent)
+                if parent.attr == "pivot_table":
+                    return any(kw.arg == "values" for kw in grandparent.keywords)
+                return False
+            if isinstance(parent, ast.Call) and node is not parent.func:
+                if isinstance(parent.func, ast.Name) and parent.func.id == "len":
+                    return True
+                if _is_merge(parent):
+                    node = parent
+                    continue
+                return False
+            if isinstance(parent, ast.Assign) and len(parent.targets) == 1 and isinstance(parent.targets[0], ast.Name):
+                if parent.targets[0].id == RESULT_VARIABLE:
+                    return False
+                return parent.targets[0]  # The same, filtered or merged frame under a new name
+            return False
+
+
+def _string_tokens(tree: ast.AST) -> set:
+    """Every string literal, attribute name and identifier inside a string in the code."""
+    tokens = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            tokens.add(node.value)
+            tokens.update(_IDENTIFIER.findall(node.value))
+        elif isinstance(node, ast.Attribute):
+            tokens.add(node.attr)
+        elif isinstance(node, ast.keyword) and node.arg:
+            tokens.add(node.arg)
+    return tokens
+
+
+def _python_plan(code: str, schemas: dict) -> ProjectionPlan:
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return _full_plan(schemas)
+    names = [node for node in ast.walk(tree) if isinstance(node, ast.Name)]
+    if any(node.id in _DYNAMIC_NAMES for node in names):
+        return _full_plan(schemas)
+
+    uses = _FrameUses(tree)
+    # Which tables each variable may hold: the loaded frames, then their aliases
+    holders = {f"{table}_df": {table} for table in schemas}
+    full = set()
+    used = set()
+    changed = True
+    while changed:
+        changed = False
+        for node in names:
+            tables = holders.get(node.id)
+            if not tables or not isinstance(node.ctx, ast.Load):
+                continue
+            used |= tables
+            verdict = uses.classify(node)
+            if verdict is False and not tables <= full:
+                full |= tables
+                changed = True
+            elif isinstance(verdict, ast.Name) and not tables <= holders.get(verdict.id, set()):
+                holders.setdefault(verdict.id, set()).update(tables)
+                changed = True
+
+    tokens = _string_tokens(tree)
+    return {
+        table: None if table in full else [col for col in schemas[table] if col in tokens]
+        for table in schemas if table in used
+    }
+
+
+_SQL_STRING = re.compile(r"'(?:[^']|'')*'")
+_SQL_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_SQL_QUOTED_IDENTIFIER = re.compile(r'"([^"]*)"|`([^`]*)`|\[([^\]]*)\]')
+_SQL_COUNT_STAR = re.compile(r"count\s*\(\s*\*\s*\)", re.I)
+
+
+def _sql_plan(code: str, schemas: dict) -> ProjectionPlan:
+    text = _SQL_COMMENT.sub(" ", _SQL_STRING.sub(" ", code))
+    words = {
+        next(group for group in match.groups() if group is not None).lower()
+        for match in _SQL_QUOTED_IDENTIFIER.finditer(text)
+    }
+    text = _SQL_QUOTED_IDENTIFIER.sub(" ", text)
+    words |= {word.lower() for word in _IDENTIFIER.findall(text)}
+    used = [table for table in schemas if table.lower() in words]
+    # `*` outside count(*) selects every column of the tables in the query
+    star = "*" in _SQL_COUNT_STAR.sub(" ", text)
+    return {
+        table: None if star else [col for col in schemas[table] if col.lower() in words]
+        for table in used
+    }
+
+
+def merge_plans(first: ProjectionPlan, second: ProjectionPlan) -> ProjectionPlan:
+    """A plan that loads everything either plan loads."""
+    merged = dict(first)
+    for table, columns in second.items():
+        if table not in merged:
+            merged[table] = columns
+        elif merged[table] is not None:
+            merged[table] = None if columns is None else merged[table] + [c for c in columns if c not in merged[table]]
+    return merged
+
+
+def projection_plan(code: str, language: QueryLanguage, schemas: dict) -> ProjectionPlan:
+    """
+    Works out which tables and columns `code` reads. `schemas` maps each
+    table_name to its column names. The analysis is conservative: a use it
+    cannot follow loads the whole table, and a column counts as read if its
+    name appears anywhere in the code.
+    """
+    if language == QueryLanguage.sql:
+        return _sql_plan(code, schemas)
+    return _python_plan(code, schemas)
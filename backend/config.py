@@ -8,4 +8,171 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 OLLAMA_API_BASE = os.getenv("OLLAMA_API_BASE")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+# Provider endpoints can be pointed at a proxy or a local stub server
+OPENROUTER_API_BASE = os.getenv("OPENROUTER_API_BASE", "https://openrouter.ai/api/v1")
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE")
 
+
+# --- Database ---
+# Connection pool of each database engine (ignored for SQLite); statements are only logged with DB_ECHO
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Seconds after which a connection is replaced; pre-ping checks a connection before handing it out
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+
+# --- Authentication ---
+# Seconds a token's user is reused without reading it from the database again; 0 turns the cache off
+AUTH_PRINCIPAL_TTL = float(os.getenv("AUTH_PRINCIPAL_TTL", "30"))
+AUTH_PRINCIPAL_CACHE_SIZE = int(os.getenv("AUTH_PRINCIPAL_CACHE_SIZE", "10000"))
+# Threads hashing and checking passwords; bcrypt is slow on purpose, so logins queue for them
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# --- Listings ---
+# Users and projects served per page by the listing endpoints
+LIST_PAGE_DEFAULT_ITEMS = int(os.getenv("LIST_PAGE_DEFAULT_ITEMS", "100"))
+LIST_PAGE_MAX_ITEMS = int(os.getenv("LIST_PAGE_MAX_ITEMS", "1000"))
+
+# --- Kernel Pool ---
+KERNEL_POOL_MIN_SIZE = int(os.getenv("KERNEL_POOL_MIN_SIZE", "2"))
+KERNEL_POOL_MAX_SIZE = int(os.getenv("KERNEL_POOL_MAX_SIZE", "8"))
+# A kernel is retired after this many leases or once it uses more memory
+KERNEL_MAX_EXECUTIONS = int(os.getenv("KERNEL_MAX_EXECUTIONS", "50"))
+KERNEL_MAX_MEMORY_MB = float(os.getenv("KERNEL_MAX_MEMORY_MB", "2048"))
+KERNEL_HEALTH_CHECK_INTERVAL = float(os.getenv("KERNEL_HEALTH_CHECK_INTERVAL", "10"))
+# How long a request waits for a free kernel before giving up
+KERNEL_LEASE_TIMEOUT = float(os.getenv("KERNEL_LEASE_TIMEOUT", "60"))
+
+# --- Per-project Kernel Sessions ---
+# When enabled, each project keeps a long-lived kernel with its DataFrames loaded
+KERNEL_SESSION_MODE = os.getenv("KERNEL_SESSION_MODE", "false").lower() == "true"
+KERNEL_SESSION_MAX = int(os.getenv("KERNEL_SESSION_MAX", "16"))
+KERNEL_SESSION_MEMORY_BUDGET_MB = float(os.getenv("KERNEL_SESSION_MEMORY_BUDGET_MB", "8192"))
+KERNEL_SESSION_IDLE_TIMEOUT = float(os.getenv("KERNEL_SESSION_IDLE_TIMEOUT", "1800"))
+
+# --- Execution Scheduler ---
+# Executions beyond the concurrency cap wait in per-user queues
+EXECUTION_MAX_CONCURRENCY = int(os.getenv("EXECUTION_MAX_CONCURRENCY", str(KERNEL_POOL_MAX_SIZE)))
+EXECUTION_QUEUE_SIZE = int(os.getenv("EXECUTION_QUEUE_SIZE", "64"))
+EXECUTION_QUEUE_PER_USER = int(os.getenv("EXECUTION_QUEUE_PER_USER", "8"))
+
+# --- Execution Limits ---
+# Hitting any of these interrupts the kernel; 0 disables a limit
+EXECUTION_TIMEOUT = float(os.getenv("EXECUTION_TIMEOUT", "300"))
+EXECUTION_CPU_LIMIT = float(os.getenv("EXECUTION_CPU_LIMIT", "600"))
+EXECUTION_MEMORY_LIMIT_MB = float(os.getenv("EXECUTION_MEMORY_LIMIT_MB", "4096"))
+
+# --- Query Results ---
+# Kernels write results here as Arrow files; point it at /dev/shm to keep them in memory
+RESULT_DIRECTORY = os.getenv("RESULT_DIRECTORY", "/app/results")
+# Responses embed the first RESULT_PAGE_DEFAULT_ROWS rows of a result; the rest is fetched
+# via /api/results/{id}/rows. A request may ask for up to this many rows inline (inline_rows).
+RESULT_INLINE_MAX_ROWS = int(os.getenv("RESULT_INLINE_MAX_ROWS", "50000"))
+# Results are deleted this many seconds after they were computed; 0 keeps them
+RESULT_TTL = float(os.getenv("RESULT_TTL", "86400"))
+RESULT_SWEEP_INTERVAL = float(os.getenv("RESULT_SWEEP_INTERVAL", "600"))
+# Pages served by /api/results/{id}/rows
+RESULT_PAGE_DEFAULT_ROWS = int(os.getenv("RESULT_PAGE_DEFAULT_ROWS", "100"))
+RESULT_PAGE_MAX_ROWS = int(os.getenv("RESULT_PAGE_MAX_ROWS", "10000"))
+# Sorted/filtered row orders kept in memory so paging through them does not redo the work
+RESULT_VIEW_CACHE_SIZE = int(os.getenv("RESULT_VIEW_CACHE_SIZE", "32"))
+
+# --- Visualization ---
+# Results are reduced before plotting: LTTB for lines, binning for scatter
+# plots and histograms, the top categories plus "Other" for bar and pie charts
+VISUALIZE_MAX_POINTS = int(os.getenv("VISUALIZE_MAX_POINTS", "5000"))
+VISUALIZE_BINS = int(os.getenv("VISUALIZE_BINS", "100"))
+VISUALIZE_TOP_N = int(os.getenv("VISUALIZE_TOP_N", "25"))
+
+# --- Dataset Ingestion ---
+UPLOAD_DIRECTORY = os.getenv("UPLOAD_DIRECTORY", "/app/uploads")
+# Uploads are streamed to disk and converted to Parquet in blocks of this size
+INGEST_CHUNK_BYTES = int(os.getenv("INGEST_CHUNK_BYTES", str(1 << 20)))
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+
+# --- Dataset Profiling ---
+# Column statistics are computed in the background over batches of this many rows
+PROFILE_BATCH_ROWS = int(os.getenv("PROFILE_BATCH_ROWS", "100000"))
+PROFILE_TOP_K = int(os.getenv("PROFILE_TOP_K", "10"))
+PROFILE_SAMPLE_SIZE = int(os.getenv("PROFILE_SAMPLE_SIZE", "5"))
+
+# --- SQL Engine ---
+# Engine for language=sql queries: "duckdb" (falls back to pandasql on failure) or "pandasql"
+SQL_ENGINE = os.getenv("SQL_ENGINE", "duckdb")
+# Threads DuckDB may use per query; 0 uses every core
+DUCKDB_THREADS = int(os.getenv("DUCKDB_THREADS", "0"))
+
+# --- Query Result Cache ---
+# Where cached results are indexed: "memory", "disk", "redis" or "none"
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "memory")
+# Total size of the result files the cache keeps on disk; least recently used go first
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(1 << 30)))
+# Seconds an entry stays valid; 0 keeps entries until they are evicted
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "0"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# --- Approximate Queries ---
+# Rows of the uniform sample kept per dataset for approximate answers
+APPROXIMATE_SAMPLE_ROWS = int(os.getenv("APPROXIMATE_SAMPLE_ROWS", "100000"))
+# Disjoint sub-samples each estimate is recomputed on to derive its error bounds
+APPROXIMATE_REPLICATES = int(os.getenv("APPROXIMATE_REPLICATES", "10"))
+APPROXIMATE_CONFIDENCE = float(os.getenv("APPROXIMATE_CONFIDENCE", "0.95"))
+# Fractions of the data (random Parquet row groups) read between the sample and the exact answer
+APPROXIMATE_REFINE_FRACTIONS = [
+    float(f) for f in os.getenv("APPROXIMATE_REFINE_FRACTIONS", "0.1").split(",") if f.strip()
+]
+
+# --- Generated Code Cache ---
+# Code generated for a question is reused for the same question (or a trivial
+# rewording of it) over the same schema with the same model
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(UPLOAD_DIRECTORY, "llm_cache.db"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+# Seconds generated code is reused for; 0 keeps it until it is evicted
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 86400)))
+# How alike (0-1) a rewording must be to reuse the code of a cached question
+LLM_CACHE_SIMILARITY = float(os.getenv("LLM_CACHE_SIMILARITY", "0.8"))
+
+# --- LLM Providers ---
+# Seconds to wait for one response from each provider
+LLM_TIMEOUTS = {
+    "gemini": float(os.getenv("GEMINI_TIMEOUT", "60")),
+    "ollama": float(os.getenv("OLLAMA_TIMEOUT", "120")),
+    "openrouter": float(os.getenv("OPENROUTER_TIMEOUT", "60")),
+}
+# Transient failures are retried with exponential backoff and full jitter
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+# A provider failing this many attempts in a row is skipped for LLM_BREAKER_RESET seconds
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+# If set, a provider that has not answered within LLM_HEDGE_DELAY seconds is
+# raced against this provider and model, and the first answer is used
+LLM_HEDGE_PROVIDER = os.getenv("LLM_HEDGE_PROVIDER")
+LLM_HEDGE_MODEL = os.getenv("LLM_HEDGE_MODEL")
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "10"))
+# Requests per minute each provider is sent, with bursts of up to LLM_RATE_BURST; 0 means no limit
+LLM_RATE_LIMITS = {
+    "gemini": float(os.getenv("GEMINI_RATE_LIMIT", "60")),
+    "ollama": float(os.getenv("OLLAMA_RATE_LIMIT", "0")),
+    "openrouter": float(os.getenv("OPENROUTER_RATE_LIMIT", "60")),
+}
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", "5"))
+
+# --- Prompt Schema Selection ---
+# Prompts for projects whose full schema would exceed this many tokens only
+# describe the tables and columns most relevant to the question
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+SCHEMA_TOP_TABLES = int(os.getenv("SCHEMA_TOP_TABLES", "5"))
+SCHEMA_TOP_COLUMNS = int(os.getenv("SCHEMA_TOP_COLUMNS", "40"))
+
+# --- Batch Queries ---
+# Questions accepted in one /query-batch request
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", "100"))
+# Questions of a batch whose code is generated at the same time
+QUERY_BATCH_LLM_CONCURRENCY = int(os.getenv("QUERY_BATCH_LLM_CONCURRENCY", "8"))
+# Aggregations of a batch run at the same time in pooled kernels (a session runs one at a time)
+QUERY_BATCH_EXECUTIONS = int(os.getenv("QUERY_BATCH_EXECUTIONS", str(min(4, EXECUTION_QUEUE_PER_USER))))
@@ -1,7 +1,102 @@
-from sqlmodel import Session
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-# The engine will be created and managed entirely by main.py
+from config import DB_ECHO, DB_MAX_OVERFLOW, DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_POOL_SIZE, DB_POOL_TIMEOUT
+
+# The engines will be created and managed entirely by main.py
 engine = None
+async_engine = None
+async_session_maker = None
+
+# Async drivers used in place of each sync driver
+_ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def async_url(url: str) -> str:
+    """The same database as `url`, through its async driver (asyncpg or aiosqlite)."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend} databases")
+    return parsed.set(drivername=f"{backend}+{_ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+def engine_options(url: str) -> dict:
+    """Pool settings from the config; SQLite keeps its own pool and only needs cross-thread use allowed."""
+    options = {"echo": DB_ECHO, "pool_pre_ping": DB_POOL_PRE_PING}
+    if make_url(url).get_backend_name() == "sqlite":
+        return {**options, "connect_args": {"check_same_thread": False}}
+    return {
+        **options, "pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT, "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+
+def create_engines(url: str):
+    """
+    Creates the sync engine (used off the event loop, by uploads and
+    background jobs) and the async engine the endpoints use, both for `url`.
+    """
+    global engine, async_engine, async_session_maker
+    engine = create_engine(url, **engine_options(url))
+    async_engine = create_async_engine(async_url(url), **engine_options(url))
+    async_session_maker = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+    return engine, async_engine
+
+
+def add_missing_columns(engine) -> list:
+    """
+    Adds the columns declared on the models that tables created before them
+    lack (create_all only creates missing tables). Such columns must be
+    nullable: rows that already exist get NULL. Returns the columns added.
+    """
+    existing_tables = set(inspect(engine).get_table_names())
+    added = []
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable:
+                    raise RuntimeError(f"Cannot add the non-nullable column {table.name}.{column.name} to existing rows")
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def create_indexes(engine):
+    """Adds the indexes declared on the models that tables created before them lack."""
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+
+def upgrade_schema(engine):
+    """
+    Brings a database created by an older version up to the models: new
+    tables, then new columns on existing tables, then new indexes. Safe to
+    run on every startup.
+    """
+    SQLModel.metadata.create_all(engine)
+    added = add_missing_columns(engine)
+    if added:
+        print(f"Added columns to existing tables: {', '.join(added)}")
+    create_indexes(engine)
+
+
+async def dispose_engines():
+    if async_engine is not None:
+        await async_engine.dispose()
+    if engine is not None:
+        engine.dispose()
+
 
 def get_session():
     """
@@ -9,4 +104,13 @@ def get_session():
     It relies on the 'engine' being set by the main app's lifespan.
     """
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+async def get_async_session():
+    """
+    Dependency yielding an async session for each request. Objects stay
+    loaded after a commit, so relationships must be loaded eagerly up front.
+    """
+    async with async_session_maker() as session:
+        yield session
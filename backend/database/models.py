@@ -1,8 +1,14 @@
+from datetime import datetime, timezone
 from typing import List, Optional
 from enum import Enum
+from sqlalchemy import DateTime, Index
 from sqlmodel import Field, Relationship, SQLModel
 
 
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
 class User(SQLModel, table=True):
     """Represents the User table in the database."""
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -15,9 +21,14 @@ class User(SQLModel, table=True):
 
 class Project(SQLModel, table=True):
     """Represents the Project table."""
+    # A user's projects are listed page by page in id order
+    __table_args__ = (Index("ix_project_owner_id_id", "owner_id", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(index=True)
     description: Optional[str] = None
+    # Set whenever the project or its list of datasets changes; drives ETag and Last-Modified
+    updated_at: Optional[datetime] = Field(default_factory=utc_now, sa_type=DateTime(timezone=True))
 
     owner_id: int = Field(foreign_key="user.id")
     owner: User = Relationship(back_populates="projects")
@@ -27,15 +38,101 @@ class Project(SQLModel, table=True):
 
 class Dataset(SQLModel, table=True):
     """Represents the Dataset table."""
+    __table_args__ = (Index("ix_dataset_project_id_id", "project_id", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     file_name: str
     file_path: str
     description: Optional[str] = None
     table_name: str = Field(index=True) 
+    # Columnar copy written at upload time; None if the CSV could not be converted
+    parquet_path: Optional[str] = None
+    # The stored upload this dataset points at; None for datasets uploaded before deduplication
+    content_hash: Optional[str] = Field(default=None, index=True)
 
     project_id: int = Field(foreign_key="project.id")
     project: Project = Relationship(back_populates="datasets")
 
+    columns: List["DatasetColumn"] = Relationship(
+        back_populates="dataset", sa_relationship_kwargs={"cascade": "all, delete-orphan"}
+    )
+    profile: Optional["DatasetProfile"] = Relationship(
+        back_populates="dataset", sa_relationship_kwargs={"uselist": False, "cascade": "all, delete-orphan"}
+    )
+    segments: List["DatasetSegment"] = Relationship(
+        back_populates="dataset",
+        sa_relationship_kwargs={"cascade": "all, delete-orphan", "order_by": "DatasetSegment.position"},
+    )
+    aggregations: List["SavedAggregation"] = Relationship(
+        back_populates="dataset", sa_relationship_kwargs={"cascade": "all, delete-orphan"}
+    )
+
+
+class Blob(SQLModel, table=True):
+    """An uploaded file stored once under its SHA-256, shared by every dataset with that content."""
+    content_hash: str = Field(primary_key=True)
+    file_path: str
+    parquet_path: Optional[str] = None
+    size: int
+    ref_count: int = 0
+
+
+class DatasetColumn(SQLModel, table=True):
+    """The schema of a dataset, one row per column, recorded at upload time."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    position: int
+    name: str
+    dtype: str
+
+    dataset_id: int = Field(foreign_key="dataset.id", index=True)
+    dataset: Dataset = Relationship(back_populates="columns")
+
+
+class DatasetProfile(SQLModel, table=True):
+    """Column statistics computed in the background after an upload."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    status: str = "pending"  # pending, ready or failed
+    profile_json: Optional[str] = None
+    error: Optional[str] = None
+    # Uniform random sample of the rows, used for approximate queries
+    sample_path: Optional[str] = None
+
+    dataset_id: int = Field(foreign_key="dataset.id", unique=True)
+    dataset: Dataset = Relationship(back_populates="profile")
+
+
+class DatasetSegment(SQLModel, table=True):
+    """Rows appended to a dataset after its upload, stored as their own Parquet file."""
+    # A unique index rather than a constraint, so that upgrade_schema adds it to existing tables too
+    __table_args__ = (Index("ux_datasetsegment_dataset_id_position", "dataset_id", "position", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    position: int  # 1 for the first append; the uploaded file is position 0
+    file_path: str
+    row_count: int
+
+    dataset_id: int = Field(foreign_key="dataset.id", index=True)
+    dataset: Dataset = Relationship(back_populates="segments")
+
+
+class SavedAggregation(SQLModel, table=True):
+    """
+    A group-by aggregation kept up to date as rows are appended. Its partial
+    state (sums, counts, minima, maxima per group) lives in a Parquet file.
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str
+    group_by_json: str
+    aggregates_json: str
+    state_path: Optional[str] = None
+    # The last segment position folded into the state; None before the first build
+    applied_position: Optional[int] = None
+    status: str = "pending"  # pending, ready or failed
+    error: Optional[str] = None
+
+    dataset_id: int = Field(foreign_key="dataset.id", index=True)
+    dataset: Dataset = Relationship(back_populates="aggregations")
+
 
 class UserCreate(SQLModel):
     username: str
@@ -61,12 +158,26 @@ class QueryLanguage(str, Enum):
     python = "python"
     sql = "sql"
 
+class SqlEngine(str, Enum):
+    duckdb = "duckdb"
+    pandasql = "pandasql"
+
 class QueryRequest(SQLModel):
     """Data model for a user's natural language query."""
     question: str
     language: QueryLanguage = QueryLanguage.python
     provider: Optional[str] = "gemini"
     model: Optional[str] = "gemini-1.5-flash"
+    # Run in the project's persistent kernel session; None uses the server default
+    use_session: Optional[bool] = None
+    # Engine for SQL queries; None uses the server default
+    sql_engine: Optional[SqlEngine] = None
+    # Stream estimates from a sample first, refine them, then send the exact answer
+    approximate: bool = False
+    # Ask the provider even if code for this question is cached
+    bypass_llm_cache: bool = False
+    # Result rows to embed as datatable_json; None embeds the first page (see RESULT_INLINE_MAX_ROWS)
+    inline_rows: Optional[int] = None
 
 class DatasetRead(SQLModel):
     id: int
@@ -82,13 +193,32 @@ class CodeExecutionRequest(SQLModel):
     language: QueryLanguage
     provider: Optional[str] = "gemini"
     model: Optional[str] = "gemini-1.5-flash"
+    use_session: Optional[bool] = None
+    sql_engine: Optional[SqlEngine] = None
+    # A result from an earlier run of the same aggregation code; only the chart is redrawn
+    result_id: Optional[str] = None
+    inline_rows: Optional[int] = None
+
+class AggregateSpec(SQLModel):
+    function: str  # sum, count, min, max or mean
+    # The column to aggregate; count without a column counts rows
+    column: Optional[str] = None
+    alias: Optional[str] = None
+
+class SavedAggregationCreate(SQLModel):
+    name: str
+    group_by: List[str] = []
+    aggregates: List[AggregateSpec]
 
 class VisualizationRequest(SQLModel):
     original_question: str
-    datatable_json: str
+    # A stored result to plot; datatable_json is only read if it is not given
+    result_id: Optional[str] = None
+    datatable_json: Optional[str] = None
     chart_type: str
     x_axis: str
     y_axis: str
     legend: Optional[str] = None
     provider: Optional[str] = "openrouter"
-    model: Optional[str] = "qwen/qwen3-coder:free"
\ No newline at end of file
+    model: Optional[str] = "qwen/qwen3-coder:free"
+    bypass_llm_cache: bool = False
\ No newline at end of file
@@ -0,0 +1,200 @@
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from config import VISUALIZE_BINS, VISUALIZE_MAX_POINTS, VISUALIZE_TOP_N
+
+OTHER_LABEL = "Other"
+
+
+def _numeric(values: pd.Series) -> Optional[np.ndarray]:
+    """Values as float64 for arithmetic (datetimes as nanoseconds), or None if they are not numbers."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.astype("int64").to_numpy(dtype=float)
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values.to_numpy(dtype=float, na_value=np.nan)
+    return None
+
+
+def _groups(df: pd.DataFrame, legend: Optional[str]):
+    if legend and legend in df:
+        yield from df.groupby(legend, sort=False, dropna=False)
+    else:
+        yield None, df
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: picks `threshold` points of a series
+    sorted by x that keep its visual shape. Returns their positions.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    picked = np.empty(threshold, dtype=int)
+    picked[0], picked[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # The next bucket's average is the third corner of the triangle
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        picked[bucket + 1] = previous
+    return picked
+
+
+def lttb_frame(df: pd.DataFrame, x: str, y: str, max_points: int, legend: Optional[str] = None) -> pd.DataFrame:
+    """Downsamples every line (one per legend value) to its share of `max_points` rows."""
+    groups = list(_groups(df, legend))
+    per_line = max(3, max_points // max(len(groups), 1))
+    parts = []
+    for _, group in groups:
+        group = group.sort_values(x, kind="stable")
+        xs, ys = _numeric(group[x]), _numeric(group[y])
+        if xs is None:
+            xs = np.arange(len(group), dtype=float)  # Categories: keep their order
+        valid = ~np.isnan(xs) & ~np.isnan(ys)
+        group, xs, ys = group[valid], xs[valid], ys[valid]
+        parts.append(group.iloc[lttb_indices(xs, ys, per_line)])
+    return pd.concat(parts, ignore_index=True) if parts else df.iloc[:0]
+
+
+def _bin_edges(values: np.ndarray, bins: int) -> np.ndarray:
+    finite = values[~np.isnan(values)]
+    low, high = (finite.min(), finite.max()) if len(finite) else (0.0, 1.0)
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    return np.linspace(low, high, bins + 1)
+
+
+def _centers(values: pd.Series, edges: np.ndarray, codes: np.ndarray) -> pd.Series:
+    centers = (edges[:-1] + edges[1:]) / 2
+    result = pd.Series(centers[codes])
+    if pd.api.types.is_datetime64_any_dtype(values):
+        result = pd.to_datetime(result.astype("int64"))
+    return result
+
+
+def _bin_codes(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    return np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+
+
+def bin_scatter(df: pd.DataFrame, x: str, y: str, bins: int, legend: Optional[str] = None) -> pd.DataFrame:
+    """
+    Bins the points on a `bins` x `bins` grid (per legend value). Each row of
+    the result is a non-empty cell at its center, with its point count.
+    """
+    xs, ys = _numeric(df[x]), _numeric(df[y])
+    valid = ~np.isnan(xs) & ~np.isnan(ys)
+    df, xs, ys = df[valid], xs[valid], ys[valid]
+    x_edges, y_edges = _bin_edges(xs, bins), _bin_edges(ys, bins)
+    cells = pd.DataFrame({"_x": _bin_codes(xs, x_edges), "_y": _bin_codes(ys, y_edges)})
+    keys = ["_x", "_y"]
+    if legend and legend in df:
+        cells[legend] = df[legend].to_numpy()
+        keys.append(legend)
+    counts = cells.groupby(keys, sort=True, dropna=False).size().reset_index(name="count")
+    result = pd.DataFrame({
+        x: _centers(df[x], x_edges, counts["_x"].to_numpy()),
+        y: _centers(df[y], y_edges, counts["_y"].to_numpy()),
+    })
+    if legend and legend in df:
+        result[legend] = counts[legend].to_numpy()
+    result["count"] = counts["count"].to_numpy()
+    return result
+
+
+def bin_histogram(df: pd.DataFrame, x: str, y: Optional[str], bins: int, legend: Optional[str] = None) -> tuple:
+    """
+    Pre-computes a histogram of `x` (per legend value): one row per bin at
+    its center, with the number of rows, or the sum of `y` if it is numeric.
+    Returns (frame, value_column).
+    """
+    xs = _numeric(df[x])
+    if xs is None:
+        return top_n(df, x, y, bins, legend)
+    weights = _numeric(df[y]) if y and y in df and y != x else None
+    value_column = y if weights is not None else "count"
+    valid = ~np.isnan(xs)
+    df, xs = df[valid], xs[valid]
+    edges = _bin_edges(xs, bins)
+    frame = pd.DataFrame({"_bin": _bin_codes(xs, edges), value_column: weights[valid] if weights is not None else 1})
+    keys = ["_bin"]
+    if legend and legend in df:
+        frame[legend] = df[legend].to_numpy()
+        keys.append(legend)
+    totals = frame.groupby(keys, sort=True, dropna=False)[value_column].sum().reset_index()
+    result = pd.DataFrame({x: _centers(df[x], edges, totals["_bin"].to_numpy())})
+    if legend and legend in df:
+        result[legend] = totals[legend].to_numpy()
+    result[value_column] = totals[value_column].to_numpy()
+    return result, value_column
+
+
+def top_n(df: pd.DataFrame, x: str, y: Optional[str], n: int, legend: Optional[str] = None) -> tuple:
+    """
+    Totals `y` (or counts rows) per `x` category and keeps the `n - 1`
+    largest, folding the rest into one "Other" category. Returns (frame, value_column).
+    """
+    numeric_y = y and y in df and y != x and _numeric(df[y]) is not None
+    value_column = y if numeric_y else "count"
+    keys = [x] + ([legend] if legend and legend in df and legend != x else [])
+    values = df[keys].copy()
+    values[value_column] = df[y] if numeric_y else 1
+    totals = values.groupby(keys, sort=False, dropna=False)[value_column].sum().reset_index()
+    ranking = totals.groupby(x, sort=False, dropna=False)[value_column].sum().sort_values(ascending=False)
+    if len(ranking) <= n:
+        return totals, value_column
+    kept = set(ranking.index[:n - 1])
+    labels = totals[x].where(totals[x].isin(kept), OTHER_LABEL)
+    totals[x] = labels.astype(object)
+    totals = totals.groupby(keys, sort=False, dropna=False)[value_column].sum().reset_index()
+    order = {label: i for i, label in enumerate([*ranking.index[:n - 1], OTHER_LABEL])}
+    return totals.sort_values(x, key=lambda s: s.map(order), kind="stable", ignore_index=True), value_column
+
+
+def reduce_for_chart(
+    df: pd.DataFrame, chart_type: str, x: str, y: Optional[str], legend: Optional[str] = None,
+    max_points: int = VISUALIZE_MAX_POINTS, bins: int = VISUALIZE_BINS, top: int = VISUALIZE_TOP_N,
+) -> tuple:
+    """
+    Shrinks a result to what a chart of `chart_type` can show. Returns
+    (frame, note); the note tells the chart code author how the data was
+    reduced, and is None if it was small enough to plot as it is.
+    """
+    chart_type = (chart_type or "").lower()
+    if chart_type in ("bar", "pie"):
+        if df[x].nunique(dropna=False) <= top:
+            return df, None
+        reduced, value_column = top_n(df, x, y, top, legend)
+        return reduced, (
+            f"ans_df keeps the {top - 1} largest '{x}' values by '{value_column}'; the rest are summed into one "
+            f"'{OTHER_LABEL}' row. Plot '{value_column}' as it is, without aggregating again."
+        )
+    if len(df) <= max_points:
+        return df, None
+    if chart_type == "line" and y in df and _numeric(df[y]) is not None:
+        return lttb_frame(df, x, y, max_points, legend), (
+            f"ans_df was downsampled to about {max_points} points with LTTB, keeping the shape of each line."
+        )
+    if chart_type == "scatter" and y in df and _numeric(df[x]) is not None and _numeric(df[y]) is not None:
+        return bin_scatter(df, x, y, bins, legend), (
+            f"ans_df was binned on a {bins}x{bins} grid: each row is the center of a cell and 'count' is the "
+            f"number of points in it. You may use size='count' or color='count'."
+        )
+    if chart_type == "histogram":
+        reduced, value_column = bin_histogram(df, x, y, bins, legend)
+        return reduced, (
+            f"ans_df is already a histogram: each row is one bin of '{x}' with its total in '{value_column}'. "
+            f"Draw it with px.bar(ans_df, x='{x}', y='{value_column}'), not px.histogram."
+        )
+    # Other charts: an evenly spaced subset of the rows
+    step = int(np.ceil(len(df) / max_points))
+    return df.iloc[::step].reset_index(drop=True), f"ans_df holds every {step}th row of the result."
@@ -0,0 +1,115 @@
+import os
+import re
+import tempfile
+from typing import List, Optional, Tuple, Union
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from config import INGEST_CHUNK_BYTES, PARQUET_COMPRESSION
+
+# pyarrow infers column types from the first block; a later value that does not
+# fit is reported like "In CSV column #3: CSV conversion error to int64: ..."
+_CONVERSION_ERROR = re.compile(r"CSV column #(\d+)")
+
+
+def parquet_path_for(file_path: str) -> str:
+    return os.path.splitext(file_path)[0] + ".parquet"
+
+
+def _write_parquet(csv_path: str, parquet_path: str, column_types: dict, block_size: int) -> pa.Schema:
+    reader = pa_csv.open_csv(
+        csv_path,
+        read_options=pa_csv.ReadOptions(block_size=block_size),
+        convert_options=pa_csv.ConvertOptions(column_types=column_types),
+    )
+    # A name of its own, so that two uploads converting the same file do not write into each other
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(parquet_path) or ".", suffix=".parquet.tmp")
+    os.close(fd)
+    try:
+        with pq.ParquetWriter(tmp_path, reader.schema, compression=PARQUET_COMPRESSION) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+        os.replace(tmp_path, parquet_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return reader.schema
+
+
+def convert_csv_to_parquet(
+    csv_path: str, parquet_path: str, block_size: int = INGEST_CHUNK_BYTES
+) -> pa.Schema:
+    """
+    Converts a CSV file to compressed Parquet one block at a time. When a
+    column's inferred type turns out to be wrong further down the file, the
+    conversion is retried with that column read as text.
+    """
+    column_types = {}
+    while True:
+        try:
+            return _write_parquet(csv_path, parquet_path, column_types, block_size)
+        except pa.ArrowInvalid as e:
+            match = _CONVERSION_ERROR.search(str(e))
+            if not match:
+                raise
+            names = pa_csv.open_csv(csv_path, read_options=pa_csv.ReadOptions(block_size=block_size)).schema.names
+            column = names[int(match.group(1))]
+            if column in column_types:
+                raise
+            column_types[column] = pa.string()
+
+
+def pandas_dtypes(schema: pa.Schema) -> List[Tuple[str, str]]:
+    """The (column, dtype) pairs pandas reports after reading a file with this schema."""
+    return [(str(name), str(dtype)) for name, dtype in schema.empty_table().to_pandas().dtypes.items()]
+
+
+def ingest_csv(csv_path: str) -> Tuple[Optional[str], List[Tuple[str, str]]]:
+    """
+    Writes a Parquet copy of an uploaded CSV and returns its path and the
+    column dtypes. Files pyarrow cannot parse keep working from the CSV:
+    the returned path is None and the columns are empty.
+    """
+    parquet_path = parquet_path_for(csv_path)
+    try:
+        schema = convert_csv_to_parquet(csv_path, parquet_path)
+    except (pa.ArrowInvalid, OSError) as e:
+        print(f"Could not convert {csv_path} to Parquet, keeping CSV: {e}")
+        return None, []
+    return parquet_path, pandas_dtypes(schema)
+
+
+def ingest_segment(csv_path: str, segment_path: str, schema: pa.Schema, block_size: int = INGEST_CHUNK_BYTES) -> int:
+    """
+    Converts rows appended to a dataset to Parquet with exactly the dataset's
+    `schema`, so every segment can be scanned together with the original.
+    Returns the number of rows; raises ValueError if they do not fit.
+    """
+    names = pa_csv.open_csv(csv_path, read_options=pa_csv.ReadOptions(block_size=block_size)).schema.names
+    if names != schema.names:
+        raise ValueError(f"Expected the columns {schema.names}, got {names}")
+    try:
+        _write_parquet(csv_path, segment_path, dict(zip(schema.names, schema.types)), block_size)
+    except pa.ArrowInvalid as e:
+        raise ValueError(f"Rows do not match the dataset schema: {e}")
+    return pq.ParquetFile(segment_path).metadata.num_rows
+
+
+def load_expression(file_path: Union[str, list], columns: Optional[list] = None) -> str:
+    """
+    Python expression that loads a dataset file into a DataFrame, reading
+    only `columns` when they are given. A list of files (a dataset with
+    appended segments) is read file by file and concatenated.
+    """
+    if isinstance(file_path, list):
+        if len(file_path) == 1:
+            return load_expression(file_path[0], columns)
+        parts = ", ".join(load_expression(path, columns) for path in file_path)
+        return f"pd.concat([{parts}], ignore_index=True)"
+    if file_path.endswith(".parquet"):
+        columns_arg = f", columns={columns!r}" if columns is not None else ""
+        return f"pd.read_parquet(r'{file_path}'{columns_arg})"
+    columns_arg = f", usecols={columns!r}" if columns is not None else ""
+    return f"pd.read_csv(r'{file_path}'{columns_arg})"
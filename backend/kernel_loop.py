@@ -0,0 +1,56 @@
+import asyncio
+import threading
+from typing import Optional
+
+
+class KernelLoop:
+    """
+    A dedicated asyncio event loop running in a background thread.
+
+    All kernel managers, clients and the execution scheduler live on this
+    loop, so they are independent of whichever loop (or thread) a request
+    is served from. Async callers `await submit(...)`, sync callers `run(...)`.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_forever, name="kernel-loop", daemon=True)
+        self._thread.start()
+
+    def _run_forever(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def submit(self, coro):
+        """Runs a coroutine on the kernel loop and awaits it from another loop.
+
+        Cancelling the awaiting task cancels the coroutine on the kernel loop.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return await asyncio.wrap_future(future)
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """Runs a coroutine on the kernel loop and blocks until it finishes."""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("KernelLoop.run() cannot be called from the kernel loop itself")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def call_soon(self, coro):
+        """Schedules a coroutine on the kernel loop without waiting for it."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=10)
+
+
+_kernel_loop: Optional[KernelLoop] = None
+_kernel_loop_lock = threading.Lock()
+
+
+def get_kernel_loop() -> KernelLoop:
+    global _kernel_loop
+    with _kernel_loop_lock:
+        if _kernel_loop is None:
+            _kernel_loop = KernelLoop()
+        return _kernel_loop
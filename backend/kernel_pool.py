@@ -0,0 +1,439 @@
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from queue import Empty
+from typing import Optional
+
+import psutil
+from jupyter_client import AsyncKernelManager
+
+from config import (
+    KERNEL_POOL_MIN_SIZE, KERNEL_POOL_MAX_SIZE, KERNEL_MAX_EXECUTIONS,
+    KERNEL_MAX_MEMORY_MB, KERNEL_HEALTH_CHECK_INTERVAL, KERNEL_LEASE_TIMEOUT,
+    EXECUTION_TIMEOUT, EXECUTION_CPU_LIMIT, EXECUTION_MEMORY_LIMIT_MB,
+)
+
+# Clears everything the previous lease defined while keeping imported
+# modules (pandas, plotly, ...) cached in the kernel process.
+RESET_NAMESPACE_CODE = "%reset -f"
+
+# How often a running execution is checked against its limits
+LIMIT_POLL_INTERVAL = 0.5
+# How long an interrupted kernel gets to return to idle before it is replaced
+INTERRUPT_GRACE_PERIOD = 10
+
+
+class KernelPoolExhausted(Exception):
+    """Raised when no kernel could be leased before the lease timeout."""
+
+
+class ExecutionLimits:
+    """Per-execution limits; 0 disables a limit."""
+
+    def __init__(
+        self,
+        timeout: float = EXECUTION_TIMEOUT,
+        cpu_seconds: float = EXECUTION_CPU_LIMIT,
+        memory_mb: float = EXECUTION_MEMORY_LIMIT_MB,
+    ):
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+
+
+def _limit_error(ename: str, evalue: str) -> dict:
+    return {'type': 'error', 'ename': ename, 'evalue': evalue, 'traceback': []}
+
+
+class PooledKernel:
+    """A started kernel together with its client and usage counters."""
+
+    def __init__(self):
+        self.km = AsyncKernelManager()
+        self.kc = None
+        self.executions = 0
+        self.created_at = time.monotonic()
+        # Set when the kernel stopped responding and must not be reused
+        self.broken = False
+
+    @classmethod
+    async def start(cls, startup_timeout: float = 60) -> "PooledKernel":
+        kernel = cls()
+        try:
+            await kernel.km.start_kernel()
+            kernel.kc = kernel.km.client()
+            kernel.kc.start_channels()
+            await kernel.kc.wait_for_ready(timeout=startup_timeout)
+        except BaseException:
+            # Also on cancellation, so that no orphaned kernel process is left behind.
+            await asyncio.shield(kernel.shutdown())
+            raise
+        return kernel
+
+    @property
+    def pid(self) -> Optional[int]:
+        provisioner = getattr(self.km, "provisioner", None)
+        return getattr(provisioner, "pid", None)
+
+    async def is_alive(self) -> bool:
+        try:
+            return await self.km.is_alive()
+        except Exception:
+            return False
+
+    def memory_mb(self) -> float:
+        """Resident memory of the kernel process, or 0 if it cannot be read."""
+        if self.pid is None:
+            return 0.0
+        try:
+            return psutil.Process(self.pid).memory_info().rss / (1024 * 1024)
+        except psutil.Error:
+            return 0.0
+
+    def cpu_seconds(self) -> float:
+        """CPU time used by the kernel process so far, or 0 if it cannot be read."""
+        if self.pid is None:
+            return 0.0
+        try:
+            times = psutil.Process(self.pid).cpu_times()
+            return times.user + times.system
+        except psutil.Error:
+            return 0.0
+
+    def _limit_violation(
+        self, limits: "ExecutionLimits", started: float, cpu_start: float, memory_baseline_mb: float
+    ) -> Optional[dict]:
+        if limits.timeout and time.monotonic() - started > limits.timeout:
+            return _limit_error('ExecutionTimeout', f"Execution exceeded the {limits.timeout:.0f}s time limit")
+        if limits.cpu_seconds and self.cpu_seconds() - cpu_start > limits.cpu_seconds:
+            return _limit_error('CPULimitExceeded', f"Execution exceeded the {limits.cpu_seconds:.0f}s CPU limit")
+        if limits.memory_mb and self.memory_mb() - memory_baseline_mb > limits.memory_mb:
+            detail = f" on top of the {memory_baseline_mb:.0f} MB already in use" if memory_baseline_mb else ""
+            return _limit_error(
+                'MemoryLimitExceeded', f"Execution exceeded the {limits.memory_mb:.0f} MB memory limit{detail}"
+            )
+        return None
+
+    async def interrupt(self, msg_id: str):
+        """
+        Interrupts the running cell and waits for the kernel to go idle. A
+        kernel that ignores the interrupt is marked broken so it gets replaced.
+        """
+        try:
+            await self.km.interrupt_kernel()
+        except Exception as e:
+            print(f"Could not interrupt kernel: {e}")
+            self.broken = True
+            return
+        deadline = time.monotonic() + INTERRUPT_GRACE_PERIOD
+        while time.monotonic() < deadline:
+            try:
+                msg = await self.kc.get_iopub_msg(timeout=max(deadline - time.monotonic(), 0.1))
+            except Empty:
+                break
+            if (msg.get('parent_header', {}).get('msg_id') == msg_id
+                    and msg['header']['msg_type'] == 'status'
+                    and msg['content'].get('execution_state') == 'idle'):
+                return
+        self.broken = True
+
+    async def execute(
+        self, code: str, limits: Optional["ExecutionLimits"] = None, memory_baseline_mb: float = 0.0
+    ) -> list:
+        """
+        Runs code in the kernel and collects its output, correctly handling JSON.
+
+        The run is interrupted once it exceeds any of `limits` (wall clock,
+        CPU time, memory), or if the awaiting task is cancelled. Memory is
+        counted above `memory_baseline_mb`, what the kernel held beforehand
+        that the code is not to be charged for.
+        """
+        limits = limits or ExecutionLimits()
+        msg_id = self.kc.execute(code)
+        results = []
+        started = time.monotonic()
+        cpu_start = self.cpu_seconds()
+
+        next_check = started
+
+        try:
+            while True:
+                # psutil calls are not free, so chatty output is checked at most every poll interval.
+                if time.monotonic() >= next_check:
+                    violation = self._limit_violation(limits, started, cpu_start, memory_baseline_mb)
+                    if violation:
+                        await self.interrupt(msg_id)
+                        results.append(violation)
+                        break
+                    next_check = time.monotonic() + LIMIT_POLL_INTERVAL
+
+                try:
+                    msg = await self.kc.get_iopub_msg(timeout=LIMIT_POLL_INTERVAL)
+                except Empty:
+                    if not await self.is_alive():
+                        self.broken = True
+                        results.append(_limit_error('KernelDied', "The kernel died during execution"))
+                        break
+                    continue
+
+                # A reused kernel may still have messages from earlier requests
+                # (e.g. the namespace reset) queued up, so only read our own.
+                if msg.get('parent_header', {}).get('msg_id') != msg_id:
+                    continue
+
+                msg_type = msg['header']['msg_type']
+                content = msg.get('content', {})
+
+                if msg_type == 'status' and content.get('execution_state') == 'idle':
+                    break
+                elif msg_type == 'stream':
+                    results.append({'type': 'stdout', 'text': content.get('text', '')})
+                elif msg_type == 'execute_result':
+                    # Check for rich JSON output first, which is what fig.to_json() produces.
+                    if 'application/json' in content.get('data', {}):
+                        # We dump and reload to ensure it's a clean, double-quoted JSON string
+                        json_data = json.dumps(content['data']['application/json'])
+                        results.append({'type': 'json_result', 'text': json_data})
+                    # Fallback to plain text if no JSON is available
+                    else:
+                        text_data = content.get('data', {}).get('text/plain', '')
+                        results.append({'type': 'result', 'text': text_data})
+                elif msg_type == 'error':
+                    results.append({
+                        'type': 'error',
+                        'ename': content.get('ename', 'Unknown error'),
+                        'evalue': content.get('evalue', '...'),
+                        'traceback': content.get('traceback', []),
+                    })
+                    break
+        except asyncio.CancelledError:
+            # Nobody is waiting for the result any more; stop burning CPU.
+            await asyncio.shield(self.interrupt(msg_id))
+            raise
+
+        return results
+
+    async def reset(self, timeout: float = 30) -> bool:
+        """Wipes the user namespace. Returns False if the kernel did not answer."""
+        msg_id = self.kc.execute(RESET_NAMESPACE_CODE, silent=True, store_history=False)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                reply = await self.kc.get_shell_msg(timeout=max(deadline - time.monotonic(), 0.1))
+            except Exception:
+                return False
+            if reply.get("parent_header", {}).get("msg_id") == msg_id:
+                return reply["content"].get("status") == "ok"
+        return False
+
+    async def shutdown(self):
+        try:
+            if self.kc is not None:
+                self.kc.stop_channels()
+        finally:
+            try:
+                await self.km.shutdown_kernel(now=True)
+            except Exception as e:
+                print(f"Could not shut down kernel cleanly: {e}")
+
+
+class KernelPool:
+    """
+    A pool of pre-started Jupyter kernels, managed on the kernel loop.
+
+    Kernels are handed out through `lease()`. When a lease ends the kernel is
+    either reset and returned to the pool, or retired (after too many
+    executions, too much memory, or a crash) and replaced in the background.
+    """
+
+    def __init__(
+        self,
+        min_size: int = KERNEL_POOL_MIN_SIZE,
+        max_size: int = KERNEL_POOL_MAX_SIZE,
+        max_executions: int = KERNEL_MAX_EXECUTIONS,
+        max_memory_mb: float = KERNEL_MAX_MEMORY_MB,
+        health_check_interval: float = KERNEL_HEALTH_CHECK_INTERVAL,
+        lease_timeout: float = KERNEL_LEASE_TIMEOUT,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Kernel pool sizes must satisfy 0 <= min_size <= max_size, max_size >= 1")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_executions = max_executions
+        self.max_memory_mb = max_memory_mb
+        self.health_check_interval = health_check_interval
+        self.lease_timeout = lease_timeout
+
+        self._idle: list = []
+        self._leased = 0
+        self._starting = 0
+        self._closed = False
+        self._cond: Optional[asyncio.Condition] = None
+        self._tasks: set = set()
+        self._monitor: Optional[asyncio.Task] = None
+
+    # --- Lifecycle ---
+
+    async def start(self):
+        """Fills the pool up to min_size and starts the health-check task."""
+        if self._monitor is not None:
+            return
+        self._cond = asyncio.Condition()
+        self._monitor = asyncio.create_task(self._monitor_loop())
+        self._replenish()
+
+    async def shutdown(self):
+        self._closed = True
+        if self._monitor is not None:
+            self._monitor.cancel()
+        async with self._cond:
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        # Pending resets and start-ups see the closed flag and shut their kernel down.
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await asyncio.gather(*(kernel.shutdown() for kernel in idle), return_exceptions=True)
+
+    @property
+    def size(self) -> int:
+        return len(self._idle) + self._leased + self._starting
+
+    def stats(self) -> dict:
+        return {
+            "idle": len(self._idle),
+            "leased": self._leased,
+            "starting": self._starting,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+        }
+
+    # --- Leasing ---
+
+    @asynccontextmanager
+    async def lease(self, timeout: Optional[float] = None):
+        """Yields a ready kernel for exclusive use and returns it afterwards."""
+        kernel = await self._acquire(self.lease_timeout if timeout is None else timeout)
+        try:
+            yield kernel
+        finally:
+            kernel.executions += 1
+            self._spawn(self._release(kernel))
+
+    async def _acquire(self, timeout: float) -> PooledKernel:
+        deadline = time.monotonic() + timeout
+        async with self._cond:
+            while True:
+                if self._closed:
+                    raise KernelPoolExhausted("Kernel pool is shut down")
+                if self._idle:
+                    kernel = self._idle.pop()
+                    self._leased += 1
+                    break
+                if self.size < self.max_size:
+                    # Start the kernel ourselves, outside of the lock.
+                    self._starting += 1
+                    kernel = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise KernelPoolExhausted(f"No kernel became available within {timeout:.0f}s")
+                try:
+                    await asyncio.wait_for(self._cond.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+        if kernel is None:
+            try:
+                kernel = await PooledKernel.start()
+            finally:
+                async with self._cond:
+                    self._starting -= 1
+                    if kernel is not None:
+                        self._leased += 1
+                    self._cond.notify_all()
+            return kernel
+
+        if not await kernel.is_alive():
+            # A crashed kernel slipped in between health checks.
+            await self._retire(kernel)
+            return await self._acquire(max(deadline - time.monotonic(), 0))
+        return kernel
+
+    async def _release(self, kernel: PooledKernel):
+        """Resets a returned kernel and puts it back, or retires it."""
+        if await self._should_retire(kernel) or not await kernel.reset():
+            await self._retire(kernel)
+            return
+        async with self._cond:
+            self._leased -= 1
+            if self._closed:
+                self._spawn(kernel.shutdown())
+            else:
+                self._idle.append(kernel)
+            self._cond.notify_all()
+
+    async def _should_retire(self, kernel: PooledKernel) -> bool:
+        if self._closed or kernel.broken or not await kernel.is_alive():
+            return True
+        if self.max_executions and kernel.executions >= self.max_executions:
+            return True
+        if self.max_memory_mb and kernel.memory_mb() > self.max_memory_mb:
+            return True
+        return False
+
+    async def _retire(self, kernel: PooledKernel):
+        async with self._cond:
+            self._leased -= 1
+            self._cond.notify_all()
+        self._spawn(kernel.shutdown())
+        self._replenish()
+
+    # --- Background maintenance ---
+
+    def _spawn(self, coro):
+        """Runs a coroutine in the background, keeping a reference until it finishes."""
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _replenish(self):
+        """Starts kernels in the background until the pool holds min_size."""
+        if self._closed:
+            return
+        missing = max(self.min_size - self.size, 0)
+        self._starting += missing
+        for _ in range(missing):
+            self._spawn(self._start_idle_kernel())
+
+    async def _start_idle_kernel(self):
+        kernel = None
+        try:
+            kernel = await PooledKernel.start()
+        except Exception as e:
+            print(f"Could not start a pooled kernel: {e}")
+        async with self._cond:
+            self._starting -= 1
+            if kernel is not None and not self._closed:
+                self._idle.append(kernel)
+            elif kernel is not None:
+                self._spawn(kernel.shutdown())
+            self._cond.notify_all()
+
+    async def _monitor_loop(self):
+        while not self._closed:
+            await asyncio.sleep(self.health_check_interval)
+            await self.check_health()
+
+    async def check_health(self):
+        """Drops idle kernels that died and starts replacements for them."""
+        idle = list(self._idle)
+        alive = await asyncio.gather(*(kernel.is_alive() for kernel in idle))
+        dead = [kernel for kernel, ok in zip(idle, alive) if not ok]
+        async with self._cond:
+            self._idle = [kernel for kernel in self._idle if kernel not in dead]
+        for kernel in dead:
+            print("Replacing crashed kernel from the pool.")
+            self._spawn(kernel.shutdown())
+        self._replenish()
@@ -0,0 +1,253 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from config import (
+    KERNEL_SESSION_MAX, KERNEL_SESSION_MEMORY_BUDGET_MB, KERNEL_SESSION_IDLE_TIMEOUT,
+)
+from ingestion import load_expression
+from kernel_pool import ExecutionLimits, PooledKernel
+
+# Runs once when a session kernel starts. DataFrames live in `_session_tables`
+# and are re-bound to `<table>_df` before every execution, so user code can
+# never clobber the loaded copy. Copy-on-Write makes the re-binding free.
+SESSION_BOOTSTRAP_CODE = """
+import pandas as pd
+from pandasql import sqldf
+import plotly.express as px
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.options.mode.copy_on_write = True
+_session_tables = {}
+
+def _session_bind():
+    _globals = globals()
+    for _name in [n for n in _globals if not n.startswith('_') and n not in _session_baseline]:
+        del _globals[_name]
+    for _table, _df in _session_tables.items():
+        _globals[f"{_table}_df"] = _df.copy(deep=False)
+
+_session_baseline = set(globals()) | {'_session_baseline'}
+"""
+
+DESCRIBE_TABLES_CODE = """
+import json as _json
+print(_json.dumps({t: {c: str(d) for c, d in df.dtypes.items()} for t, df in _session_tables.items()}))
+"""
+
+
+def dataset_signature(file_path) -> tuple:
+    """Identifies the current content of a dataset file (or files) without reading it."""
+    if isinstance(file_path, list):
+        return tuple(dataset_signature(path) for path in file_path)
+    try:
+        stat = os.stat(file_path)
+        return (file_path, stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return (file_path, None, None)
+
+
+class ProjectSession:
+    """A long-lived kernel that keeps one project's DataFrames in memory."""
+
+    def __init__(self, project_id: int, kernel: PooledKernel):
+        self.project_id = project_id
+        self.kernel = kernel
+        self.loaded: dict = {}  # table_name -> dataset_signature
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    @classmethod
+    async def start(cls, project_id: int) -> "ProjectSession":
+        session = cls(project_id, await PooledKernel.start())
+        try:
+            session._check(await session.kernel.execute(SESSION_BOOTSTRAP_CODE))
+        except BaseException:
+            await asyncio.shield(session.close())
+            raise
+        return session
+
+    @staticmethod
+    def _check(results: list):
+        error = next((res for res in results if res['type'] == 'error'), None)
+        if error:
+            raise RuntimeError(f"Session kernel error: {error['ename']}: {error['evalue']}")
+
+    async def sync_datasets(self, tables: dict):
+        """
+        Loads new or changed datasets and drops removed ones, leaving the rest
+        untouched. `tables` maps each table_name to its file path, or to
+        a list of paths if rows were appended to it.
+        """
+        lines = []
+        for table_name in set(self.loaded) - set(tables):
+            lines.append(f"_session_tables.pop({table_name!r}, None)")
+            del self.loaded[table_name]
+        for table_name, file_path in tables.items():
+            signature = dataset_signature(file_path)
+            if self.loaded.get(table_name) != signature:
+                # A broken file should not take the other tables down with it.
+                lines.append("try:")
+                lines.append(f"    _session_tables[{table_name!r}] = {load_expression(file_path)}")
+                lines.append("except Exception as _e:")
+                lines.append(f"    _session_tables.pop({table_name!r}, None)")
+                lines.append(f"    print(f'Could not load {table_name}: {{_e}}')")
+                self.loaded[table_name] = signature
+        if lines:
+            try:
+                self._check(await self.kernel.execute("\n".join(lines)))
+            except RuntimeError:
+                # We don't know which tables made it; force a full reload next time.
+                self.loaded.clear()
+                raise
+
+    async def execute(self, code: str, limits: Optional[ExecutionLimits] = None) -> list:
+        """
+        Runs code against the loaded tables. The memory limit applies to what
+        the run adds: the tables already in memory are not counted against it,
+        they are bounded by the manager's memory budget instead.
+        """
+        self.last_used = time.monotonic()
+        return await self.kernel.execute(f"_session_bind()\n{code}", limits, memory_baseline_mb=self.memory_mb())
+
+    async def describe_tables(self) -> dict:
+        """Column names and dtypes of the loaded tables, read from memory."""
+        results = await self.kernel.execute(DESCRIBE_TABLES_CODE)
+        self._check(results)
+        text = next((res['text'] for res in reversed(results) if res['type'] == 'stdout'), "{}")
+        return json.loads(text)
+
+    def memory_mb(self) -> float:
+        return self.kernel.memory_mb()
+
+    async def close(self):
+        await self.kernel.shutdown()
+
+
+class SessionManager:
+    """
+    Keeps at most `max_sessions` project sessions alive, evicting the least
+    recently used ones when the count or the combined kernel memory exceeds
+    its budget, and closing sessions that sat idle for too long.
+    Like the kernel pool, it lives on the kernel loop.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = KERNEL_SESSION_MAX,
+        memory_budget_mb: float = KERNEL_SESSION_MEMORY_BUDGET_MB,
+        idle_timeout: float = KERNEL_SESSION_IDLE_TIMEOUT,
+    ):
+        self.max_sessions = max_sessions
+        self.memory_budget_mb = memory_budget_mb
+        self.idle_timeout = idle_timeout
+        self._sessions: "OrderedDict[int, ProjectSession]" = OrderedDict()
+        self._closed = False
+        self._reaper: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_loop())
+
+    def stats(self) -> dict:
+        sessions = list(self._sessions.values())
+        return {
+            "sessions": len(sessions),
+            "max_sessions": self.max_sessions,
+            "memory_mb": round(sum(s.memory_mb() for s in sessions), 1),
+            "memory_budget_mb": self.memory_budget_mb,
+        }
+
+    @asynccontextmanager
+    async def lease(self, project_id: int, tables: dict):
+        """Yields the project's session, started or synced as needed, for exclusive use."""
+        session = await self._get_or_create(project_id)
+        await session.lock.acquire()
+        if session.kernel.broken or not await session.kernel.is_alive():
+            # The kernel crashed, hung or was evicted under us; start over.
+            self._discard(project_id, session)
+            session.lock.release()
+            await session.close()
+            session = await self._get_or_create(project_id)
+            await session.lock.acquire()
+        try:
+            await session.sync_datasets(tables)
+            yield session
+        finally:
+            session.last_used = time.monotonic()
+            session.lock.release()
+            # Also after a timeout or cancellation, the runs most likely to have grown the kernel
+            await asyncio.shield(self._enforce_budget())
+
+    async def refresh_project(self, project_id: int, tables: dict):
+        """Reloads changed datasets of an existing session; does nothing if there is none."""
+        session = self._sessions.get(project_id)
+        if session is None:
+            return
+        async with session.lock:
+            try:
+                await session.sync_datasets(tables)
+            except RuntimeError as e:
+                print(f"Could not refresh session for project {project_id}: {e}")
+        await self._enforce_budget()
+
+    async def _get_or_create(self, project_id: int) -> ProjectSession:
+        session = self._sessions.get(project_id)
+        if session is not None:
+            self._sessions.move_to_end(project_id)
+            return session
+        # Another request may start the same session while we wait for the kernel.
+        new_session = await ProjectSession.start(project_id)
+        session = self._sessions.setdefault(project_id, new_session)
+        self._sessions.move_to_end(project_id)
+        if session is not new_session:
+            await new_session.close()
+        await self._enforce_budget(keep=project_id)
+        return session
+
+    def _discard(self, project_id: int, session: ProjectSession):
+        if self._sessions.get(project_id) is session:
+            del self._sessions[project_id]
+
+    async def _enforce_budget(self, keep: Optional[int] = None):
+        """Evicts idle sessions, least recently used first, until within budget."""
+        while True:
+            sessions = list(self._sessions.items())
+            over_count = len(sessions) > self.max_sessions
+            over_memory = (
+                self.memory_budget_mb
+                and sum(s.memory_mb() for _, s in sessions) > self.memory_budget_mb
+            )
+            if not (over_count or over_memory):
+                return
+            victim = next(
+                ((pid, s) for pid, s in sessions if pid != keep and not s.lock.locked()),
+                None,
+            )
+            if victim is None:
+                return
+            print(f"Evicting kernel session for project {victim[0]}.")
+            self._discard(*victim)
+            await victim[1].close()
+
+    async def _reap_loop(self):
+        while not self._closed:
+            await asyncio.sleep(min(self.idle_timeout, 60))
+            now = time.monotonic()
+            idle = [
+                (pid, s) for pid, s in self._sessions.items()
+                if now - s.last_used > self.idle_timeout and not s.lock.locked()
+            ]
+            for project_id, session in idle:
+                self._discard(project_id, session)
+                await session.close()
+
+    async def shutdown(self):
+        self._closed = True
+        if self._reaper is not None:
+            self._reaper.cancel()
+        sessions, self._sessions = list(self._sessions.values()), OrderedDict()
+        await asyncio.gather(*(session.close() for session in sessions), return_exceptions=True)
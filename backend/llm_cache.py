@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Optional
+
+from config import LLM_CACHE_ENABLED, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_PATH, LLM_CACHE_SIMILARITY, LLM_CACHE_TTL
+
+# Words that change how a question is phrased but not what it asks for: politeness, request
+# verbs and articles. Prepositions and conjunctions stay ("from 2010 to 2020" is not "in 2010 and 2020").
+_FILLER = frozenset("""
+    a an the please show me give tell list find get display return what is are was were
+    can could would you i we want need do does how
+""".split())
+_SYNONYMS = {"avg": "average", "mean": "average", "total": "sum", "number": "count", "many": "count"}
+_TOKEN = re.compile(r"[^\W_]+(?:[.'][^\W_]+)*")
+
+
+def _canonical(token: str) -> str:
+    token = _SYNONYMS.get(token, token)
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        token = token[:-1]
+    return token
+
+
+def normalize_question(question: str) -> str:
+    """
+    The words of a question that say what it asks for: lower-cased, without
+    punctuation or filler words, singular, with common synonyms merged, in
+    their original order.
+    """
+    text = unicodedata.normalize("NFKC", question).lower()
+    return " ".join(_canonical(token) for token in _TOKEN.findall(text) if token not in _FILLER)
+
+
+def question_similarity(a: str, b: str) -> float:
+    """
+    How alike two normalized questions are: 0 unless they use the same
+    words, else the Jaccard similarity of their word pairs, so word order
+    still counts ("wins by driver" is not "drivers by wins").
+    """
+    if a == b:
+        return 1.0
+    tokens_a, tokens_b = a.split(), b.split()
+    if set(tokens_a) != set(tokens_b):
+        return 0.0
+    pairs_a, pairs_b = set(zip(tokens_a, tokens_a[1:])), set(zip(tokens_b, tokens_b[1:]))
+    if not pairs_a | pairs_b:
+        return 1.0
+    return len(pairs_a & pairs_b) / len(pairs_a | pairs_b)
+
+
+def context_hash(context) -> str:
+    return hashlib.sha256(json.dumps(context, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def cache_scope(kind: str, provider: str, model: str, language: str, context: str) -> str:
+    """What must match exactly for a cached answer to apply: the task, the model and the schema it saw."""
+    return hashlib.sha256(json.dumps([kind, provider, model, language, context]).encode()).hexdigest()
+
+
+class LLMCache:
+    """
+    Generated code persisted in a SQLite file, keyed on the scope (see
+    cache_scope) and the normalized question. A lookup that misses the exact
+    question falls back to the most similar cached question in the same
+    scope, if it is at least `similarity` alike. Entries expire after `ttl`
+    seconds and the least recently used go first beyond `max_entries`.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 ttl: float = LLM_CACHE_TTL, similarity: float = LLM_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache (scope TEXT, question TEXT, code TEXT, created_at REAL,"
+            " last_used REAL, PRIMARY KEY (scope, question))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)")
+        self._db.commit()
+        self._lock = threading.Lock()
+        self.hits = self.near_hits = self.misses = 0
+
+    def get(self, scope: str, question: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            if self.ttl:
+                self._db.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+            rows = self._db.execute("SELECT question, code FROM llm_cache WHERE scope = ?", (scope,)).fetchall()
+            best, best_score = None, 0.0
+            for cached_question, code in rows:
+                score = question_similarity(question, cached_question)
+                if score > best_score:
+                    best, best_score = (cached_question, code), score
+            if best is None or best_score < self.similarity:
+                self.misses += 1
+                self._db.commit()
+                return None
+            if best_score == 1.0:
+                self.hits += 1
+            else:
+                self.near_hits += 1
+            self._db.execute("UPDATE llm_cache SET last_used = ? WHERE scope = ? AND question = ?", (now, scope, best[0]))
+            self._db.commit()
+            return best[1]
+
+    def put(self, scope: str, question: str, code: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?)", (scope, question, code, now, now))
+            self._db.execute(
+                "DELETE FROM llm_cache WHERE rowid IN (SELECT rowid FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        return {"entries": entries, "hits": self.hits, "near_hits": self.near_hits, "misses": self.misses}
+
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """The generated-code cache, or None when it is turned off."""
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None and LLM_CACHE_ENABLED:
+            _llm_cache = LLMCache()
+        return _llm_cache
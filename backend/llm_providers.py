@@ -0,0 +1,334 @@
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator, Optional
+
+import google.generativeai as genai
+import httpx
+import ollama
+import openai
+
+from config import (
+    GEMINI_API_BASE, GOOGLE_API_KEY, LLM_BREAKER_FAILURES, LLM_BREAKER_RESET, LLM_HEDGE_DELAY, LLM_HEDGE_MODEL,
+    LLM_HEDGE_PROVIDER, LLM_MAX_RETRIES, LLM_RATE_BURST, LLM_RATE_LIMITS, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY,
+    LLM_TIMEOUTS, OLLAMA_API_BASE, OPENROUTER_API_BASE, OPENROUTER_API_KEY,
+)
+
+# Statuses worth another attempt: rate limits and server-side failures
+_RETRY_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class ProviderError(Exception):
+    """An LLM provider failed to generate a response."""
+
+
+class CircuitOpen(ProviderError):
+    """Calls to a provider are suspended after repeated failures."""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"The {provider} provider is unavailable after repeated failures")
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+def is_retryable(error: Exception) -> bool:
+    """Timeouts, dropped connections, rate limits and 5xx answers; not bad requests or bad credentials."""
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(error, "code", None)  # google.api_core exceptions
+    return isinstance(status, int) and status in _RETRY_STATUSES
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a provider after `failures` failed attempts in a row.
+    After `reset_after` seconds one trial call is let through: its success
+    closes the circuit again, its failure re-opens it.
+    """
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, reset_after: float = LLM_BREAKER_RESET):
+        self.failures = failures
+        self.reset_after = reset_after
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self._opened_at >= self.reset_after else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_after - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._trial or self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+
+class RateLimiter:
+    """
+    A token bucket letting through `per_minute` calls a minute on average and
+    up to `burst` at once. acquire() blocks until the caller's turn; each
+    caller reserves its slot, so waiting callers are served in order.
+    """
+
+    def __init__(self, per_minute: float, burst: int = LLM_RATE_BURST):
+        self.rate = per_minute / 60
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Waits for a slot and returns the seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class OpenRouterClient:
+    """OpenAI-compatible chat completions; one client, so its HTTP connections are reused."""
+
+    def __init__(self, base_url: str = OPENROUTER_API_BASE, api_key: Optional[str] = OPENROUTER_API_KEY,
+                 timeout: float = LLM_TIMEOUTS["openrouter"]):
+        self.client = openai.OpenAI(base_url=base_url, api_key=api_key, timeout=timeout, max_retries=0)
+
+    def complete(self, prompt: str, model: str) -> str:
+        completion = self.client.chat.completions.create(model=model, messages=[{"role": "user", "content": prompt}])
+        return completion.choices[0].message.content or ""
+
+    def stream(self, prompt: str, model: str) -> Iterator[str]:
+        chunks = self.client.chat.completions.create(
+            model=model, messages=[{"role": "user", "content": prompt}], stream=True
+        )
+        for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class OllamaClient:
+    def __init__(self, host: Optional[str] = OLLAMA_API_BASE, timeout: float = LLM_TIMEOUTS["ollama"]):
+        self.client = ollama.Client(host=host, timeout=timeout)
+
+    def complete(self, prompt: str, model: str) -> str:
+        return self.client.generate(model=model, prompt=prompt)["response"]
+
+    def stream(self, prompt: str, model: str) -> Iterator[str]:
+        for part in self.client.generate(model=model, prompt=prompt, stream=True):
+            if part["response"]:
+                yield part["response"]
+
+
+class GeminiClient:
+    """Gemini models share the channel genai.configure sets up, so it is configured once."""
+
+    def __init__(self, api_key: Optional[str] = GOOGLE_API_KEY, api_base: Optional[str] = GEMINI_API_BASE,
+                 timeout: float = LLM_TIMEOUTS["gemini"]):
+        options = {"transport": "rest", "client_options": {"api_endpoint": api_base}} if api_base else {}
+        genai.configure(api_key=api_key, **options)
+        self.timeout = timeout
+        self._models = {}
+
+    def _model(self, model: str):
+        if model not in self._models:
+            self._models[model] = genai.GenerativeModel(model)
+        return self._models[model]
+
+    def complete(self, prompt: str, model: str) -> str:
+        return self._model(model).generate_content(prompt, request_options={"timeout": self.timeout}).text
+
+    def stream(self, prompt: str, model: str) -> Iterator[str]:
+        chunks = self._model(model).generate_content(prompt, stream=True, request_options={"timeout": self.timeout})
+        for chunk in chunks:
+            if chunk.parts:
+                yield chunk.text
+
+
+CLIENT_TYPES = {"openrouter": OpenRouterClient, "ollama": OllamaClient, "gemini": GeminiClient}
+
+
+class ProviderPool:
+    """
+    Long-lived provider clients with bounded retries (exponential backoff
+    with full jitter), a rate limit and a circuit breaker per provider and,
+    if a hedge is configured, hedged requests: when the primary has not
+    answered within `hedge_delay` seconds the hedge provider is asked too,
+    and the first answer wins.
+    """
+
+    def __init__(self, clients: Optional[dict] = None, retries: int = LLM_MAX_RETRIES,
+                 base_delay: float = LLM_RETRY_BASE_DELAY, max_delay: float = LLM_RETRY_MAX_DELAY,
+                 hedge: Optional[tuple] = None, hedge_delay: float = LLM_HEDGE_DELAY,
+                 breaker_failures: int = LLM_BREAKER_FAILURES, breaker_reset: float = LLM_BREAKER_RESET,
+                 rate_limits: Optional[dict] = None):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self._clients = dict(clients or {})
+        self._breakers = {}
+        self._breaker_settings = (breaker_failures, breaker_reset)
+        self._limiters = {
+            name: RateLimiter(per_minute)
+            for name, per_minute in (LLM_RATE_LIMITS if rate_limits is None else rate_limits).items()
+        }
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm")
+        self.hedged = self.hedge_wins = 0
+        self.throttled = 0
+
+    def client(self, provider: str):
+        with self._lock:
+            if provider not in self._clients:
+                if provider not in CLIENT_TYPES:
+                    raise ProviderError(f"Invalid LLM provider specified: {provider}")
+                self._clients[provider] = CLIENT_TYPES[provider]()
+            return self._clients[provider]
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        with self._lock:
+            if provider not in self._breakers:
+                self._breakers[provider] = CircuitBreaker(*self._breaker_settings)
+            return self._breakers[provider]
+
+    def _throttle(self, provider: str):
+        """Waits until `provider` may be sent another request under its rate limit."""
+        limiter = self._limiters.get(provider)
+        if limiter is not None and limiter.acquire():
+            with self._lock:
+                self.throttled += 1
+
+    def call(self, provider: str, prompt: str, model: str) -> str:
+        """One provider, retried on transient failures. Raises ProviderError."""
+        breaker = self.breaker(provider)
+        for attempt in range(self.retries + 1):
+            if not breaker.allow():
+                raise CircuitOpen(provider, breaker.retry_after())
+            self._throttle(provider)
+            try:
+                text = self.client(provider).complete(prompt, model)
+            except ProviderError:
+                raise
+            except Exception as e:
+                self._failed(provider, breaker, e, give_up=attempt == self.retries)
+                time.sleep(self._backoff(provider, attempt, e))
+            else:
+                breaker.record_success()
+                return text
+
+    def stream(self, provider: str, prompt: str, model: str) -> Iterator[str]:
+        """
+        The answer of `provider` piece by piece as it is generated. Failures
+        before the first piece are retried as in call(); a failure after it
+        raises ProviderError. Streams are not hedged.
+        """
+        breaker = self.breaker(provider)
+        for attempt in range(self.retries + 1):
+            if not breaker.allow():
+                raise CircuitOpen(provider, breaker.retry_after())
+            started = False
+            self._throttle(provider)
+            try:
+                for piece in self.client(provider).stream(prompt, model):
+                    started = True
+                    yield piece
+            except ProviderError:
+                raise
+            except Exception as e:
+                self._failed(provider, breaker, e, give_up=started or attempt == self.retries)
+                time.sleep(self._backoff(provider, attempt, e))
+            else:
+                breaker.record_success()
+                return
+
+    def _failed(self, provider: str, breaker: CircuitBreaker, error: Exception, give_up: bool):
+        """Records a failed attempt; raises ProviderError unless it is worth retrying."""
+        retryable = is_retryable(error)
+        if retryable:
+            breaker.record_failure()
+        else:
+            breaker.record_success()  # It answered, even if with an error, so it is up
+        if give_up or not retryable:
+            raise ProviderError(f"The {provider} API failed: {error}") from error
+
+    def _backoff(self, provider: str, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        print(f"The {provider} API failed ({error}); retrying in {delay:.1f}s")
+        return delay
+
+    def generate(self, prompt: str, provider: str, model: str) -> str:
+        """The answer of `provider`, or of the hedge provider if it answers first. Raises ProviderError."""
+        if self.hedge is None or tuple(self.hedge) == (provider, model):
+            return self.call(provider, prompt, model)
+        primary = self._executor.submit(self.call, provider, prompt, model)
+        done, _ = wait([primary], timeout=self.hedge_delay)
+        if done and primary.exception() is None:
+            return primary.result()
+        self.hedged += 1
+        hedge_provider, hedge_model = self.hedge
+        pending = {self._executor.submit(self.call, hedge_provider, prompt, hedge_model)}
+        if not done:
+            pending.add(primary)
+        errors = [primary.exception()] if done else []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self.hedge_wins += 1
+                    return future.result()
+                errors.append(future.exception())
+        raise errors[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            breakers = {name: breaker.state for name, breaker in self._breakers.items()}
+        return {"circuits": breakers, "hedged": self.hedged, "hedge_wins": self.hedge_wins, "throttled": self.throttled}
+
+
+_provider_pool = None
+_provider_pool_lock = threading.Lock()
+
+
+def get_provider_pool() -> ProviderPool:
+    global _provider_pool
+    with _provider_pool_lock:
+        if _provider_pool is None:
+            hedge = (LLM_HEDGE_PROVIDER, LLM_HEDGE_MODEL) if LLM_HEDGE_PROVIDER and LLM_HEDGE_MODEL else None
+            _provider_pool = ProviderPool(hedge=hedge)
+        return _provider_pool
@@ -1,46 +1,59 @@
-import google.generativeai as genai
-import ollama
-from openai import OpenAI
-from http import HTTPStatus
-from config import (GOOGLE_API_KEY, OPENROUTER_API_KEY, OLLAMA_API_BASE)
+import json
+from typing import Iterator
 from database.models import QueryLanguage
+from llm_cache import cache_scope, context_hash, get_llm_cache, normalize_question
+from llm_providers import get_provider_pool
 
 
-def _generate_response(prompt: str, provider: str, model: str) -> str:
-    """Internal function to call the selected LLM provider and model."""
-    try:
-        if provider == 'gemini':
-            genai.configure(api_key=GOOGLE_API_KEY)
-            gemini_model = genai.GenerativeModel(model)
-            response = gemini_model.generate_content(prompt)
-            return response.text
-        elif provider == 'ollama':
-            ollama_client = ollama.Client(host=OLLAMA_API_BASE)
-            response = ollama_client.generate(model=model, prompt=prompt)
-            return response['response']
-        elif provider == 'openrouter':
-            client = OpenAI(
-                base_url="https://openrouter.ai/api/v1",
-                api_key=OPENROUTER_API_KEY,
-            )
-            completion = client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-            )
-            return completion.choices[0].message.content
-        else:
-            raise ValueError(f"Invalid LLM provider specified: {provider}")
-    except Exception as e:
-        print(f"An error occurred with the {provider} API: {e}")
-        error_message = str(e).replace("'", "\\'")
-        return f"print('Error generating code: {error_message}')"
-
-
-def _clean_response(text: str) -> str:
+def _call_provider(prompt: str, provider: str, model: str) -> str:
+    """
+    Calls the selected LLM provider and model through the shared provider
+    pool (retries, circuit breaker, hedging). Raises ProviderError.
+    """
+    return get_provider_pool().generate(prompt, provider, model)
+
+
+def clean_response(text: str) -> str:
     """Cleans markdown and other formatting from the LLM response."""
     return text.strip().replace("```python", "").replace("```sql", "").replace("```", "").strip()
 
 
+def _generate_code(prompt: str, provider: str, model: str, scope: str, question: str, use_cache: bool) -> str:
+    """
+    Generated code for a prompt, from the code cache when the same question
+    (or a rewording of it) was asked in the same scope. Raises ProviderError
+    if the provider fails.
+    """
+    cache = get_llm_cache() if use_cache else None
+    normalized = normalize_question(question)
+    if cache is not None:
+        cached = cache.get(scope, normalized)
+        if cached is not None:
+            return cached
+    code = clean_response(_call_provider(prompt, provider, model))
+    if cache is not None and code:
+        cache.put(scope, normalized, code)
+    return code
+
+
+def _stream_code(prompt: str, provider: str, model: str, scope: str, question: str, use_cache: bool) -> Iterator[str]:
+    """_generate_code, yielding the raw response as the provider produces it (cached code comes in one piece)."""
+    cache = get_llm_cache() if use_cache else None
+    normalized = normalize_question(question)
+    if cache is not None:
+        cached = cache.get(scope, normalized)
+        if cached is not None:
+            yield cached
+            return
+    pieces = []
+    for piece in get_provider_pool().stream(provider, prompt, model):
+        pieces.append(piece)
+        yield piece
+    code = clean_response("".join(pieces))
+    if cache is not None and code:
+        cache.put(scope, normalized, code)
+
+
 # def get_user_intent(question: str, provider: str, model: str) -> str:
 #     """Determines if the user wants a chart, table, or single fact."""
 #     prompt = f"""
@@ -50,21 +63,46 @@ def _clean_response(text: str) -> str:
 #     - 'table': for questions needing a list or table (e.g., "who are the top 10...?").
 #     - 'fact': for questions needing a single value (e.g., "how many...?").
 #     """
-#     response_text = _generate_response(prompt, provider, model)
-#     return _clean_response(response_text).lower()
+#     response_text = _call_provider(prompt, provider, model)
+#     return clean_response(response_text).lower()
+
+def _describe_column(name: str, dtype: str, stats: dict = None) -> str:
+    """One column for the prompt, with its upload-time statistics when we have them."""
+    if not stats:
+        return f"{name} ({dtype})"
+    details = [dtype]
+    if stats.get("null_fraction"):
+        details.append(f"{stats['null_fraction']:.0%} null")
+    if stats.get("min") is not None and stats.get("max") is not None:
+        details.append(f"range {stats['min']!r} to {stats['max']!r}")
+    details.append(f"~{stats['distinct_count']} distinct")
+    if stats.get("top_values"):
+        details.append("common: " + ", ".join(repr(value) for value, _ in stats["top_values"][:3]))
+    return f"{name} ({'; '.join(details)})"
 
-def generate_aggregation_code(question: str, tables_context: list, language: QueryLanguage, provider: str, model: str) -> str:
-    """Generates the code to produce the final data table, named ans_df."""
+def describe_tables(tables_context: list, language: QueryLanguage) -> str:
+    """The tables section of the aggregation prompt."""
     context_str = ""
     for table in tables_context:
         name_to_use = table['variable_name'] if language == QueryLanguage.python else table['table_name']
-        columns_info = ", ".join([f"{name} ({dtype})" for name, dtype in table['columns_with_types'].items()])
+        profiles = table.get('column_profiles') or {}
+        columns_info = ", ".join([
+            _describe_column(name, dtype, profiles.get(name)) for name, dtype in table['columns_with_types'].items()
+        ])
         
         context_str += f"- Name: `{name_to_use}`\n"
         context_str += f"  Description: {table['description']}\n"
-        context_str += f"  Columns (with data types): {columns_info}\n\n"
-        
-    prompt = f"""
+        if table.get('row_count') is not None:
+            context_str += f"  Rows: {table['row_count']}\n"
+        context_str += f"  Columns (with data types): {columns_info}\n"
+        if table.get('omitted_columns'):
+            context_str += f"  ({table['omitted_columns']} more columns not relevant to the question are not shown)\n"
+        context_str += "\n"
+    return context_str
+
+def aggregation_prompt(question: str, tables_context: list, language: QueryLanguage) -> str:
+    context_str = describe_tables(tables_context, language)
+    return f"""
     You are an expert {language.value} data analyst. A user wants to answer the question: "{question}".
     You have access to the following dataframes/tables which are ALREADY LOADED into memory:
     {context_str}
@@ -79,12 +117,43 @@ def generate_aggregation_code(question: str, tables_context: list, language: Que
     6.  DO NOT include comments, explanations, or function definitions (no `def my_function():`).
     7.  DO NOT visualize the data. Just produce the final `ans_df`.
     """
-    response_text = _generate_response(prompt, provider, model)
-    return _clean_response(response_text)
 
-def generate_visualization_code(request_data: dict, provider: str, model: str) -> str:
+def generate_aggregation_code(
+    question: str, tables_context: list, language: QueryLanguage, provider: str, model: str, use_cache: bool = True
+) -> str:
+    """
+    Generates the code to produce the final data table, named ans_df. The
+    code is cached per question and schema (names, types and descriptions);
+    pass use_cache=False to always ask the provider.
+    """
+    prompt = aggregation_prompt(question, tables_context, language)
+    scope = _aggregation_scope(tables_context, language, provider, model)
+    return _generate_code(prompt, provider, model, scope, question, use_cache)
+
+def stream_aggregation_code(
+    question: str, tables_context: list, language: QueryLanguage, provider: str, model: str, use_cache: bool = True
+) -> Iterator[str]:
     """
-    Generates Plotly code based on user selections and a data preview.
+    generate_aggregation_code, yielding the response piece by piece as the
+    provider produces it. The pieces are raw model output: pass the joined
+    text through clean_response() before running it.
+    """
+    prompt = aggregation_prompt(question, tables_context, language)
+    scope = _aggregation_scope(tables_context, language, provider, model)
+    yield from _stream_code(prompt, provider, model, scope, question, use_cache)
+
+def _aggregation_scope(tables_context: list, language: QueryLanguage, provider: str, model: str) -> str:
+    schema = [
+        [table['variable_name'] if language == QueryLanguage.python else table['table_name'],
+         table['description'], table['columns_with_types']]
+        for table in tables_context
+    ]
+    return cache_scope("aggregation", provider, model, language.value, context_hash(schema))
+
+def generate_visualization_code(request_data: dict, provider: str, model: str, use_cache: bool = True) -> str:
+    """
+    Generates Plotly code based on user selections and a data preview. The
+    code is cached per question, chart selections and preview columns.
     """
     prompt = f"""
     You are a Python data visualization expert.
@@ -92,7 +161,8 @@ def generate_visualization_code(request_data: dict, provider: str, model: str) -
     Their original question was: "{request_data['original_question']}"
     
     Here is a sample of their data table (in JSON format):
-    {request_data['datatable_json'][:10]} 
+    {request_data['datatable_json']}
+    {request_data.get('data_note') or ''}
 
     Your task is to write Python code using `plotly.express` to create this chart.
 
@@ -107,5 +177,13 @@ def generate_visualization_code(request_data: dict, provider: str, model: str) -
     4.  The final line of your code MUST be `fig.to_json()`.
     5.  Provide ONLY the Python code. No other text or explanations.
     """
-    response_text = _generate_response(prompt, provider, model)
-    return _clean_response(response_text)
\ No newline at end of file
+    try:
+        preview = json.loads(request_data['datatable_json'] or "[]")
+        columns = list(preview[0]) if preview else []
+    except (ValueError, TypeError, KeyError, IndexError):
+        columns = None
+    chart = {
+        key: request_data.get(key) for key in ('chart_type', 'x_axis', 'y_axis', 'legend', 'data_note')
+    }
+    scope = cache_scope("visualization", provider, model, "python", context_hash({**chart, "columns": columns}))
+    return _generate_code(prompt, provider, model, scope, request_data['original_question'], use_cache)
\ No newline at end of file
@@ -1,54 +1,93 @@
 # Standard Library Imports
+import asyncio
+import io
+import json
 import os
 import re
 import shutil
-from contextlib import asynccontextmanager
-from datetime import timedelta
+import time
+import uuid
+from contextlib import ExitStack, asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import List, Optional
 
 # Third-Party Library Imports
 import pandas as pd
-from sqlmodel import Session, create_engine, select
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from fastapi import (
-    Depends, FastAPI, File, Form, HTTPException, UploadFile, status
+    BackgroundTasks, Depends, FastAPI, File, Form, Header, HTTPException, Query, Request,
+    Response, UploadFile, status
 )
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 
 # Configuration and Core Setup
-from config import DATABASE_URL
+from config import (
+    APPROXIMATE_CONFIDENCE, APPROXIMATE_REFINE_FRACTIONS, DATABASE_URL, KERNEL_SESSION_MODE,
+    LIST_PAGE_DEFAULT_ITEMS, LIST_PAGE_MAX_ITEMS,
+    QUERY_BATCH_EXECUTIONS, QUERY_BATCH_LLM_CONCURRENCY, QUERY_BATCH_MAX, RESULT_INLINE_MAX_ROWS, RESULT_PAGE_DEFAULT_ROWS, RESULT_PAGE_MAX_ROWS, RESULT_SWEEP_INTERVAL, SQL_ENGINE, UPLOAD_DIRECTORY
+)
 
 # Authentication Logic
 from auth import (
     get_current_user, ACCESS_TOKEN_EXPIRE_MINUTES, create_access_token,
-    get_password_hash, verify_password
+    get_password_hash_async, principal_cache, verify_password_async
 )
 
 # Database Layer
-from sqlmodel import SQLModel, create_engine
 import database.db as db
-from database.db import get_session
+from database.db import create_engines, dispose_engines, get_async_session, get_session, upgrade_schema
 from database.models import (
-    User, UserCreate,
+    utc_now, Blob, User, UserCreate,
     Project, ProjectCreate, ProjectRead, ProjectReadWithDatasets,
-    Dataset,
-    QueryRequest, QueryLanguage,
+    Dataset, DatasetColumn, DatasetProfile, DatasetSegment, SavedAggregation, SavedAggregationCreate,
+    QueryRequest, QueryLanguage, SqlEngine,
     VisualizationRequest, CodeExecutionRequest
 )
 
 # LLM & Notebook Services
-from llm_service import generate_aggregation_code, generate_visualization_code
-from notebook_runner import execute_code_in_kernel
-
-def get_kernel_output_as_json(results: list) -> str:
-    """Finds the last text output from the kernel and returns it."""
-    text_output = ""
-    # Look for the last non-empty text result from the kernel
-    for result in reversed(results):
-        if result.get('text', '').strip():
-            text_output = result['text'].strip()
-            break
-    return text_output
+from approximate import (
+    choose_row_groups, estimate_result, replicate_code, row_group_load_code, sample_load_code
+)
+from aggregations import (
+    dataset_lock, normalize_aggregates, read_aggregation, refresh_aggregation, refresh_aggregations
+)
+from blob_store import collect_garbage, release_blob, store_upload
+from code_analysis import merge_plans, projection_plan
+from downsampling import reduce_for_chart
+from ingestion import ingest_csv, ingest_segment, load_expression
+from profiling import profile_dataset
+from llm_cache import get_llm_cache
+from llm_providers import CircuitOpen, ProviderError, get_provider_pool
+from llm_service import (
+    aggregation_prompt, clean_response, generate_aggregation_code, generate_visualization_code, stream_aggregation_code
+)
+from notebook_runner import (
+    DuplicateExecutionId, ExecutionCancelled, cancel_execution,
+    describe_session_tables, execute_code_async, refresh_project_session,
+    runtime_stats, shutdown_runtime, start_runtime, warm_up
+)
+from kernel_pool import KernelPoolExhausted
+from result_cache import cache_key, get_result_cache, is_cacheable
+from result_store import (
+    ARROW_MEDIA_TYPE, chart_writer_code, clone_result, code_fingerprint, expire_results, inline_result_json,
+    iter_result_json, load_result_meta, new_result_id, pop_chart_json, read_result_table, remove_result,
+    result_exists, result_expired, result_loader_code, result_path, result_to_json, result_writer_code,
+    save_result_meta, strip_figure_output, write_result_table
+)
+from result_views import result_page
+from scheduler import SchedulerFull
+from schema_index import select_schema
+from sql_engine import sql_query_code
 
 def to_snake_case(name: str) -> str:
     """Converts a string to snake_case and removes file extension."""
@@ -57,6 +96,161 @@ def to_snake_case(name: str) -> str:
     s = re.sub(r'(?<!^)(?=[A-Z])', '_', s).lower() # Handle CamelCase
     return re.sub(r'[^a-zA-Z0-9_]', '', s) # Remove invalid characters
 
+def dataset_source(ds: Dataset):
+    """
+    The file kernels load a dataset from: its Parquet copy when there is one.
+    A dataset with appended rows is a list of Parquet files instead.
+    """
+    source = ds.parquet_path or ds.file_path
+    if ds.segments:
+        return [source, *(segment.file_path for segment in ds.segments)]
+    return source
+
+def dataset_tables(datasets: list) -> dict:
+    """Maps each dataset's table_name to the file it is loaded from."""
+    return {ds.table_name: dataset_source(ds) for ds in datasets}
+
+async def get_owned_project(session: AsyncSession, project_id: int, user: User) -> Project:
+    """
+    Loads a project with its datasets and their schema, profile and segments,
+    raising 404 unless `user` owns it. The relationships are loaded eagerly,
+    with one query each, whatever the number of datasets.
+    """
+    statement = select(Project).where(Project.id == project_id, Project.owner_id == user.id).options(
+        selectinload(Project.datasets).options(
+            selectinload(Dataset.columns), joinedload(Dataset.profile), selectinload(Dataset.segments)
+        )
+    )
+    project = (await session.exec(statement)).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return project
+
+async def execute_project_code(
+    project_id: int, datasets: list, code: str, use_session: bool, user_id: int, execution_id: str
+) -> list:
+    """
+    Runs code either in the project's persistent session (where the
+    `<table>_df` frames are already loaded) or in a pooled kernel.
+    """
+    if use_session:
+        return await execute_code_async(
+            code, user_id=user_id, project_id=project_id, tables=dataset_tables(datasets), execution_id=execution_id
+        )
+    return await execute_code_async(code, user_id=user_id, execution_id=execution_id)
+
+def inline_rows(requested: Optional[int]) -> int:
+    """
+    How many rows of a result a response embeds: the first page, unless the
+    request asks for more (up to RESULT_INLINE_MAX_ROWS) or fewer.
+    """
+    return RESULT_PAGE_DEFAULT_ROWS if requested is None else min(max(requested, 0), RESULT_INLINE_MAX_ROWS)
+
+def collect_result(result_id: str, owner_id: int, max_rows: int = RESULT_PAGE_DEFAULT_ROWS, **extra) -> dict:
+    """
+    Registers a result written by the kernel and returns the fields for the
+    API response, with the first `max_rows` rows inline.
+    """
+    meta = save_result_meta(result_id, owner_id, **extra)
+    datatable_json, truncated = inline_result_json(result_id, max_rows)
+    return {
+        "result_id": result_id,
+        "row_count": meta["row_count"],
+        "expires_at": meta["expires_at"],
+        "truncated": truncated,
+        "datatable_json": datatable_json,
+    }
+
+def owned_result_meta(result_id: str, owner_id: int) -> Optional[dict]:
+    """The metadata of a stored result, or None if it does not exist or belongs to someone else."""
+    try:
+        meta = load_result_meta(result_id)
+    except ValueError:
+        return None
+    if not meta or meta["owner_id"] != owner_id or result_expired(meta) or not result_exists(result_id):
+        return None
+    return meta
+
+def dataset_version(ds: Dataset) -> str:
+    """
+    Identifies the content of a dataset: its blob hash (plus the last
+    appended segment), or the file's size and mtime.
+    """
+    if ds.content_hash:
+        return f"{ds.content_hash}+{ds.segments[-1].id}" if ds.segments else ds.content_hash
+    path = ds.parquet_path or ds.file_path
+    try:
+        stat = os.stat(path)
+        return f"{path}:{stat.st_mtime_ns}:{stat.st_size}"
+    except OSError:
+        return path
+
+def result_cache_key(datasets: list, aggregation_code: str, language: QueryLanguage, sql_engine: Optional[SqlEngine]) -> tuple:
+    """
+    The result cache key for an aggregation and the dataset versions it
+    covers. The key is None if the result must not be cached.
+    """
+    if get_result_cache() is None or not is_cacheable(aggregation_code):
+        return None, {}
+    used_tables = load_plans(datasets, aggregation_code, language)[0]
+    versions = {ds.table_name: dataset_version(ds) for ds in datasets if ds.table_name in used_tables}
+    engine = (sql_engine or SqlEngine(SQL_ENGINE)).value if language == "sql" else None
+    return cache_key(code_fingerprint(language, aggregation_code), versions, engine), versions
+
+def cached_result(key, owner_id: int, **extra) -> Optional[dict]:
+    """
+    On a cache hit, registers a copy of the cached result for `owner_id` and
+    returns its response fields; None on a miss.
+    """
+    cache = get_result_cache()
+    entry = cache.get(key) if cache is not None and key else None
+    if entry is None:
+        return None
+    if not result_exists(entry["result_id"]):
+        cache.discard(key)  # The result store already dropped it
+        return None
+    return collect_result(clone_result(entry["result_id"]), owner_id, **extra)
+
+def cache_result(key, versions: dict, result_id: str):
+    """
+    Caches a result under `key`. The cache gets a link of its own, which it
+    deletes on eviction; the user's result keeps its own expiry. A link left
+    behind by a restarted in-memory cache is unregistered, so expire_results()
+    removes it after RESULT_TTL.
+    """
+    cache = get_result_cache()
+    if cache is not None and key:
+        cache.put(key, clone_result(result_id), os.path.getsize(result_path(result_id)), versions)
+
+def invalidate_cached_results(version: str):
+    """Forgets cached results computed from a dataset version that was replaced."""
+    cache = get_result_cache()
+    if cache is not None:
+        removed = cache.invalidate_version(version)
+        print(f"Dropped {removed} cached results for replaced data {version}")
+
+async def run_until_disconnected(http_request: Request, coro):
+    """
+    Awaits `coro`, cancelling it (and so interrupting its kernel) if the
+    client goes away before the result is ready.
+    """
+    task = asyncio.ensure_future(coro)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=1.0)
+        if done:
+            return task.result()
+        if await http_request.is_disconnected():
+            task.cancel()
+            raise ExecutionCancelled("Client disconnected")
+
+async def sweep_expired_results():
+    """Deletes expired query results every RESULT_SWEEP_INTERVAL seconds."""
+    while True:
+        removed = await run_in_threadpool(expire_results)
+        if removed:
+            print(f"Removed {removed} expired result(s)")
+        await asyncio.sleep(RESULT_SWEEP_INTERVAL)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
@@ -65,12 +259,19 @@ async def lifespan(app: FastAPI):
     """
     print("Creating database engine...")
     
-    engine = create_engine(DATABASE_URL, echo=True) 
-    db.engine = engine
-    SQLModel.metadata.create_all(engine)
+    engine, _ = create_engines(DATABASE_URL)
+    upgrade_schema(engine)
+    collect_garbage(engine)
+
+    print("Warming up kernel pool...")
+    start_runtime()
+    sweeper = asyncio.create_task(sweep_expired_results())
     
     yield
     
+    sweeper.cancel()
+    shutdown_runtime()
+    await dispose_engines()
     print("Database engine closed.")
 
 
@@ -85,29 +286,122 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "Link", "X-Next-Cursor"],
 )
 
 
+@app.exception_handler(KernelPoolExhausted)
+def kernel_pool_exhausted_handler(request, exc: KernelPoolExhausted):
+    """All kernels are busy; ask the client to retry instead of failing hard."""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": f"Execution capacity exhausted: {exc}"},
+        headers={"Retry-After": "5"},
+    )
+
+@app.exception_handler(ExecutionCancelled)
+def execution_cancelled_handler(request, exc: ExecutionCancelled):
+    return JSONResponse(status_code=status.HTTP_409_CONFLICT, content={"detail": str(exc)})
+
+@app.exception_handler(DuplicateExecutionId)
+def duplicate_execution_handler(request, exc: DuplicateExecutionId):
+    return JSONResponse(status_code=status.HTTP_409_CONFLICT, content={"detail": str(exc)})
+
+@app.exception_handler(ProviderError)
+def provider_error_handler(request, exc: ProviderError):
+    """The LLM provider failed, or is skipped after failing repeatedly."""
+    headers = {"Retry-After": str(exc.retry_after)} if isinstance(exc, CircuitOpen) else None
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE if isinstance(exc, CircuitOpen) else status.HTTP_502_BAD_GATEWAY
+    return JSONResponse(status_code=status_code, content={"detail": str(exc)}, headers=headers)
+
+@app.exception_handler(SchedulerFull)
+def scheduler_full_handler(request, exc: SchedulerFull):
+    """The execution queue (or this user's share of it) is full."""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[int]:
+    if cursor is None:
+        return None
+    try:
+        return int(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def keyset_page(
+    session: AsyncSession, statement, key, limit: int, cursor: Optional[str], request: Request, response: Response,
+) -> list:
+    """
+    One page of `statement` in `key` order, starting after `cursor` (the key
+    of the last item of the previous page), so each page is an index range
+    scan however deep it is. If there are more, the next page's cursor is
+    sent as X-Next-Cursor and in a Link rel="next" header.
+    """
+    after = parse_cursor(cursor)
+    if after is not None:
+        statement = statement.where(key > after)
+    items = (await session.exec(statement.order_by(key).limit(limit + 1))).all()
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = str(getattr(items[-1], key.key))
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+    return items
+
+def project_validators(project_id: int, updated_at: datetime) -> tuple:
+    """The ETag and Last-Modified time of a project's representation."""
+    if updated_at.tzinfo is None:  # SQLite hands back naive UTC times
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return f'"project-{project_id}-{int(updated_at.timestamp() * 1_000_000)}"', updated_at
+
+def not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    """Whether the client's copy is current, by If-None-Match or else If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return since.tzinfo is not None and last_modified.replace(microsecond=0) <= since
+    return False
+
+
 # --- API Endpoints ---
 
 @app.get("/api")
 def read_root():
     """A simple endpoint for health checks."""
-    return {"status": "ok"}
+    cache = get_result_cache()
+    llm_cache = get_llm_cache()
+    return {
+        "status": "ok", **runtime_stats(),
+        "result_cache": cache.stats() if cache is not None else None,
+        "llm_cache": llm_cache.stats() if llm_cache is not None else None,
+        "llm_providers": get_provider_pool().stats(),
+        "principal_cache": principal_cache.stats(),
+    }
 
 @app.post("/api/token")
-def login_for_access_token(
+async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
     """
     Standard OAuth2 endpoint to log in a user and get an access token.
     """
     # Use select() for modern SQLModel/SQLAlchemy
     statement = select(User).where(User.username == form_data.username)
-    user = session.exec(statement).first()
+    user = (await session.exec(statement)).first()
 
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -123,11 +417,11 @@ def login_for_access_token(
 
 
 @app.post("/api/users/", response_model=User)
-def create_user(user_create: UserCreate, session: Session = Depends(get_session)):
+async def create_user(user_create: UserCreate, session: AsyncSession = Depends(get_async_session)):
     """
     Create a new user. The password will be hashed before storing.
     """
-    hashed_password = get_password_hash(user_create.password)
+    hashed_password = await get_password_hash_async(user_create.password)
     user = User(
         username=user_create.username,
         email=user_create.email,
@@ -135,18 +429,23 @@ def create_user(user_create: UserCreate, session: Session = Depends(get_session)
     )
 
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    await session.commit()
+    await session.refresh(user)
     return user
 
 @app.get("/api/users/", response_model=list[User])
-def read_users(session: Session = Depends(get_session)):
+async def read_users(
+    request: Request,
+    response: Response,
+    limit: int = Query(LIST_PAGE_DEFAULT_ITEMS, ge=1, le=LIST_PAGE_MAX_ITEMS),
+    cursor: Optional[str] = None,
+    session: AsyncSession = Depends(get_async_session),
+):
     """
-    Retrieve all users from the database.
+    Retrieve the users from the database, a page at a time (see keyset_page).
     (This should be a protected endpoint in a real app).
     """
-    users = session.exec(select(User)).all()
-    return users
+    return await keyset_page(session, select(User), User.id, limit, cursor, request, response)
 
 @app.get("/api/users/me", response_model=User)
 def read_users_me(current_user: User = Depends(get_current_user)):
@@ -156,10 +455,10 @@ def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
 
 @app.post("/api/projects/", response_model=ProjectRead)
-def create_project(
+async def create_project(
     project: ProjectCreate,
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
     """
     Create a new project for the currently authenticated user.
@@ -168,27 +467,30 @@ def create_project(
     new_project = Project.from_orm(project, update={'owner_id': current_user.id})
     
     session.add(new_project)
-    session.commit()
-    session.refresh(new_project)
+    await session.commit()
+    await session.refresh(new_project)
     return new_project
 
 @app.get("/api/projects/", response_model=list[ProjectRead])
-def read_projects(
+async def read_projects(
+    request: Request,
+    response: Response,
+    limit: int = Query(LIST_PAGE_DEFAULT_ITEMS, ge=1, le=LIST_PAGE_MAX_ITEMS),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
     """
-    Retrieve all projects owned by the currently authenticated user.
+    Retrieve the projects owned by the currently authenticated user, a page
+    at a time (see keyset_page), through the (owner_id, id) index.
     """
-    projects = session.exec(select(Project).where(Project.owner_id == current_user.id)).all()
-    return projects
-
-# Define the upload directory
-UPLOAD_DIRECTORY = "/app/uploads"
+    statement = select(Project).where(Project.owner_id == current_user.id)
+    return await keyset_page(session, statement, Project.id, limit, cursor, request, response)
 
 @app.post("/api/projects/{project_id}/upload-dataset/", response_model=Dataset)
 def upload_dataset(
     project_id: int,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     description: str = Form(""),
     current_user: User = Depends(get_current_user),
@@ -205,213 +507,1092 @@ def upload_dataset(
     # Generate a clean table name from the filename
     clean_table_name = to_snake_case(file.filename)
 
-    # Define the file path and save the file
-    os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
-    file_path = os.path.join(UPLOAD_DIRECTORY, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    # Create a new Dataset record in the database
-    new_dataset = Dataset(
-        file_name=file.filename,
-        file_path=file_path,
-        description=description,
-        table_name=clean_table_name,  # Save the clean name
-        project_id=project.id,
-    )
-    session.add(new_dataset)
+    # Stream the file into the content-addressed store; identical content is stored once
+    blob, _ = store_upload(session, file.file)
+    content_hash, file_path, parquet_path = blob.content_hash, blob.file_path, blob.parquet_path
+
+    # If this content was uploaded before, reuse its Parquet copy, schema and profile
+    source = session.exec(select(Dataset).where(Dataset.content_hash == content_hash)).first()
+    profile_json = sample_path = None
+    if source is not None:
+        columns = [(col.name, col.dtype) for col in sorted(source.columns, key=lambda c: c.position)]
+        if source.profile is not None and source.profile.status == "ready" and not source.segments:
+            profile_json, sample_path = source.profile.profile_json, source.profile.sample_path
+    # The reference is committed now, so that no lock is held while a new file is converted
     session.commit()
-    session.refresh(new_dataset)
+
+    try:
+        if source is None:
+            parquet_path, columns = ingest_csv(file_path)
+
+        # Uploading a table name the project already has replaces that dataset, in step with appends to it
+        replaced_id = session.exec(
+            select(Dataset.id).where(Dataset.project_id == project.id, Dataset.table_name == clean_table_name)
+        ).first()
+        with ExitStack() as locked:
+            dataset = locked.enter_context(dataset_lock(session, replaced_id)) if replaced_id else None
+            released_hash = None
+            replaced_segments = []
+            if dataset is None:
+                dataset = Dataset(table_name=clean_table_name, project_id=project.id)  # Save the clean name
+            else:
+                if dataset.content_hash and (dataset.content_hash != content_hash or dataset.segments):
+                    released_hash = dataset_version(dataset)
+                if dataset.content_hash:
+                    release_blob(session, dataset.content_hash)
+                # Rows appended to the old version go with it
+                replaced_segments = [segment.file_path for segment in dataset.segments]
+                dataset.segments = []
+
+            dataset.file_name = file.filename
+            dataset.file_path = file_path
+            dataset.parquet_path = parquet_path
+            dataset.content_hash = content_hash
+            dataset.description = description
+            dataset.columns = [
+                DatasetColumn(position=position, name=name, dtype=dtype)
+                for position, (name, dtype) in enumerate(columns)
+            ]
+            dataset.profile = (
+                DatasetProfile(status="ready", profile_json=profile_json, sample_path=sample_path) if profile_json else None
+            )
+            if source is None:
+                blob = session.get(Blob, content_hash)
+                blob.parquet_path = parquet_path
+                session.add(blob)
+            project.updated_at = utc_now()
+            session.add(dataset)
+            session.add(project)
+            session.commit()
+    except BaseException:
+        # The dataset was not saved: give back the reference taken above
+        session.rollback()
+        release_blob(session, content_hash)
+        session.commit()
+        raise
+    session.refresh(dataset)
+
+    # If the project has a live kernel session, reload just the changed table
+    session.refresh(project)
+    background_tasks.add_task(refresh_project_session, project.id, dataset_tables(project.datasets))
+    # Column statistics are computed after the response has been sent
+    if profile_json is None:
+        background_tasks.add_task(profile_dataset, session.get_bind(), dataset.id)
+    if released_hash:
+        background_tasks.add_task(collect_garbage, session.get_bind())
+        background_tasks.add_task(invalidate_cached_results, released_hash)
+    if replaced_segments:
+        background_tasks.add_task(remove_files, replaced_segments)
+    if dataset.aggregations:
+        background_tasks.add_task(refresh_aggregations, session.get_bind(), dataset.id, True)
     
-    return new_dataset
+    return dataset
+
+def remove_files(paths: list):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def owned_dataset(session: Session, dataset_id: int, user: User) -> Dataset:
+    """Loads a dataset, raising 404 unless `user` owns its project."""
+    dataset = session.get(Dataset, dataset_id)
+    if not dataset or dataset.project.owner_id != user.id:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    return dataset
+
+@app.post("/api/datasets/{dataset_id}/append")
+def append_to_dataset(
+    dataset_id: int,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    """
+    Appends the rows of a CSV file to a dataset. The rows must have the
+    dataset's columns and fit their types; they are stored as a new Parquet
+    segment next to the original upload, and saved aggregations are updated
+    from the new rows alone.
+    """
+    dataset = owned_dataset(session, dataset_id, current_user)
+    if not dataset.parquet_path:
+        raise HTTPException(status_code=400, detail="This dataset has no stored schema; upload it again to append to it")
+
+    segment_dir = os.path.join(UPLOAD_DIRECTORY, "segments", str(dataset.id))
+    os.makedirs(segment_dir, exist_ok=True)
+    segment_name = uuid.uuid4().hex
+    csv_path = os.path.join(segment_dir, f"{segment_name}.csv")
+    segment_path = os.path.join(segment_dir, f"{segment_name}.parquet")
+    try:
+        with open(csv_path, "wb") as f:
+            shutil.copyfileobj(file.file, f)
+        row_count = ingest_segment(csv_path, segment_path, pq.read_schema(dataset.parquet_path))
+    except ValueError as e:
+        remove_files([segment_path])
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        remove_files([csv_path])
+    if row_count == 0:
+        remove_files([segment_path])
+        raise HTTPException(status_code=400, detail="The file has no rows to append")
+
+    # The position, the new segment and the aggregations it updates are written as one step per dataset
+    schema_path = dataset.parquet_path
+    with dataset_lock(session, dataset_id) as dataset:
+        if dataset is None or dataset.parquet_path != schema_path:
+            remove_files([segment_path])
+            raise HTTPException(status_code=409, detail="The dataset was replaced during the append; append the rows again")
+        previous_version = dataset_version(dataset)
+        position = dataset.segments[-1].position + 1 if dataset.segments else 1
+        segment = DatasetSegment(position=position, file_path=segment_path, row_count=row_count, dataset_id=dataset.id)
+        dataset.segments.append(segment)
+        try:
+            session.flush()
+            for aggregation in dataset.aggregations:
+                refresh_aggregation(dataset, aggregation)
+                session.add(aggregation)
+            session.commit()
+        except IntegrityError:
+            # Another worker took the position first
+            remove_files([segment_path])
+            raise HTTPException(status_code=409, detail="Another append to this dataset is in progress; try again")
+    session.refresh(dataset)
+
+    project = dataset.project
+    background_tasks.add_task(refresh_project_session, project.id, dataset_tables(project.datasets))
+    background_tasks.add_task(invalidate_cached_results, previous_version)
+    background_tasks.add_task(profile_dataset, session.get_bind(), dataset.id)
+    return {
+        "dataset_id": dataset.id,
+        "segment_id": segment.id,
+        "position": segment.position,
+        "row_count": row_count,
+        "total_row_count": sum(s.row_count for s in dataset.segments) + pq.ParquetFile(dataset.parquet_path).metadata.num_rows,
+        "aggregations": [aggregation_fields(aggregation, with_result=False) for aggregation in dataset.aggregations],
+    }
+
+def aggregation_fields(aggregation: SavedAggregation, with_result: bool = True) -> dict:
+    fields = {
+        "id": aggregation.id,
+        "dataset_id": aggregation.dataset_id,
+        "name": aggregation.name,
+        "group_by": json.loads(aggregation.group_by_json),
+        "aggregates": json.loads(aggregation.aggregates_json),
+        "status": aggregation.status,
+        "error": aggregation.error,
+        "applied_position": aggregation.applied_position,
+    }
+    if with_result:
+        result = read_aggregation(aggregation)
+        fields["row_count"] = result.num_rows if result is not None else None
+        fields["datatable_json"] = result_to_json(result) if result is not None else None
+    return fields
+
+@app.post("/api/datasets/{dataset_id}/aggregations")
+def create_saved_aggregation(
+    dataset_id: int,
+    request: SavedAggregationCreate,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    """
+    Saves a group-by aggregation (sum, count, min, max, mean) over a dataset
+    and computes it. Appends then update it incrementally.
+    """
+    dataset = owned_dataset(session, dataset_id, current_user)
+    if not dataset.parquet_path:
+        raise HTTPException(status_code=400, detail="This dataset has no stored schema; upload it again to aggregate it")
+    try:
+        specs = normalize_aggregates(
+            dataset_schema(dataset), request.group_by, [aggregate.dict() for aggregate in request.aggregates]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    aggregation = SavedAggregation(
+        name=request.name, group_by_json=json.dumps(request.group_by), aggregates_json=json.dumps(specs),
+        dataset_id=dataset.id,
+    )
+    session.add(aggregation)
+    session.commit()
+    session.refresh(aggregation)
+    with dataset_lock(session, dataset_id) as dataset:
+        refresh_aggregation(dataset, aggregation)
+        session.add(aggregation)
+        session.commit()
+    return aggregation_fields(aggregation)
+
+@app.get("/api/datasets/{dataset_id}/aggregations")
+def list_saved_aggregations(
+    dataset_id: int,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    dataset = owned_dataset(session, dataset_id, current_user)
+    return [aggregation_fields(aggregation, with_result=False) for aggregation in dataset.aggregations]
+
+@app.get("/api/aggregations/{aggregation_id}")
+def read_saved_aggregation(
+    aggregation_id: int,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    """Returns a saved aggregation and its current result."""
+    aggregation = session.get(SavedAggregation, aggregation_id)
+    if not aggregation or aggregation.dataset.project.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Aggregation not found")
+    return aggregation_fields(aggregation)
+
+def table_context(ds: Dataset, session_dtypes: dict = None) -> Optional[dict]:
+    """
+    The LLM context for one dataset, or None if it cannot be read. Column
+    types come from the schema stored at upload time, or from the session's
+    frames when `session_dtypes` is given.
+    """
+    try:
+        if session_dtypes is not None:
+            columns_with_types = session_dtypes[ds.table_name]
+        elif ds.columns:
+            columns_with_types = {col.name: col.dtype for col in sorted(ds.columns, key=lambda c: c.position)}
+        else:
+            # Datasets uploaded before schemas were recorded
+            df = pd.read_csv(ds.file_path)
+            columns_with_types = {col: str(dtype) for col, dtype in df.dtypes.items()}
+        profile = {}
+        if ds.profile is not None and ds.profile.status == "ready":
+            profile = json.loads(ds.profile.profile_json)
+        return {
+            "table_name": ds.table_name, "variable_name": f"{ds.table_name}_df",
+            "description": ds.description, "columns_with_types": columns_with_types,
+            "row_count": profile.get("row_count"), "column_profiles": profile.get("columns", {}),
+        }
+    except Exception as e:
+        print(f"Could not read or process {ds.file_name}: {e}")
+        return None
+
+async def build_tables_context(datasets: list, session_dtypes: dict = None) -> list:
+    """Collects the LLM context of every dataset, reading their schemas in parallel."""
+    contexts = await asyncio.gather(*(run_in_threadpool(table_context, ds, session_dtypes) for ds in datasets))
+    return [context for context in contexts if context is not None]
+
+def prefetch_files(datasets: list):
+    """Asks the OS to start reading the datasets' files into the page cache, without waiting for it."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for ds in datasets:
+        source = dataset_source(ds)
+        for path in source if isinstance(source, list) else [source]:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+
+class StageTimings:
+    """Wall-clock milliseconds of each stage of a request, reported as `timings`."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    async def run(self, name: str, awaitable):
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.stages[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    def report(self) -> dict:
+        return {**self.stages, "total": round((time.perf_counter() - self.started) * 1000, 1)}
+
+def dataset_schema(ds: Dataset) -> list:
+    return [col.name for col in sorted(ds.columns, key=lambda c: c.position)]
+
+def load_plans(datasets: list, code: str, language: QueryLanguage, chart_code: str = None) -> list:
+    """
+    The ways to load the datasets for `code`, in the order to try them: only
+    the tables and columns the code (and its Python chart code) reads, then
+    every table in full.
+    """
+    schemas = {ds.table_name: dataset_schema(ds) for ds in datasets if ds.columns}
+    plan = projection_plan(code, language, schemas)
+    if chart_code:
+        plan = merge_plans(plan, projection_plan(chart_code, QueryLanguage.python, schemas))
+    full_plan = {ds.table_name: None for ds in datasets}
+    for ds in datasets:
+        if not ds.columns and ds.table_name in plan:
+            plan[ds.table_name] = None  # No stored schema to project with
+    return [plan, full_plan] if plan != full_plan else [full_plan]
+
+def aggregation_script(
+    datasets: list, plan: Optional[dict], aggregation_code: str, language: QueryLanguage, imports: list,
+    sql_engine: SqlEngine, chart_tables: frozenset = frozenset(),
+) -> str:
+    """
+    Prepends the imports and the lines loading each dataset in `plan` to the
+    aggregation code. With no plan the frames are already loaded in a session.
+    For SQL, DuckDB scans the files itself, so frames are only loaded if the
+    query falls back to pandasql or `chart_tables` (the chart code) needs them.
+    """
+    load_lines = {}
+    sql_tables = {ds.table_name: None for ds in datasets}
+    if plan is not None:
+        for ds in datasets:
+            if ds.table_name not in plan:
+                continue
+            columns = plan[ds.table_name]
+            if columns is not None and not columns:
+                columns = dataset_schema(ds)[:1]  # Only the row count matters
+            load_lines[ds.table_name] = f"{ds.table_name}_df = {load_expression(dataset_source(ds), columns)}"
+        sql_tables = {ds.table_name: dataset_source(ds) for ds in datasets if ds.table_name in plan}
+
+    if language == "sql":
+        eager = [line for name, line in load_lines.items() if name in chart_tables]
+        lazy = [line for name, line in load_lines.items() if name not in chart_tables]
+        return "\n".join([*imports, *eager, sql_query_code(aggregation_code, sql_engine, sql_tables, lazy)])
+    return "\n".join([*imports, *load_lines.values(), aggregation_code])
+
+def aggregation_scripts(
+    datasets: list, aggregation_code: str, language: QueryLanguage, use_session: bool, imports: list,
+    chart_code: str = None, sql_engine: Optional[SqlEngine] = None,
+) -> list:
+    """
+    The scripts to try in turn for an aggregation. The first loads only the
+    columns the aggregation and chart code read; if it fails, the next loads
+    everything. Sessions already hold the frames.
+    """
+    sql_engine = sql_engine or SqlEngine(SQL_ENGINE)
+    if use_session:
+        return [aggregation_script(datasets, None, aggregation_code, language, imports, sql_engine)]
+    chart_tables = frozenset()
+    if chart_code:
+        chart_tables = frozenset(ds.table_name for ds in datasets if f"{ds.table_name}_df" in chart_code)
+    return [
+        aggregation_script(datasets, plan, aggregation_code, language, imports, sql_engine, chart_tables)
+        for plan in load_plans(datasets, aggregation_code, language, chart_code)
+    ]
+
+@app.get("/api/datasets/{dataset_id}/profile")
+def read_dataset_profile(
+    dataset_id: int,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    """
+    Returns the column statistics of a dataset. The status is "pending" while
+    the background profiling after the upload is still running.
+    """
+    dataset = owned_dataset(session, dataset_id, current_user)
+    profile = dataset.profile
+    if profile is None:
+        return {"dataset_id": dataset.id, "status": "pending", "profile": None}
+    return {
+        "dataset_id": dataset.id,
+        "status": profile.status,
+        "error": profile.error,
+        "profile": json.loads(profile.profile_json) if profile.profile_json else None,
+    }
 
 @app.post("/api/projects/{project_id}/query")
-def query_project(
+async def query_project(
     project_id: int,
     request: QueryRequest,
+    http_request: Request,
+    x_execution_id: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
-    project = session.get(Project, project_id)
-    if not project or project.owner_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Project not found")
+    """
+    Generates aggregation code for a question and executes it. Pass an
+    X-Execution-Id header to be able to cancel the run via DELETE /api/executions/{id}.
+
+    With `approximate`, the response is NDJSON: estimates with error bounds
+    from the largest table's row sample, then from growing fractions of it,
+    and finally the exact answer (stage "exact").
+    """
+    execution_id = x_execution_id or uuid.uuid4().hex
+    timings = StageTimings()
+    project = await timings.run("project", get_owned_project(session, project_id, current_user))
     datasets = project.datasets
     if not datasets:
         raise HTTPException(status_code=400, detail="No datasets in this project to query.")
 
-    tables_context = []
-    code_preamble = ["import pandas as pd", "from pandasql import sqldf"]
-    for ds in datasets:
+    use_session, tables_context, prompt_report = await prepare_query(project, request, current_user.id, timings)
+
+    aggregation_code = await timings.run("llm", run_in_threadpool(
+        generate_aggregation_code,
+        question=request.question, tables_context=tables_context, language=request.language, provider=request.provider, model=request.model,
+        use_cache=not request.bypass_llm_cache,
+    ))
+
+    response = {
+        "execution_id": execution_id, "language": request.language, "aggregation_code": aggregation_code,
+        "prompt": prompt_report,
+    }
+    if request.approximate:
+        stages = await run_in_threadpool(
+            approximate_stages, datasets, aggregation_code, request.language, request.sql_engine
+        )
+
+        async def stream():
+            # A failure ends the stream with a line naming the stage it happened in
+            current = None
+            try:
+                for stage in stages:
+                    current = stage["stage"]
+                    fields = await run_approximate_stage(http_request, stage, current_user.id, execution_id)
+                    yield json.dumps({**response, **fields}) + "\n"
+                current = "exact"
+                fields = await run_aggregation(
+                    http_request, project, datasets, aggregation_code, request, use_session, current_user.id, execution_id
+                )
+                yield json.dumps({**response, "stage": "exact", "approximate": False, **fields}) + "\n"
+            except HTTPException as e:
+                yield json.dumps({**response, "stage": current, "error": e.detail}) + "\n"
+            except (ProviderError, SchedulerFull, KernelPoolExhausted, ExecutionCancelled, DuplicateExecutionId) as e:
+                yield json.dumps({**response, "stage": current, "error": str(e)}) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    fields = await timings.run("execution", run_aggregation(
+        http_request, project, datasets, aggregation_code, request, use_session, current_user.id, execution_id
+    ))
+    return {**response, **fields, "timings": timings.report()}
+
+_warm_ups = set()  # Running warm-up tasks, referenced until they finish
+
+async def warm_up_execution(project: Project, use_session: bool, user_id: int):
+    """Gets the project's data and a kernel ready while the code is being generated; failures only cost the head start."""
+    try:
+        await run_in_threadpool(prefetch_files, project.datasets)
+        if use_session:
+            await warm_up(user_id, project.id, dataset_tables(project.datasets))
+        else:
+            await warm_up(user_id)
+    except Exception as e:
+        print(f"Could not warm up execution for project {project.id}: {e}")
+
+def start_warm_up(project: Project, use_session: bool, user_id: int, timings: StageTimings):
+    """
+    Starts loading the data for the run (into the project's session, or into
+    the page cache for a pooled kernel) in the background, so that it goes on
+    alongside the LLM call.
+    """
+    warm = asyncio.ensure_future(timings.run("warm_up", warm_up_execution(project, use_session, user_id)))
+    _warm_ups.add(warm)
+    warm.add_done_callback(_warm_ups.discard)
+
+async def read_tables_context(project: Project, use_session: bool, user_id: int, timings: StageTimings) -> list:
+    """The LLM context of every table of the project (see build_tables_context)."""
+    session_dtypes = None
+    if use_session and not all(ds.columns for ds in project.datasets):
+        # Some datasets have no stored schema: read the dtypes from the session's frames
+        session_dtypes = await timings.run(
+            "session_schema", describe_session_tables(user_id, project.id, dataset_tables(project.datasets))
+        )
+    return await timings.run("schema", build_tables_context(project.datasets, session_dtypes))
+
+def question_schema(project: Project, request: QueryRequest, tables_context: list) -> tuple:
+    """The tables the prompt for the question describes (see select_schema). Returns (tables_context, prompt_report)."""
+    tables_context, prompt_report = select_schema(
+        request.question, tables_context, lambda context: aggregation_prompt(request.question, context, request.language),
+    )
+    if prompt_report["tokens_after"] < prompt_report["tokens_before"]:
+        print(
+            f"Prompt for project {project.id} cut from ~{prompt_report['tokens_before']} to "
+            f"~{prompt_report['tokens_after']} tokens ({prompt_report['tables_after']}/{prompt_report['tables_before']} "
+            f"tables, {prompt_report['columns_after']}/{prompt_report['columns_before']} columns)"
+        )
+    return tables_context, prompt_report
+
+async def prepare_query(project: Project, request: QueryRequest, user_id: int, timings: StageTimings) -> tuple:
+    """
+    Whether to run in the project's session, and the tables the prompt for
+    the question describes. Returns (use_session, tables_context, prompt_report).
+    Getting the data ready for the run starts here (see start_warm_up).
+    """
+    use_session = KERNEL_SESSION_MODE if request.use_session is None else request.use_session
+    start_warm_up(project, use_session, user_id, timings)
+    tables_context = await read_tables_context(project, use_session, user_id, timings)
+    tables_context, prompt_report = await timings.run(
+        "prompt", run_in_threadpool(question_schema, project, request, tables_context)
+    )
+    return use_session, tables_context, prompt_report
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/projects/{project_id}/query/stream")
+async def stream_query_project(
+    project_id: int,
+    request: QueryRequest,
+    http_request: Request,
+    x_execution_id: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """
+    query_project as Server-Sent Events, so the code shows up while it is
+    being written: a `prompt` event (the prompt size report), a `code` event
+    for each piece of code as the provider produces it, a `status` event once
+    the code is complete and runs, then `result` (the fields query_project
+    returns) or `error`. `approximate` is not supported here.
+    """
+    execution_id = x_execution_id or uuid.uuid4().hex
+    timings = StageTimings()
+    project = await timings.run("project", get_owned_project(session, project_id, current_user))
+    datasets = project.datasets
+    if not datasets:
+        raise HTTPException(status_code=400, detail="No datasets in this project to query.")
+    use_session, tables_context, prompt_report = await prepare_query(project, request, current_user.id, timings)
+
+    async def events():
+        yield sse_event("prompt", {"execution_id": execution_id, **prompt_report})
         try:
-            df = pd.read_csv(ds.file_path)
-            columns_with_types = {col: str(dtype) for col, dtype in df.dtypes.items()}
-            tables_context.append({
-                "table_name": ds.table_name, "variable_name": f"{ds.table_name}_df",
-                "description": ds.description, "columns_with_types": columns_with_types
+            pieces = []
+            code_stream = stream_aggregation_code(
+                request.question, tables_context, request.language, request.provider, request.model,
+                use_cache=not request.bypass_llm_cache,
+            )
+            started = time.perf_counter()
+            async for piece in iterate_in_threadpool(code_stream):
+                if not pieces:
+                    timings.stages["llm_first_piece"] = round((time.perf_counter() - started) * 1000, 1)
+                pieces.append(piece)
+                yield sse_event("code", {"delta": piece})
+            timings.stages["llm"] = round((time.perf_counter() - started) * 1000, 1)
+            aggregation_code = clean_response("".join(pieces))
+            yield sse_event("status", {"status": "running", "aggregation_code": aggregation_code})
+            fields = await timings.run("execution", run_aggregation(
+                http_request, project, datasets, aggregation_code, request, use_session, current_user.id, execution_id
+            ))
+            yield sse_event("result", {
+                "execution_id": execution_id, "language": request.language, "aggregation_code": aggregation_code,
+                "prompt": prompt_report, **fields, "timings": timings.report(),
             })
-            code_preamble.append(f"{ds.table_name}_df = pd.read_csv(r'{ds.file_path}')")
-        except Exception as e:
-            print(f"Could not read or process {ds.file_name}: {e}")
-            continue
+        except HTTPException as e:
+            yield sse_event("error", {"detail": e.detail, "status_code": e.status_code})
+        except (ProviderError, SchedulerFull, KernelPoolExhausted, ExecutionCancelled, DuplicateExecutionId) as e:
+            yield sse_event("error", {"detail": str(e)})
 
-    aggregation_code = generate_aggregation_code(
-        question=request.question, tables_context=tables_context, language=request.language, provider=request.provider, model=request.model
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    
-    preamble_str = "\n".join(code_preamble)
-    if request.language == "sql":
-        sql_env_str_list = [f"'{tbl['table_name']}': {tbl['variable_name']}" for tbl in tables_context]
-        sql_env_str = "{" + ", ".join(sql_env_str_list) + "}"
-        clean_agg_code = aggregation_code.replace("'''", "''")
-        full_agg_code = f"{preamble_str}\npysqldf = lambda q: sqldf(q, {sql_env_str})\nsql_query = '''{clean_agg_code}'''\nans_df = pysqldf(sql_query)"
-    else: # Python
-        full_agg_code = f"{preamble_str}\n{aggregation_code}"
-
-    # Execute and convert the final ans_df to JSON
-    code_to_get_json = f"{full_agg_code}\nprint(ans_df.to_json(orient='records'))"
-    execution_results = execute_code_in_kernel(code_to_get_json)
-
-    # Extract the JSON data from the last output
-    json_result_str = get_kernel_output_as_json(execution_results)
-    
-    # Check for errors from the kernel
-    error_output = next((res for res in execution_results if res['type'] == 'error'), None)
+
+@app.post("/api/projects/{project_id}/query-batch")
+async def query_project_batch(
+    project_id: int,
+    requests: List[QueryRequest],
+    http_request: Request,
+    x_execution_id: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """
+    Answers a list of questions about a project, streaming NDJSON: one line
+    per question as soon as it is answered (so not in list order), with its
+    `index` in the list, its execution id (`<X-Execution-Id>-<index>`) and a
+    `status` of "ok" (plus the fields query_project returns) or "error" (plus
+    `detail`), then a last line with status "done" and the counts.
+
+    The project and its tables are read once. Code is generated for up to
+    QUERY_BATCH_LLM_CONCURRENCY questions at a time, within each provider's
+    rate limit. The aggregations run in the project's session, where the data
+    is loaded once for the whole batch, unless a question sets `use_session`
+    to false. `approximate` is not supported here.
+    """
+    if not requests:
+        raise HTTPException(status_code=400, detail="No questions to answer.")
+    if len(requests) > QUERY_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {QUERY_BATCH_MAX} questions can be sent at once.")
+    batch_id = x_execution_id or uuid.uuid4().hex
+    timings = StageTimings()
+    project = await timings.run("project", get_owned_project(session, project_id, current_user))
+    datasets = project.datasets
+    if not datasets:
+        raise HTTPException(status_code=400, detail="No datasets in this project to query.")
+
+    use_sessions = [request.use_session is not False for request in requests]
+    start_warm_up(project, any(use_sessions), current_user.id, timings)
+    tables_context = await read_tables_context(project, any(use_sessions), current_user.id, timings)
+
+    llm_slots = asyncio.Semaphore(QUERY_BATCH_LLM_CONCURRENCY)
+    # A session runs one execution at a time anyway; waiting here keeps the scheduler's slots free
+    execution_slots = {True: asyncio.Semaphore(1), False: asyncio.Semaphore(QUERY_BATCH_EXECUTIONS)}
+
+    async def answer(index: int, request: QueryRequest, use_session: bool) -> dict:
+        started = time.perf_counter()
+        execution_id = f"{batch_id}-{index}"
+        line = {"index": index, "question": request.question, "execution_id": execution_id, "language": request.language}
+        try:
+            context, line["prompt"] = await run_in_threadpool(question_schema, project, request, tables_context)
+            async with llm_slots:
+                line["aggregation_code"] = await run_in_threadpool(
+                    generate_aggregation_code,
+                    question=request.question, tables_context=context, language=request.language,
+                    provider=request.provider, model=request.model, use_cache=not request.bypass_llm_cache,
+                )
+            async with execution_slots[use_session]:
+                fields = await run_aggregation(
+                    http_request, project, datasets, line["aggregation_code"], request, use_session,
+                    current_user.id, execution_id,
+                )
+            line.update(status="ok", **fields)
+        except HTTPException as e:
+            line.update(status="error", detail=e.detail, status_code=e.status_code)
+        except (ProviderError, SchedulerFull, KernelPoolExhausted, ExecutionCancelled, DuplicateExecutionId) as e:
+            line.update(status="error", detail=str(e))
+        line["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return line
+
+    async def stream():
+        tasks = [
+            asyncio.ensure_future(answer(index, request, use_session))
+            for index, (request, use_session) in enumerate(zip(requests, use_sessions))
+        ]
+        answered = {"ok": 0, "error": 0}
+        try:
+            for next_answer in asyncio.as_completed(tasks):
+                line = await next_answer
+                answered[line["status"]] += 1
+                yield json.dumps(line) + "\n"
+            yield json.dumps({"status": "done", **answered, "timings": timings.report()}) + "\n"
+        finally:
+            for task in tasks:  # Nothing is left running if the client goes away
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+async def run_aggregation(
+    http_request: Request, project: Project, datasets: list, aggregation_code: str, request: QueryRequest,
+    use_session: bool, user_id: int, execution_id: str,
+) -> dict:
+    """
+    Runs generated aggregation code over the full data, or serves it from the
+    result cache. Returns the result fields of the response.
+    """
+    # The same code over the same data was run before: serve its stored result
+    code_hash = code_fingerprint(request.language, aggregation_code)
+    key, versions = await run_in_threadpool(
+        result_cache_key, datasets, aggregation_code, request.language, request.sql_engine
+    )
+    max_rows = inline_rows(request.inline_rows)
+    result_fields = await run_in_threadpool(
+        cached_result, key, user_id, max_rows=max_rows, project_id=project.id, code_hash=code_hash
+    )
+    if result_fields is not None:
+        return {**result_fields, "cache": "hit"}
+
+    # Execute and have the kernel write the final ans_df to the result store
+    result_id = new_result_id()
+    scripts = aggregation_scripts(
+        datasets, aggregation_code, request.language, use_session, ["import pandas as pd", "from pandasql import sqldf"],
+        sql_engine=request.sql_engine,
+    )
+    for full_agg_code in scripts:
+        code_to_run = f"{full_agg_code}\n{result_writer_code(result_id)}"
+        execution_results = await run_until_disconnected(http_request, execute_project_code(
+            project.id, datasets, code_to_run, use_session, user_id, execution_id
+        ))
+        # Check for errors from the kernel; a failed column-projected run is retried with full tables
+        error_output = next((res for res in execution_results if res['type'] == 'error'), None)
+        if not error_output:
+            break
     if error_output:
         raise HTTPException(status_code=400, detail=f"Error executing code: {error_output['evalue']}")
 
+    result_fields = await run_in_threadpool(
+        collect_result, result_id, user_id, max_rows=max_rows, project_id=project.id, code_hash=code_hash
+    )
+    await run_in_threadpool(cache_result, key, versions, result_id)
+    return {**result_fields, "cache": "miss"}
+
+def approximate_stages(datasets: list, aggregation_code: str, language: QueryLanguage, sql_engine: Optional[SqlEngine]) -> list:
+    """
+    The scripts that compute approximate answers before the exact one: the
+    largest table the code reads is replaced by its stored row sample, then
+    by random row groups covering each of APPROXIMATE_REFINE_FRACTIONS of
+    it. The other tables are loaded in full. Empty if there is no sample.
+    """
+    plan = load_plans(datasets, aggregation_code, language)[0]
+    samples = {}
+    for ds in datasets:
+        profile = ds.profile
+        if ds.table_name in plan and profile is not None and profile.status == "ready" and profile.sample_path \
+                and os.path.exists(profile.sample_path):
+            samples[ds.table_name] = (ds, json.loads(profile.profile_json)["row_count"])
+    if not samples:
+        return []
+    target, population = max(samples.values(), key=lambda item: item[1])
+    table = target.table_name
+
+    load_lines = ["import numpy as np", "import pandas as pd", "from pandasql import sqldf"]
+    for ds in datasets:
+        if ds.table_name in plan and ds is not target:
+            load_lines.append(f"{ds.table_name}_df = {load_expression(dataset_source(ds), plan[ds.table_name])}")
+    columns = plan[table]
+    if columns is not None and not columns:
+        columns = dataset_schema(target)[:1]  # Only the row count matters
+    if language == "sql":
+        frames = {name: None for name in plan}
+        body = sql_query_code(aggregation_code, sql_engine or SqlEngine(SQL_ENGINE), frames)
+    else:
+        body = aggregation_code
+
+    sample_rows = pq.ParquetFile(target.profile.sample_path).metadata.num_rows
+    stages = [("sample", sample_rows, sample_load_code(table, target.profile.sample_path, columns))]
+    source = dataset_source(target)
+    files = source if isinstance(source, list) else [source]
+    if all(path.endswith(".parquet") for path in files):
+        for fraction in APPROXIMATE_REFINE_FRACTIONS:
+            chosen = choose_row_groups(files, fraction)
+            if chosen is not None and chosen[1] > sample_rows:
+                stages.append((f"rows_{fraction:g}", chosen[1], row_group_load_code(table, chosen[0], columns)))
+    return [
+        {"stage": name, "table": table, "rows": rows, "population": population,
+         "prefix": "\n".join([*load_lines, load_code]), "body": body}
+        for name, rows, load_code in stages
+    ]
+
+async def run_approximate_stage(http_request: Request, stage: dict, user_id: int, execution_id: str) -> dict:
+    """Runs one stage of approximate_stages() and returns its estimates and error bounds."""
+    estimate_id, replicates_id = new_result_id(), new_result_id()
+    code = "\n".join([stage["prefix"], replicate_code(stage["table"], stage["body"], estimate_id, replicates_id)])
+    fields = {
+        "stage": stage["stage"], "approximate": True, "sampled_table": stage["table"],
+        "rows_read": stage["rows"], "fraction": stage["rows"] / stage["population"] if stage["population"] else None,
+    }
+    try:
+        results = await run_until_disconnected(http_request, execute_code_async(code, user_id=user_id, execution_id=execution_id))
+        error_output = next((res for res in results if res['type'] == 'error'), None)
+        if error_output:
+            return {**fields, "error": f"Error executing code: {error_output['evalue']}"}
+        sample = read_result_table(estimate_id).to_pandas()
+        replicates = read_result_table(replicates_id).to_pandas()
+    finally:
+        remove_result(estimate_id)
+        remove_result(replicates_id)
+    scale = stage["population"] / stage["rows"] if stage["rows"] else 1.0
+    estimates, bounds, scaled = await run_in_threadpool(estimate_result, sample, replicates, scale)
     return {
-        "language": request.language,
-        "aggregation_code": aggregation_code,
-        "datatable_json": json_result_str, # Send the structured data
+        **fields,
+        "confidence": APPROXIMATE_CONFIDENCE,
+        "row_count": len(estimates),
+        "datatable_json": estimates.to_json(orient="records"),
+        "bounds_json": bounds.to_json(orient="records") if bounds is not None else None,
+        "scaled_columns": scaled,
     }
 
 @app.get("/api/projects/{project_id}", response_model=ProjectReadWithDatasets)
-def read_project(
+async def read_project(
     project_id: int,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
     """
     Retrieve a single project and its datasets, ensuring it belongs to the current user.
+    The response carries an ETag and Last-Modified; a request whose
+    If-None-Match or If-Modified-Since still matches gets a 304 without the
+    datasets being loaded or anything serialized.
     """
     # This query robustly checks for both the project ID and the correct owner
-    statement = select(Project).where(
-        Project.id == project_id,
-        Project.owner_id == current_user.id
-    )
-    project = session.exec(statement).first()
+    owned = (Project.id == project_id, Project.owner_id == current_user.id)
+    stamp = (await session.exec(select(Project.id, Project.updated_at).where(*owned))).first()
 
     # If the query returns nothing, the project either doesn't exist
     # or doesn't belong to this user, so we raise a 404.
+    if not stamp:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    headers = {}
+    if stamp.updated_at is not None:
+        etag, last_modified = project_validators(project_id, stamp.updated_at)
+        headers = {
+            "ETag": etag, "Last-Modified": format_datetime(last_modified, usegmt=True),
+            "Cache-Control": "private, no-cache",
+        }
+        if not_modified(request, etag, last_modified):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    project = (await session.exec(select(Project).where(*owned).options(selectinload(Project.datasets)))).first()
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
-        
+    response.headers.update(headers)
     return project
 
 
+async def render_chart(http_request: Request, result_id: str, visualization_code: str, user_id: int, execution_id: str) -> tuple:
+    """Runs chart code against a stored result in a pooled kernel. Returns (plot_json, chart_error)."""
+    chart_id = new_result_id()
+    chart_code = "\n".join([
+        "import pandas as pd", "import plotly.express as px",
+        result_loader_code(result_id), visualization_code, chart_writer_code(chart_id),
+    ])
+    chart_results = await run_until_disconnected(
+        http_request, execute_code_async(chart_code, user_id=user_id, execution_id=execution_id)
+    )
+    error_output = next((res for res in chart_results if res['type'] == 'error'), None)
+    plot_json = await run_in_threadpool(pop_chart_json, chart_id)
+    return plot_json, error_output['evalue'] if error_output else None
+
+
 @app.post("/api/projects/{project_id}/run-code")
-def run_code(
+async def run_code(
     project_id: int,
     request: CodeExecutionRequest,
+    http_request: Request,
+    x_execution_id: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
     """
     Executes a given block of user-edited code and returns the structured
     data table as JSON, plus an optional chart.
     """
-    project = session.get(Project, project_id)
-    if not project or project.owner_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Project not found")
+    execution_id = x_execution_id or uuid.uuid4().hex
+    project = await get_owned_project(session, project_id, current_user)
     datasets = project.datasets
     if not datasets:
         raise HTTPException(status_code=400, detail="No datasets in this project to query.")
 
-    code_preamble = ["import pandas as pd", "from pandasql import sqldf", "import plotly.express as px"]
-    for ds in datasets:
-        code_preamble.append(f"{ds.table_name}_df = pd.read_csv(r'{ds.file_path}')")
-    
-    preamble_str = "\n".join(code_preamble)
-    
+    use_session = KERNEL_SESSION_MODE if request.use_session is None else request.use_session
+
     # Split the user's code to see if it contains a chart part
     aggregation_code = request.code
     visualization_code = None
     if "###CHART_CODE###" in request.code:
         parts = request.code.split("###CHART_CODE###")
         aggregation_code = parts[0].strip()
-        visualization_code = parts[1].strip()
-
-    # Always execute the aggregation part to get the data table
-    if request.language == "sql":
-        sql_env_str_list = [f"'{ds.table_name}': {ds.table_name}_df" for ds in datasets]
-        sql_env_str = "{" + ", ".join(sql_env_str_list) + "}"
-        clean_agg_code = aggregation_code.replace("'''", "''")
-        full_agg_code = f"{preamble_str}\npysqldf = lambda q: sqldf(q, {sql_env_str})\nsql_query = '''{clean_agg_code}'''\nans_df = pysqldf(sql_query)"
-    else: # Python
-        full_agg_code = f"{preamble_str}\n{aggregation_code}"
-
-    # --- THIS IS THE FIX ---
-    # We now execute the code and explicitly print the final ans_df as JSON
-    code_to_get_json = f"{full_agg_code}\nprint(ans_df.to_json(orient='records'))"
-    aggregation_results = execute_code_in_kernel(code_to_get_json)
-    datatable_json = get_kernel_output_as_json(aggregation_results)
-
-    # If there was chart code, execute it to get the plot
-    plot_json = None
-    if visualization_code:
-        viz_preamble = f"{preamble_str}\n{aggregation_code}"
-        full_viz_code = f"{viz_preamble}\n{visualization_code}"
-        viz_results = execute_code_in_kernel(full_viz_code)
-        
-        if viz_results:
-            last_result = viz_results[-1]
-            if last_result.get('type') == 'result' and last_result.get('text', '').strip().startswith('{'):
-                plot_json = last_result['text']
-
-    # Check for kernel errors
-    error_output = next((res for res in aggregation_results if res['type'] == 'error'), None)
-    if error_output:
+        visualization_code = strip_figure_output(parts[1].strip())
+    code_hash = code_fingerprint(request.language, aggregation_code)
+    max_rows = inline_rows(request.inline_rows)
+
+    # Only the chart changed: draw it against the already-materialized result.
+    # The same holds when the aggregation is in the result cache.
+    result_fields = None
+    aggregation_reused = False
+    cache_status = "miss"
+    if visualization_code and request.result_id:
+        meta = await run_in_threadpool(owned_result_meta, request.result_id, current_user.id)
+        if meta and meta.get("project_id") == project.id and meta.get("code_hash") == code_hash:
+            datatable_json, truncated = await run_in_threadpool(inline_result_json, request.result_id, max_rows)
+            result_fields = {
+                "result_id": request.result_id, "row_count": meta["row_count"], "expires_at": meta.get("expires_at"),
+                "truncated": truncated, "datatable_json": datatable_json,
+            }
+            aggregation_reused = True
+    key, versions = await run_in_threadpool(
+        result_cache_key, datasets, aggregation_code, request.language, request.sql_engine
+    )
+    if result_fields is None:
+        result_fields = await run_in_threadpool(
+            cached_result, key, current_user.id, max_rows=max_rows, project_id=project.id, code_hash=code_hash
+        )
+        if result_fields is not None:
+            aggregation_reused = True
+            cache_status = "hit"
+
+    if aggregation_reused:
+        plot_json = chart_error = None
+        if visualization_code:
+            plot_json, chart_error = await render_chart(
+                http_request, result_fields["result_id"], visualization_code, current_user.id, execution_id
+            )
+        return {
+            "execution_id": execution_id,
+            "language": request.language,
+            "aggregation_code": request.code,
+            **result_fields,
+            "plot_json": plot_json,
+            "chart_error": chart_error,
+            "aggregation_reused": True,
+            "cache": cache_status,
+        }
+
+    # One execution computes ans_df once, writes it to the result store and,
+    # if there is chart code, draws the chart from the same DataFrame. The
+    # chart code may read the datasets too, so both parts decide what to load.
+    result_id = new_result_id()
+    scripts = aggregation_scripts(
+        datasets, aggregation_code, request.language, use_session,
+        ["import pandas as pd", "from pandasql import sqldf", "import plotly.express as px"],
+        chart_code=visualization_code, sql_engine=request.sql_engine,
+    )
+    for full_agg_code in scripts:
+        code_to_run = f"{full_agg_code}\n{result_writer_code(result_id)}"
+        if visualization_code:
+            code_to_run += f"\n{visualization_code}\n{chart_writer_code(result_id)}"
+        results = await run_until_disconnected(http_request, execute_project_code(
+            project.id, datasets, code_to_run, use_session, current_user.id, execution_id
+        ))
+        # An error before the result was written is an aggregation error (retried
+        # with full tables if columns were projected); after it, a chart error
+        error_output = next((res for res in results if res['type'] == 'error'), None)
+        if not error_output or result_exists(result_id):
+            break
+    if error_output and not result_exists(result_id):
         raise HTTPException(status_code=400, detail=f"Error executing code: {error_output['evalue']}")
+    result_fields = await run_in_threadpool(
+        collect_result, result_id, current_user.id, max_rows=max_rows, project_id=project.id, code_hash=code_hash
+    )
+    await run_in_threadpool(cache_result, key, versions, result_id)
+    plot_json = await run_in_threadpool(pop_chart_json, result_id) if visualization_code else None
 
     return {
+        "execution_id": execution_id,
         "language": request.language,
         "aggregation_code": request.code,
-        "datatable_json": datatable_json,
-        "plot_json": plot_json
+        **result_fields,
+        "plot_json": plot_json,
+        "chart_error": error_output['evalue'] if error_output else None,
+        "aggregation_reused": False,
+        "cache": cache_status,
     }
 
 
+def chart_data(request: VisualizationRequest) -> tuple:
+    """
+    The result to plot for a visualization request, reduced for its chart
+    type if it is too large to plot as it is. Returns (result_id, note,
+    preview_json, rows); result_id is a temporary result unless it is the
+    requested one.
+    """
+    if request.result_id:
+        table = read_result_table(request.result_id)
+    else:  # Older clients send the rows themselves
+        table = pa.Table.from_pandas(pd.read_json(io.StringIO(request.datatable_json), orient="records"), preserve_index=False)
+    columns = [name for name in dict.fromkeys([request.x_axis, request.y_axis, request.legend]) if name]
+    missing = [name for name in columns if name not in table.column_names]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Columns not in the result: {missing}")
+
+    reduced, note = reduce_for_chart(
+        table.select(columns).to_pandas(), request.chart_type, request.x_axis, request.y_axis or None, request.legend
+    )
+    if note is not None:
+        table = pa.Table.from_pandas(reduced, preserve_index=False)
+        result_id = write_result_table(table)
+    elif request.result_id:
+        result_id = request.result_id
+    else:
+        result_id = write_result_table(table)
+    return result_id, note, result_to_json(table, 5), table.num_rows
+
 @app.post("/api/projects/{project_id}/visualize")
-def visualize_data(
+async def visualize_data(
     project_id: int,
     request: VisualizationRequest,
+    http_request: Request,
+    x_execution_id: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
-    project = session.get(Project, project_id)
-    if not project or project.owner_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Project not found")
+    """
+    Generates and runs chart code for a stored result (`result_id`). Large
+    results are reduced for the chart type first, so the figure stays small
+    whatever the size of the result.
+    """
+    execution_id = x_execution_id or uuid.uuid4().hex
+    await get_owned_project(session, project_id, current_user)
+    if request.result_id:
+        if not await run_in_threadpool(owned_result_meta, request.result_id, current_user.id):
+            raise HTTPException(status_code=404, detail="Result not found")
+    elif request.datatable_json is None:
+        raise HTTPException(status_code=400, detail="Pass the result_id of the result to plot")
 
-    # Generate the visualization code
-    viz_code = generate_visualization_code(request.dict(), request.provider, request.model)
+    plot_id, note, preview_json, points = await run_in_threadpool(chart_data, request)
+    try:
+        # Generate the visualization code from a preview of the data it will see
+        request_data = {**request.dict(), "datatable_json": preview_json, "data_note": note}
+        try:
+            viz_code = await run_in_threadpool(
+                generate_visualization_code, request_data, request.provider, request.model,
+                use_cache=not request.bypass_llm_cache,
+            )
+        except ProviderError as e:
+            raise HTTPException(status_code=400, detail=f"Error visualizing data: {e}")
+        plot_json, chart_error = await render_chart(
+            http_request, plot_id, strip_figure_output(viz_code), current_user.id, execution_id
+        )
+    finally:
+        if plot_id != request.result_id:
+            await run_in_threadpool(remove_result, plot_id)
+    if chart_error:
+        raise HTTPException(status_code=400, detail=f"Error visualizing data: {chart_error}")
 
-    # Prepare the environment for execution
-    # We load the full data table (ans_df) from the JSON sent by the frontend
-    code_preamble = [
-        "import pandas as pd",
-        "import plotly.express as px",
-        f"ans_df = pd.read_json('''{request.datatable_json}''', orient='records')"
-    ]
-    preamble_str = "\n".join(code_preamble)
-    full_viz_code = f"{preamble_str}\n{viz_code}"
-    
-    viz_results = execute_code_in_kernel(full_viz_code)
-    
-    plot_json_result = next((res for res in viz_results if res['type'] == 'json_result'), None)
-    plot_json = plot_json_result['text'] if plot_json_result else None
+    return {
+        "execution_id": execution_id, "plot_json": plot_json, "visualization_code": viz_code,
+        "points": points, "reduced": note is not None,
+    }
 
-    error_output = next((res for res in viz_results if res['type'] == 'error'), None)
-    if error_output:
-        raise HTTPException(status_code=400, detail=f"Error visualizing data: {error_output['evalue']}")
 
-    return {"plot_json": plot_json, "visualization_code": viz_code}
\ No newline at end of file
+@app.get("/api/results/{result_id}")
+def read_result(
+    result_id: str,
+    format: str = "json",
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Serves a stored query result, either as an Arrow IPC file (`format=arrow`)
+    or as a JSON array of records streamed batch by batch (`format=json`).
+    """
+    meta = owned_result_meta(result_id, current_user.id)
+    if not meta:
+        raise HTTPException(status_code=404, detail="Result not found")
+
+    if format == "arrow":
+        return FileResponse(result_path(result_id), media_type=ARROW_MEDIA_TYPE)
+    if format == "json":
+        return StreamingResponse(iter_result_json(read_result_table(result_id)), media_type="application/json")
+    raise HTTPException(status_code=400, detail="format must be 'json' or 'arrow'")
+
+
+@app.get("/api/results/{result_id}/rows")
+def read_result_rows(
+    result_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(RESULT_PAGE_DEFAULT_ROWS, ge=1, le=RESULT_PAGE_MAX_ROWS),
+    sort: Optional[str] = None,
+    filter: List[str] = Query([]),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Serves one page of a stored result. `sort` is a comma-separated list of
+    columns, '-' first for descending; each `filter` is `column:operator:value`
+    with operators eq, ne, lt, le, gt, ge, contains, startswith, in (values
+    separated by commas), null and notnull. Page with `offset`, or pass the
+    previous page's `next_cursor` as `cursor`.
+    """
+    meta = owned_result_meta(result_id, current_user.id)
+    if not meta:
+        raise HTTPException(status_code=404, detail="Result not found")
+    try:
+        page, info = result_page(result_id, offset, limit, sort, filter, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    head = {
+        "result_id": result_id, "row_count": meta["row_count"], "expires_at": meta.get("expires_at"),
+        "columns": meta["columns"], **info,
+    }
+    # The rows are serialized the same way as the inline datatable_json
+    body = json.dumps(head)[:-1] + ', "rows": ' + result_to_json(page) + "}"
+    return Response(content=body, media_type="application/json")
+
+
+@app.delete("/api/executions/{execution_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def cancel_execution_endpoint(
+    execution_id: str,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Cancels one of the current user's queued or running executions,
+    interrupting its kernel.
+    """
+    if not await cancel_execution(execution_id, current_user.id):
+        raise HTTPException(status_code=404, detail="Execution not found")
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
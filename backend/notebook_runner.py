@@ -1,60 +1,172 @@
-import jupyter_client
-from queue import Empty
-import json
+import asyncio
+import atexit
+import threading
+from typing import Optional
+
+from kernel_loop import get_kernel_loop
+from kernel_pool import KernelPool
+from kernel_sessions import SessionManager
+from scheduler import ExecutionScheduler
+
+# Created on the kernel loop by `_ensure_runtime()`; see kernel_loop.py.
+_pool: Optional[KernelPool] = None
+_sessions: Optional[SessionManager] = None
+_scheduler: Optional[ExecutionScheduler] = None
+_runtime_lock = threading.Lock()
+
+# In-flight executions by id, as (user_id, task); only touched on the kernel loop.
+_executions: dict = {}
+_cancel_requested: set = set()
+
+
+class ExecutionCancelled(Exception):
+    """Raised to the caller when its execution was cancelled through cancel_execution()."""
+
+
+class DuplicateExecutionId(Exception):
+    """Raised when an execution id is reused while the first execution is still running."""
+
+
+async def _ensure_runtime():
+    global _pool, _sessions, _scheduler
+    if _pool is None:
+        _pool = KernelPool()
+        _sessions = SessionManager()
+        _scheduler = ExecutionScheduler()
+        await _pool.start()
+        await _sessions.start()
+
+
+def start_runtime():
+    """Starts the kernel loop and warms up the kernel pool."""
+    with _runtime_lock:
+        get_kernel_loop().run(_ensure_runtime())
+
+
+def shutdown_runtime():
+    global _pool, _sessions, _scheduler
+    with _runtime_lock:
+        if _pool is None:
+            return
+        loop = get_kernel_loop()
+        loop.run(_sessions.shutdown())
+        loop.run(_pool.shutdown())
+        _pool = _sessions = _scheduler = None
+
+
+atexit.register(shutdown_runtime)
+
+
+def runtime_stats() -> dict:
+    """Pool, session and scheduler counters, for the health endpoint."""
+    if _pool is None:
+        return {}
+    return {"kernel_pool": _pool.stats(), "sessions": _sessions.stats(), "scheduler": _scheduler.stats()}
+
+
+async def _execute(code: str, project_id: Optional[int], tables: Optional[dict]) -> list:
+    if project_id is not None and tables is not None:
+        async with _sessions.lease(project_id, tables) as session:
+            return await session.execute(code)
+    async with _pool.lease() as kernel:
+        return await kernel.execute(code)
+
+
+async def _scheduled(user_id, coro):
+    await _ensure_runtime()
+    return await _scheduler.run(user_id, coro)
 
-def execute_code_in_kernel(code: str) -> list:
-    """
-    Executes a string of Python code in a temporary Jupyter kernel
-    and captures the output, correctly handling JSON.
-    """
-    km = jupyter_client.KernelManager()
-    km.start_kernel()
-    kc = km.client()
-    kc.start_channels()
 
+async def _tracked(execution_id: str, user_id, coro):
+    """Registers the running task under `execution_id` so it can be cancelled."""
+    if execution_id in _executions:
+        coro.close()
+        raise DuplicateExecutionId(f"Execution {execution_id} is already running")
+    _executions[execution_id] = (user_id, asyncio.current_task())
     try:
-        kc.wait_for_ready(timeout=60)
-    except RuntimeError:
-        kc.stop_channels()
-        km.shutdown_kernel()
+        return await coro
+    except asyncio.CancelledError:
+        if execution_id in _cancel_requested:
+            raise ExecutionCancelled(f"Execution {execution_id} was cancelled")
         raise
+    finally:
+        _executions.pop(execution_id, None)
+        _cancel_requested.discard(execution_id)
 
-    kc.execute(code)
-    results = []
-
-    while True:
-        try:
-            msg = kc.get_iopub_msg(timeout=20)
-        except Empty:
-            break
-
-        msg_type = msg['header']['msg_type']
-        content = msg.get('content', {})
-
-        if msg_type == 'status' and content.get('execution_state') == 'idle':
-            break
-        elif msg_type == 'stream':
-            results.append({'type': 'stdout', 'text': content.get('text', '')})
-        elif msg_type == 'execute_result':
-            # --- THIS IS THE FIX ---
-            # Check for rich JSON output first, which is what fig.to_json() produces.
-            if 'application/json' in content.get('data', {}):
-                # We dump and reload to ensure it's a clean, double-quoted JSON string
-                json_data = json.dumps(content['data']['application/json'])
-                results.append({'type': 'json_result', 'text': json_data})
-            # Fallback to plain text if no JSON is available
-            else:
-                text_data = content.get('data', {}).get('text/plain', '')
-                results.append({'type': 'result', 'text': text_data})
-        elif msg_type == 'error':
-            results.append({
-                'type': 'error',
-                'ename': content.get('ename', 'Unknown error'),
-                'evalue': content.get('evalue', '...'),
-                'traceback': content.get('traceback', []),
-            })
-            break
-
-    kc.stop_channels()
-    km.shutdown_kernel(now=True)
-    return results
\ No newline at end of file
+
+async def _cancel(execution_id: str, user_id) -> bool:
+    entry = _executions.get(execution_id)
+    if entry is None or entry[0] != user_id:
+        return False
+    _cancel_requested.add(execution_id)
+    entry[1].cancel()
+    return True
+
+
+async def cancel_execution(execution_id: str, user_id) -> bool:
+    """
+    Cancels an in-flight execution owned by `user_id`. Whether it is still
+    queued or already running, the kernel is interrupted and freed.
+    Returns False if there is no such execution.
+    """
+    return await get_kernel_loop().submit(_cancel(execution_id, user_id))
+
+
+async def execute_code_async(
+    code: str,
+    user_id=None,
+    project_id: Optional[int] = None,
+    tables: Optional[dict] = None,
+    execution_id: Optional[str] = None,
+) -> list:
+    """
+    Executes code without blocking the caller's event loop. It runs in the
+    project's persistent session when `project_id` and `tables` are given,
+    otherwise in a kernel leased from the warm pool. Executions go through
+    the global scheduler, which raises SchedulerFull when it cannot queue.
+
+    Cancelling the awaiting task, or calling cancel_execution() with
+    `execution_id`, interrupts the kernel.
+    """
+    coro = _scheduled(user_id, _execute(code, project_id, tables))
+    if execution_id is not None:
+        coro = _tracked(execution_id, user_id, coro)
+    return await get_kernel_loop().submit(coro)
+
+
+async def describe_session_tables(user_id, project_id: int, tables: dict) -> dict:
+    """Loads the project's session if needed and returns the dtypes of its tables."""
+    async def describe():
+        async with _sessions.lease(project_id, tables) as session:
+            return await session.describe_tables()
+    return await get_kernel_loop().submit(_scheduled(user_id, describe()))
+
+
+async def warm_up(user_id, project_id: Optional[int] = None, tables: Optional[dict] = None):
+    """
+    Gets ready for an execution that is about to come: starts the runtime
+    and, given `project_id` and `tables`, the project's session with its
+    tables loaded, so that the execution finds them in memory.
+    """
+    async def load():
+        async with _sessions.lease(project_id, tables):
+            pass
+
+    if project_id is None or tables is None:
+        await get_kernel_loop().submit(_ensure_runtime())
+    else:
+        await get_kernel_loop().submit(_scheduled(user_id, load()))
+
+
+def refresh_project_session(project_id: int, tables: dict):
+    """Reloads changed tables in the project's session, if it has one."""
+    if _sessions is not None:
+        get_kernel_loop().run(_sessions.refresh_project(project_id, tables))
+
+
+def execute_code_in_kernel(code: str) -> list:
+    """
+    Executes a string of Python code in a kernel leased from the warm pool
+    and captures the output, correctly handling JSON. Blocks until done.
+    """
+    return get_kernel_loop().run(_scheduled(None, _execute(code, None, None)))
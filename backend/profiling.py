@@ -0,0 +1,246 @@
+import json
+import math
+import os
+import uuid
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from sqlmodel import Session
+
+from config import (
+    APPROXIMATE_SAMPLE_ROWS, PROFILE_BATCH_ROWS, PROFILE_SAMPLE_SIZE, PROFILE_TOP_K, UPLOAD_DIRECTORY,
+)
+from database.models import Dataset, DatasetProfile
+
+
+class HyperLogLog:
+    """Approximate distinct counter; 2**p registers give about 1.04/sqrt(2**p) relative error."""
+
+    def __init__(self, p: int = 12):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def add(self, values: pd.Series):
+        if values.empty:
+            return
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+        buckets = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        # Position of the first set bit; the rest fits in a float64 mantissa exactly
+        bit_length = np.frexp(rest.astype(np.float64))[1]
+        ranks = (64 - self.p - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, buckets, ranks)
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # Linear counting for small cardinalities
+        return int(round(estimate))
+
+
+class TopK:
+    """
+    Frequent values over a stream, keeping at most `capacity` counters. When
+    counters are dropped, the largest dropped count is added to `error`, an
+    upper bound on how much any reported count may be under.
+    """
+
+    def __init__(self, k: int = PROFILE_TOP_K, capacity: Optional[int] = None):
+        self.k = k
+        self.capacity = capacity or k * 20
+        self.counts: dict = {}
+        self.error = 0
+
+    def add(self, values: pd.Series):
+        for value, count in values.value_counts(sort=False).items():
+            self.counts[value] = self.counts.get(value, 0) + int(count)
+        if len(self.counts) > self.capacity:
+            kept = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+            self.error += kept[self.capacity][1]
+            self.counts = dict(kept[:self.capacity])
+
+    def top(self) -> list:
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:self.k]
+
+
+class Reservoir:
+    """A uniform random sample of fixed size over a stream (Algorithm R)."""
+
+    def __init__(self, size: int = PROFILE_SAMPLE_SIZE, seed: Optional[int] = None):
+        self.size = size
+        self.items: list = []
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, values: pd.Series):
+        values = values.to_numpy()
+        fill = min(self.size - len(self.items), len(values))
+        self.items.extend(values[:fill].tolist())
+        rest = values[fill:]
+        if len(rest):
+            # Item number i replaces a random slot with probability size / i;
+            # draw all the slots at once and only loop over the replacements.
+            positions = np.arange(self.seen + fill + 1, self.seen + len(values) + 1)
+            slots = self._rng.integers(0, positions)
+            for index in np.flatnonzero(slots < self.size):
+                self.items[slots[index]] = rest[index]
+        self.seen += len(values)
+
+
+class RowSample:
+    """
+    A uniform random sample of rows over a stream of batches: every row gets
+    a random key and the `size` smallest keys are kept. The rows come out in
+    random order, so any contiguous slice is a random sub-sample too.
+    """
+
+    def __init__(self, size: int = APPROXIMATE_SAMPLE_ROWS, seed: Optional[int] = None):
+        self.size = size
+        self.rows: Optional[pd.DataFrame] = None
+        self.keys = np.empty(0)
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, batch: pd.DataFrame):
+        self.seen += len(batch)
+        keys = np.concatenate([self.keys, self._rng.random(len(batch))])
+        rows = batch if self.rows is None else pd.concat([self.rows, batch], ignore_index=True)
+        if len(rows) > self.size:
+            keep = np.argpartition(keys, self.size)[:self.size]
+            rows, keys = rows.iloc[keep].reset_index(drop=True), keys[keep]
+        self.rows, self.keys = rows, keys
+
+    def result(self) -> Optional[pd.DataFrame]:
+        if self.rows is None:
+            return None
+        return self.rows.iloc[np.argsort(self.keys)].reset_index(drop=True)
+
+
+def _jsonable(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return str(value)
+
+
+class ColumnProfiler:
+    def __init__(self, dtype: str):
+        self.dtype = dtype
+        self.rows = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.distinct = HyperLogLog()
+        self.top = TopK()
+        self.sample = Reservoir()
+
+    def add(self, column: pd.Series):
+        self.rows += len(column)
+        values = column.dropna()
+        self.nulls += len(column) - len(values)
+        if values.empty:
+            return
+        try:
+            low, high = values.min(), values.max()
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+        except TypeError:
+            pass  # Mixed types have no order
+        self.distinct.add(values)
+        self.top.add(values)
+        self.sample.add(values)
+
+    def result(self) -> dict:
+        return {
+            "dtype": self.dtype,
+            "null_fraction": self.nulls / self.rows if self.rows else 0.0,
+            "min": _jsonable(self.min),
+            "max": _jsonable(self.max),
+            "distinct_count": self.distinct.count(),
+            "top_values": [[_jsonable(value), count] for value, count in self.top.top()],
+            "top_values_error": self.top.error,
+            "sample": [_jsonable(value) for value in self.sample.items],
+        }
+
+
+def iter_batches(file_path, batch_rows: int = PROFILE_BATCH_ROWS) -> Iterator[pd.DataFrame]:
+    """Reads a dataset file, or each of a list of files, in bounded batches."""
+    if isinstance(file_path, list):
+        for path in file_path:
+            yield from iter_batches(path, batch_rows)
+    elif file_path.endswith(".parquet"):
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=batch_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(file_path, chunksize=batch_rows)
+
+
+def profile_file(file_path, batch_rows: int = PROFILE_BATCH_ROWS, row_sample: Optional[RowSample] = None) -> dict:
+    """
+    Column statistics for a dataset, computed in one pass with bounded memory.
+    The same pass fills `row_sample` if one is given.
+    """
+    profilers: dict = {}
+    row_count = 0
+    for batch in iter_batches(file_path, batch_rows):
+        row_count += len(batch)
+        if row_sample is not None:
+            row_sample.add(batch)
+        for name, column in batch.items():
+            if name not in profilers:
+                profilers[name] = ColumnProfiler(str(column.dtype))
+            profilers[name].add(column)
+    return {
+        "row_count": row_count,
+        "columns": {str(name): profiler.result() for name, profiler in profilers.items()},
+    }
+
+
+def profile_dataset(engine, dataset_id: int):
+    """
+    Profiles a dataset and stores the result. Meant to run as a background
+    task after the upload has been answered.
+    """
+    with Session(engine) as session:
+        dataset = session.get(Dataset, dataset_id)
+        if dataset is None:
+            return
+        file_path = dataset.parquet_path or dataset.file_path
+        if dataset.segments:
+            file_path = [file_path, *(segment.file_path for segment in dataset.segments)]
+        profile = dataset.profile or DatasetProfile(dataset_id=dataset_id)
+        profile.status, profile.error = "pending", None
+        session.add(profile)
+        session.commit()
+        try:
+            row_sample = RowSample()
+            profile.profile_json = json.dumps(profile_file(file_path, row_sample=row_sample))
+            profile.sample_path = write_sample(row_sample)
+            profile.status = "ready"
+        except Exception as e:
+            print(f"Could not profile dataset {dataset_id}: {e}")
+            profile.status, profile.error = "failed", str(e)
+        session.add(profile)
+        session.commit()
+
+
+def write_sample(row_sample: RowSample) -> Optional[str]:
+    """Stores a row sample as Parquet; unreferenced samples are removed by blob_store.collect_garbage()."""
+    rows = row_sample.result()
+    if rows is None:
+        return None
+    directory = os.path.join(UPLOAD_DIRECTORY, "samples")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{uuid.uuid4().hex}.parquet")
+    rows.to_parquet(path, index=False)
+    return path
@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from config import (
+    REDIS_URL, RESULT_CACHE_BACKEND, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL, RESULT_DIRECTORY,
+)
+from result_store import remove_result
+
+
+# Code that draws random numbers or reads the clock gives a new answer each run
+_NONDETERMINISTIC = re.compile(r"\b(random|rand|randn|randint|sample|shuffle|now|today|uuid\d?|random\(\))\b", re.I)
+
+
+def is_cacheable(code: str) -> bool:
+    return not _NONDETERMINISTIC.search(code)
+
+
+def cache_key(code_hash: str, versions: dict, engine: Optional[str] = None) -> str:
+    """
+    Key for a result: the normalized code (see result_store.code_fingerprint),
+    the SQL engine, and the content version of every dataset the code reads.
+    """
+    payload = json.dumps({"code": code_hash, "engine": engine, "versions": versions}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class MemoryResultCache:
+    """
+    Maps cache keys to stored result ids, in process memory. Entries are
+    evicted least recently used first once the results they point at add up
+    to more than `max_bytes`, and expire after `ttl` seconds if it is set.
+
+    The cache owns the results it is given: a result is deleted from the
+    result store when its entry is evicted, expires, is invalidated or is
+    discarded, so `max_bytes` bounds the disk they take.
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES, ttl: float = RESULT_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()  # key -> entry dict
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def _expired(self, entry: dict) -> bool:
+        return bool(self.ttl) and time.time() - entry["created_at"] > self.ttl
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, result_id: str, size: int, versions: dict):
+        entry = {"result_id": result_id, "size": size, "versions": versions, "created_at": time.time()}
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry["size"]
+            remove_result(entry["result_id"])
+
+    def discard(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def invalidate_version(self, version: str) -> int:
+        """Drops every entry computed from a dataset version. Returns how many."""
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if version in entry["versions"].values()]
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+class DiskResultCache(MemoryResultCache):
+    """The same cache persisted in a SQLite file, so it survives restarts."""
+
+    def __init__(self, path: Optional[str] = None, **kwargs):
+        super().__init__(**kwargs)
+        path = path or os.path.join(RESULT_DIRECTORY, "result_cache.db")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, entry TEXT, last_used REAL)"
+        )
+        for key, entry in self._db.execute("SELECT key, entry FROM entries ORDER BY last_used").fetchall():
+            entry = json.loads(entry)
+            self._entries[key] = entry
+            self._bytes += entry["size"]
+
+    def _remove(self, key: str):
+        super()._remove(key)
+        self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = super().get(key)
+        with self._lock:
+            if entry is not None:
+                self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+        return entry
+
+    def put(self, key: str, result_id: str, size: int, versions: dict):
+        super().put(key, result_id, size, versions)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", (key, json.dumps(entry), time.time()))
+            self._db.commit()
+
+    def discard(self, key: str):
+        super().discard(key)
+        with self._lock:
+            self._db.commit()
+
+    def invalidate_version(self, version: str) -> int:
+        removed = super().invalidate_version(version)
+        with self._lock:
+            self._db.commit()
+        return removed
+
+
+class RedisResultCache:
+    """
+    The cache kept in Redis, shared by every backend process. A sorted set
+    orders keys by last use for LRU eviction, and a set per dataset version
+    holds the keys computed from it; Redis expires entries on TTL. Results
+    are deleted with their entries, as in MemoryResultCache; those of entries
+    Redis expired on its own are left to the result store's TTL.
+    """
+
+    def __init__(self, url: str = REDIS_URL, max_bytes: int = RESULT_CACHE_MAX_BYTES,
+                 ttl: float = RESULT_CACHE_TTL, prefix: str = "result_cache:"):
+        import redis
+
+        self.redis = redis.Redis.from_url(url)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.prefix = prefix
+        self._lru = f"{prefix}lru"
+        self._sizes = f"{prefix}sizes"
+        self.hits = self.misses = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        raw = self.redis.get(self.prefix + key)
+        if raw is None:
+            self.redis.zrem(self._lru, key)
+            self.redis.hdel(self._sizes, key)
+            self.misses += 1
+            return None
+        self.redis.zadd(self._lru, {key: time.time()})
+        self.hits += 1
+        return json.loads(raw)
+
+    def _version_key(self, version: str) -> str:
+        return f"{self.prefix}version:{version}"
+
+    def put(self, key: str, result_id: str, size: int, versions: dict):
+        self.discard(key)
+        entry = {"result_id": result_id, "size": size, "versions": versions, "created_at": time.time()}
+        pipe = self.redis.pipeline()
+        pipe.set(self.prefix + key, json.dumps(entry), ex=int(self.ttl) if self.ttl else None)
+        pipe.zadd(self._lru, {key: time.time()})
+        pipe.hset(self._sizes, key, size)
+        for version in versions.values():
+            pipe.sadd(self._version_key(version), key)
+        pipe.execute()
+        self._evict()
+
+    def _evict(self):
+        total = sum(int(size) for size in self.redis.hvals(self._sizes))
+        while total > self.max_bytes and self.redis.zcard(self._lru) > 1:
+            (oldest, _), = self.redis.zpopmin(self._lru)
+            oldest = oldest.decode()
+            total -= int(self.redis.hget(self._sizes, oldest) or 0)
+            self.discard(oldest)
+
+    def discard(self, key: str) -> bool:
+        """Drops an entry and its result. Returns whether there was one."""
+        raw = self.redis.get(self.prefix + key)
+        entry = json.loads(raw) if raw is not None else None
+        pipe = self.redis.pipeline()
+        pipe.delete(self.prefix + key)
+        pipe.zrem(self._lru, key)
+        pipe.hdel(self._sizes, key)
+        for version in (entry["versions"].values() if entry else ()):
+            pipe.srem(self._version_key(version), key)
+        pipe.execute()
+        if entry is not None:
+            remove_result(entry["result_id"])
+        return entry is not None
+
+    def invalidate_version(self, version: str) -> int:
+        """Drops every entry computed from a dataset version, found through its key set. Returns how many."""
+        keys = self.redis.smembers(self._version_key(version))
+        removed = sum(self.discard(key.decode()) for key in keys)
+        self.redis.delete(self._version_key(version))
+        return removed
+
+    def stats(self) -> dict:
+        return {"entries": self.redis.zcard(self._lru), "hits": self.hits, "misses": self.misses}
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """The configured result cache, or None when caching is turned off."""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None and RESULT_CACHE_BACKEND != "none":
+            if RESULT_CACHE_BACKEND == "redis":
+                _result_cache = RedisResultCache()
+            elif RESULT_CACHE_BACKEND == "disk":
+                _result_cache = DiskResultCache()
+            else:
+                _result_cache = MemoryResultCache()
+        return _result_cache
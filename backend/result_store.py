@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import Iterator, Optional
+
+import pyarrow as pa
+
+from config import RESULT_DIRECTORY, RESULT_INLINE_MAX_ROWS, RESULT_TTL
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.file"
+# Rows per record batch when serializing to JSON; bounds the memory of each step
+JSON_BATCH_ROWS = 50_000
+
+_RESULT_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def new_result_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _checked_id(result_id: str) -> str:
+    # Result ids end up in file paths, so never accept anything but our own format.
+    if not _RESULT_ID_PATTERN.match(result_id or ""):
+        raise ValueError(f"Invalid result id: {result_id!r}")
+    return result_id
+
+
+def result_path(result_id: str) -> str:
+    return os.path.join(RESULT_DIRECTORY, f"{_checked_id(result_id)}.arrow")
+
+
+def _meta_path(result_id: str) -> str:
+    return os.path.join(RESULT_DIRECTORY, f"{_checked_id(result_id)}.json")
+
+
+def chart_path(chart_id: str) -> str:
+    return os.path.join(RESULT_DIRECTORY, f"{_checked_id(chart_id)}.plot.json")
+
+
+def result_exists(result_id: str) -> bool:
+    return os.path.exists(result_path(result_id))
+
+
+def code_fingerprint(language: str, code: str) -> str:
+    """Hash of code that ignores indentation-neutral whitespace and blank lines."""
+    lines = [line.rstrip() for line in code.strip().splitlines() if line.strip()]
+    return hashlib.sha256("\n".join([language, *lines]).encode()).hexdigest()
+
+
+def result_writer_code(result_id: str, variable: str = "ans_df") -> str:
+    """
+    Kernel code that writes `variable` to the result store as an Arrow IPC
+    file. Only the file lands on disk; nothing but errors travels over iopub.
+    """
+    os.makedirs(RESULT_DIRECTORY, exist_ok=True)
+    path = result_path(result_id)
+    return f"""
+import pyarrow as _pa
+def _write_result(_value, _path):
+    if isinstance(_value, pd.Series):
+        _value = _value.to_frame()
+    elif not isinstance(_value, pd.DataFrame):
+        _value = pd.DataFrame({{'value': [_value]}})
+    try:
+        _table = _pa.Table.from_pandas(_value, preserve_index=False)
+    except (_pa.ArrowInvalid, _pa.ArrowTypeError):
+        # Mixed-type object columns: fall back to their string form
+        _value = _value.astype({{_c: str for _c in _value.columns if _value[_c].dtype == object}})
+        _table = _pa.Table.from_pandas(_value, preserve_index=False)
+    _tmp_path = _path + '.tmp'
+    with _pa.OSFile(_tmp_path, 'wb') as _sink:
+        with _pa.ipc.new_file(_sink, _table.schema) as _writer:
+            _writer.write_table(_table)
+    import os as _os
+    _os.replace(_tmp_path, _path)
+_write_result({variable}, r'{path}')
+"""
+
+
+def write_result_table(table: pa.Table) -> str:
+    """Stores a table computed in the backend as a new (unregistered) result."""
+    os.makedirs(RESULT_DIRECTORY, exist_ok=True)
+    result_id = new_result_id()
+    tmp_path = result_path(result_id) + ".tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, result_path(result_id))
+    return result_id
+
+
+def result_loader_code(result_id: str, variable: str = "ans_df") -> str:
+    """Kernel code that loads a stored result back into a DataFrame."""
+    return (
+        "import pyarrow as _pa\n"
+        f"{variable} = _pa.ipc.open_file(_pa.memory_map(r'{result_path(result_id)}', 'r')).read_all().to_pandas()"
+    )
+
+
+def chart_writer_code(chart_id: str, figure_variable: str = "fig") -> str:
+    """Kernel code that writes a Plotly figure's JSON to the result store."""
+    return (
+        f"with open(r'{chart_path(chart_id)}', 'w') as _chart_file:\n"
+        f"    _chart_file.write({figure_variable}.to_json())"
+    )
+
+
+def pop_chart_json(chart_id: str) -> Optional[str]:
+    """Reads and removes a chart written by `chart_writer_code`, if there is one."""
+    path = chart_path(chart_id)
+    try:
+        with open(path) as f:
+            chart_json = f.read()
+    except OSError:
+        return None
+    os.remove(path)
+    return chart_json
+
+
+def strip_figure_output(visualization_code: str) -> str:
+    """
+    Drops a trailing `fig.to_json()` line; the figure is written through
+    `chart_writer_code` instead of being echoed over iopub.
+    """
+    lines = visualization_code.rstrip().splitlines()
+    if lines and lines[-1].strip() == "fig.to_json()":
+        lines = lines[:-1]
+    return "\n".join(lines)
+
+
+def clone_result(result_id: str) -> str:
+    """A new result with the same content, sharing the file through a hard link where possible."""
+    new_id = new_result_id()
+    try:
+        os.link(result_path(result_id), result_path(new_id))
+    except OSError:
+        shutil.copyfile(result_path(result_id), result_path(new_id))
+    return new_id
+
+
+def remove_result(result_id: str):
+    """Deletes a result and its metadata, if they exist."""
+    for path in (result_path(result_id), _meta_path(result_id)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def save_result_meta(result_id: str, owner_id: int, **extra) -> dict:
+    """Records who owns a result and its shape next to the Arrow file."""
+    table = read_result_table(result_id)
+    created_at = time.time()
+    meta = {
+        "result_id": result_id,
+        "owner_id": owner_id,
+        "created_at": created_at,
+        "expires_at": created_at + RESULT_TTL if RESULT_TTL else None,
+        "row_count": table.num_rows,
+        "columns": [{"name": field.name, "type": str(field.type)} for field in table.schema],
+        **extra,
+    }
+    with open(_meta_path(result_id), "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def load_result_meta(result_id: str) -> Optional[dict]:
+    try:
+        with open(_meta_path(result_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def result_expired(meta: dict, now: Optional[float] = None) -> bool:
+    expires_at = meta.get("expires_at")
+    return expires_at is not None and (now or time.time()) >= expires_at
+
+
+def expire_results(now: Optional[float] = None, ttl: float = RESULT_TTL) -> int:
+    """
+    Deletes expired results, and files nobody registered (results of failed
+    or abandoned runs, charts) once they are older than the TTL. Returns how
+    many results were removed.
+    """
+    if not ttl or not os.path.isdir(RESULT_DIRECTORY):
+        return 0
+    now = now or time.time()
+    removed = 0
+    for name in os.listdir(RESULT_DIRECTORY):
+        result_id = name.split(".", 1)[0]
+        if not _RESULT_ID_PATTERN.match(result_id):
+            continue
+        path = os.path.join(RESULT_DIRECTORY, name)
+        if name.endswith(".json") and not name.endswith(".plot.json"):
+            meta = load_result_meta(result_id)
+            if meta is None or result_expired(meta, now):
+                remove_result(result_id)
+                removed += 1
+        elif name.endswith((".arrow", ".plot.json", ".tmp")) and not os.path.exists(_meta_path(result_id)):
+            try:
+                if now - os.path.getmtime(path) > ttl:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass  # Registered or removed in the meantime
+    return removed
+
+
+def read_result_table(result_id: str) -> pa.Table:
+    """Opens a stored result. The file is memory-mapped, so this does not copy it."""
+    source = pa.memory_map(result_path(result_id), "r")
+    return pa.ipc.open_file(source).read_all()
+
+
+def iter_result_json(table: pa.Table, limit: Optional[int] = None) -> Iterator[str]:
+    """
+    Streams a table as a JSON array of records, batch by batch, in the same
+    format as `DataFrame.to_json(orient='records')`.
+    """
+    if limit is not None:
+        table = table.slice(0, limit)
+    yield "["
+    first = True
+    for batch in table.to_batches(max_chunksize=JSON_BATCH_ROWS):
+        if batch.num_rows == 0:
+            continue
+        records = batch.to_pandas().to_json(orient="records")
+        yield records[1:-1] if first else "," + records[1:-1]
+        first = False
+    yield "]"
+
+
+def result_to_json(table: pa.Table, limit: Optional[int] = None) -> str:
+    return "".join(iter_result_json(table, limit))
+
+
+def inline_result_json(result_id: str, max_rows: Optional[int] = RESULT_INLINE_MAX_ROWS) -> tuple:
+    """
+    The JSON to embed in an API response: the whole result if it is small
+    (or `max_rows` is None), otherwise its first `max_rows` rows. Returns
+    (json, truncated).
+    """
+    table = read_result_table(result_id)
+    truncated = max_rows is not None and table.num_rows > max_rows
+    return result_to_json(table, max_rows if truncated else None), truncated
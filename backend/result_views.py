@@ -0,0 +1,154 @@
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from config import RESULT_VIEW_CACHE_SIZE
+from result_store import read_result_table
+
+FILTER_OPERATORS = ("eq", "ne", "lt", "le", "gt", "ge", "contains", "startswith", "in", "null", "notnull")
+_COMPARISONS = {"eq": pc.equal, "ne": pc.not_equal, "lt": pc.less, "le": pc.less_equal, "gt": pc.greater, "ge": pc.greater_equal}
+
+
+def parse_sort(sort: Optional[str], schema: pa.Schema) -> tuple:
+    """`col,-other` (a leading '-' sorts descending) to sort keys for pyarrow."""
+    keys = []
+    for part in (sort or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, order = (part[1:], "descending") if part.startswith("-") else (part, "ascending")
+        if name not in schema.names:
+            raise ValueError(f"Unknown sort column: {name}")
+        keys.append((name, order))
+    return tuple(keys)
+
+
+def parse_filters(filters: Optional[List[str]], schema: pa.Schema) -> tuple:
+    """`column:operator[:value]` strings to (column, operator, value) triples."""
+    parsed = []
+    for text in filters or []:
+        name, _, rest = text.partition(":")
+        operator, _, value = rest.partition(":")
+        if name not in schema.names:
+            raise ValueError(f"Unknown filter column: {name}")
+        if operator not in FILTER_OPERATORS:
+            raise ValueError(f"Unknown filter operator {operator!r}; use one of {', '.join(FILTER_OPERATORS)}")
+        parsed.append((name, operator, value))
+    return tuple(parsed)
+
+
+def _typed(value: str, data_type: pa.DataType) -> pa.Scalar:
+    try:
+        return pa.scalar(value).cast(data_type)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        raise ValueError(f"{value!r} is not a valid {data_type}")
+
+
+def filter_mask(table: pa.Table, filters: tuple) -> Optional[pa.ChunkedArray]:
+    """A boolean mask of the rows passing every filter, computed column-wise; None without filters."""
+    mask = None
+    for name, operator, value in filters:
+        column = table[name]
+        if operator == "null":
+            condition = pc.is_null(column)
+        elif operator == "notnull":
+            condition = pc.is_valid(column)
+        elif operator in ("contains", "startswith"):
+            is_text = pa.types.is_string(column.type) or pa.types.is_large_string(column.type)
+            text = column if is_text else pc.cast(column, pa.string())
+            match = pc.match_substring if operator == "contains" else pc.starts_with
+            condition = match(text, value, ignore_case=True)
+        elif operator == "in":
+            options = pa.array([_typed(option, column.type).as_py() for option in value.split(",")], column.type)
+            condition = pc.is_in(column, value_set=options)
+        else:
+            condition = _COMPARISONS[operator](column, _typed(value, column.type))
+        condition = pc.fill_null(condition, False)
+        mask = condition if mask is None else pc.and_(mask, condition)
+    return mask
+
+
+class ResultView:
+    """The row order of a stored result after filtering and sorting it."""
+
+    def __init__(self, table: pa.Table, sort_keys: tuple, filters: tuple):
+        mask = filter_mask(table, filters)
+        rows = np.arange(table.num_rows) if mask is None else np.flatnonzero(mask.to_numpy(zero_copy_only=False))
+        if sort_keys:
+            subset = table.take(rows) if mask is not None else table
+            order = pc.sort_indices(subset, sort_keys=list(sort_keys), null_placement="at_end").to_numpy()
+            rows = rows[order]
+        self.rows = rows
+        self._positions = None
+
+    def position_after(self, row: int) -> Optional[int]:
+        """Where the page after stored row `row` starts, or None if the row is not in the view."""
+        if self._positions is None:
+            positions = np.full(int(self.rows.max()) + 1 if len(self.rows) else 0, -1)
+            positions[self.rows] = np.arange(len(self.rows))
+            self._positions = positions
+        if row < 0 or row >= len(self._positions) or self._positions[row] < 0:
+            return None
+        return int(self._positions[row]) + 1
+
+
+_views: OrderedDict = OrderedDict()
+_views_lock = threading.Lock()
+
+
+def result_view(result_id: str, table: pa.Table, sort_keys: tuple, filters: tuple) -> ResultView:
+    """The view of a result, computed once per (sort, filter) and kept in a small LRU."""
+    key = (result_id, sort_keys, filters)
+    with _views_lock:
+        view = _views.get(key)
+        if view is not None:
+            _views.move_to_end(key)
+            return view
+    view = ResultView(table, sort_keys, filters)
+    with _views_lock:
+        _views[key] = view
+        while len(_views) > RESULT_VIEW_CACHE_SIZE:
+            _views.popitem(last=False)
+    return view
+
+
+def result_page(
+    result_id: str, offset: int = 0, limit: int = 100, sort: Optional[str] = None,
+    filters: Optional[List[str]] = None, cursor: Optional[str] = None,
+) -> tuple:
+    """
+    One page of a stored result, sorted and filtered. Pages are addressed by
+    `offset` or by `cursor`, the `next_cursor` of the previous page; the
+    cursor names the last row served, so paging does not skip or repeat rows
+    whatever offset arithmetic the client does. Returns (page_table, info).
+    Raises ValueError for bad parameters.
+    """
+    table = read_result_table(result_id)
+    sort_keys = parse_sort(sort, table.schema)
+    parsed_filters = parse_filters(filters, table.schema)
+    view = result_view(result_id, table, sort_keys, parsed_filters)
+    if cursor is not None:
+        try:
+            start = view.position_after(int(cursor))
+        except ValueError:
+            start = None
+        if start is None:
+            raise ValueError("Invalid cursor for this sort and filter")
+    else:
+        start = offset
+    rows = view.rows[start:start + limit]
+    page = table.take(pa.array(rows, pa.int64()))
+    end = start + len(rows)
+    info = {
+        "total_rows": len(view.rows),
+        "offset": start,
+        "limit": limit,
+        "sort": [name if order == "ascending" else f"-{name}" for name, order in sort_keys],
+        "filters": list(filters or []),
+        "next_cursor": str(int(rows[-1])) if len(rows) and end < len(view.rows) else None,
+    }
+    return page, info
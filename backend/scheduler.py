@@ -0,0 +1,116 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+
+from config import EXECUTION_MAX_CONCURRENCY, EXECUTION_QUEUE_SIZE, EXECUTION_QUEUE_PER_USER
+
+
+class SchedulerFull(Exception):
+    """
+    Raised when an execution cannot even be queued. `status_code` is 429 when
+    the caller has too many requests waiting, 503 when the whole queue is full.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class ExecutionScheduler:
+    """
+    Caps the number of concurrent kernel executions and queues the rest.
+
+    Waiting requests are kept in one FIFO queue per user and slots are handed
+    out round-robin across users, so one user submitting a burst cannot
+    starve everybody else. Must be used from a single event loop.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = EXECUTION_MAX_CONCURRENCY,
+        max_queue: int = EXECUTION_QUEUE_SIZE,
+        max_queue_per_user: int = EXECUTION_QUEUE_PER_USER,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self._running = 0
+        self._queues: "OrderedDict[object, deque]" = OrderedDict()
+        self._queued = 0
+        # Moving average of execution time, used to estimate Retry-After
+        self._avg_duration = 5.0
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "queued": self._queued,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+        }
+
+    def _retry_after(self) -> int:
+        waves = (self._queued + self._running) / max(self.max_concurrent, 1)
+        return max(1, math.ceil(waves * self._avg_duration))
+
+    async def _acquire(self, user_id):
+        if self._running < self.max_concurrent and not self._queued:
+            self._running += 1
+            return
+        if self._queued >= self.max_queue:
+            raise SchedulerFull("Execution queue is full", 503, self._retry_after())
+        # A rejected request must not leave an empty queue behind for _release() to pop from
+        if len(self._queues.get(user_id, ())) >= self.max_queue_per_user:
+            raise SchedulerFull("Too many queued executions for this user", 429, self._retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(waiter)
+        self._queued += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # We were handed a slot just as we got cancelled; pass it on.
+                self._release()
+            else:
+                # _release() may already have dropped the cancelled waiter (and
+                # the user's emptied queue) before we got to run
+                queue = self._queues.get(user_id)
+                if queue is not None and waiter in queue:
+                    queue.remove(waiter)
+                    self._queued -= 1
+                    if not queue:
+                        del self._queues[user_id]
+            raise
+
+    def _release(self):
+        self._running -= 1
+        # Hand the slot to the user at the head of the rotation, then move
+        # that user to the back so others get the next slots.
+        while self._queues and self._running < self.max_concurrent:
+            user_id, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            if not waiter.done():
+                self._running += 1
+                waiter.set_result(None)
+
+    async def run(self, user_id, coro):
+        """Runs a coroutine once a slot is free for `user_id`."""
+        try:
+            await self._acquire(user_id)
+        except BaseException:
+            coro.close()
+            raise
+        started = time.monotonic()
+        try:
+            return await coro
+        finally:
+            duration = time.monotonic() - started
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+            self._release()
@@ -0,0 +1,143 @@
+import math
+import re
+from collections import Counter
+from typing import Callable
+
+from config import PROMPT_TOKEN_BUDGET, SCHEMA_TOP_COLUMNS, SCHEMA_TOP_TABLES
+
+_WORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+# Text values of a column (its most common and sampled values) indexed per column
+_VALUES_PER_COLUMN = 20
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly four characters per token, which is close enough for budgeting prompts."""
+    return (len(text) + 3) // 4
+
+
+def terms(text) -> list:
+    """Lower-case words of a name or text, splitting snake_case and camelCase, singular."""
+    words = [word.lower() for word in _WORD.findall(str(text))]
+    return [word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word for word in words]
+
+
+class BM25:
+    """Okapi BM25 over a fixed list of documents, each a list of terms."""
+
+    def __init__(self, documents: list, k1: float = 1.5, b: float = 0.75):
+        self.k1, self.b = k1, b
+        self.counts = [Counter(document) for document in documents]
+        self.lengths = [len(document) for document in documents]
+        self.average_length = sum(self.lengths) / len(documents) if documents else 0.0
+        frequency = Counter(term for counts in self.counts for term in counts)
+        total = len(documents)
+        self.idf = {term: math.log(1 + (total - n + 0.5) / (n + 0.5)) for term, n in frequency.items()}
+
+    def scores(self, query: list) -> list:
+        query = set(query)
+        results = []
+        for counts, length in zip(self.counts, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / self.average_length) if self.average_length else self.k1
+            results.append(sum(
+                self.idf[term] * counts[term] * (self.k1 + 1) / (counts[term] + norm)
+                for term in query if term in counts
+            ))
+        return results
+
+
+def _column_terms(table: dict, name: str) -> list:
+    profile = (table.get("column_profiles") or {}).get(name) or {}
+    values = [value for value, _ in profile.get("top_values") or []] + list(profile.get("sample") or [])
+    text_values = [value for value in values if isinstance(value, str)][:_VALUES_PER_COLUMN]
+    return terms(name) * 2 + terms(table["table_name"]) + [term for value in text_values for term in terms(value)]
+
+
+def _table_terms(table: dict) -> list:
+    return terms(table["table_name"]) * 2 + terms(table.get("description") or "")
+
+
+def _with_columns(table: dict, columns: list) -> dict:
+    types = table["columns_with_types"]
+    return {
+        **table, "columns_with_types": {name: types[name] for name in columns},
+        "omitted_columns": len(types) - len(columns),
+    }
+
+
+def select_schema(
+    question: str, tables_context: list, render: Callable[[list], str], token_budget: int = PROMPT_TOKEN_BUDGET,
+    top_tables: int = SCHEMA_TOP_TABLES, top_columns: int = SCHEMA_TOP_COLUMNS,
+) -> tuple:
+    """
+    Keeps the tables and columns most relevant to `question` so that the
+    prompt `render` builds from them fits in `token_budget` tokens. Tables and
+    columns are ranked with BM25 over their names, descriptions and profiled
+    text values; up to `top_tables` tables are kept, and in each the matching
+    columns first, then the columns it shares with another kept table (join
+    keys) and id columns, then the rest in order, up to `top_columns`.
+    Projects whose whole prompt fits are left as they are.
+    Returns (tables_context, report) with the prompt size before and after.
+    """
+    full_tokens = estimate_tokens(render(tables_context))
+    all_columns = sum(len(table["columns_with_types"]) for table in tables_context)
+    report = {
+        "tokens_before": full_tokens, "tokens_after": full_tokens, "token_budget": token_budget,
+        "tables_before": len(tables_context), "tables_after": len(tables_context),
+        "columns_before": all_columns, "columns_after": all_columns,
+    }
+    if full_tokens <= token_budget or not tables_context:
+        return tables_context, report
+
+    query = terms(question)
+    columns = [(t, name) for t, table in enumerate(tables_context) for name in table["columns_with_types"]]
+    column_scores = BM25([_column_terms(tables_context[t], name) for t, name in columns]).scores(query)
+    table_scores = BM25([_table_terms(table) for table in tables_context]).scores(query)
+    best_column = [0.0] * len(tables_context)
+    for (t, _), score in zip(columns, column_scores):
+        best_column[t] = max(best_column[t], score)
+    ranked = sorted(range(len(tables_context)), key=lambda t: (-(table_scores[t] + best_column[t]), t))
+    if any(table_scores[t] + best_column[t] > 0 for t in ranked):
+        ranked = [t for t in ranked if table_scores[t] + best_column[t] > 0]
+    ranked = ranked[:top_tables]
+
+    # Each table's header and each column cost about what they add to the rendered prompt
+    base = estimate_tokens(render([]))
+    header = {t: estimate_tokens(render([_with_columns(tables_context[t], [])])) - base for t in ranked}
+    rank_of = {t: rank for rank, t in enumerate(ranked)}
+    names_in = Counter(name for t in ranked for name in tables_context[t]["columns_with_types"])
+    candidates = []
+    for (t, name), score in zip(columns, column_scores):
+        if t not in rank_of:
+            continue
+        name_terms = terms(name)
+        is_key = names_in[name] > 1 or (name_terms and name_terms[-1] == "id")
+        group = 0 if score > 0 else 1 if is_key else 2
+        candidates.append(((group, -score if group == 0 else rank_of[t]), t, name))
+    candidates.sort(key=lambda item: item[0])
+
+    budget = token_budget - base
+    kept_tables, kept_columns = [], {t: [] for t in ranked}
+    for t in ranked:
+        if header[t] <= budget:
+            kept_tables.append(t)
+            budget -= header[t]
+    for _, t, name in candidates:
+        if t not in kept_tables or len(kept_columns[t]) >= top_columns:
+            continue
+        table = tables_context[t]
+        cost = estimate_tokens(render([_with_columns(table, [name])])) - base - header[t]
+        if cost <= budget:
+            kept_columns[t].append(name)
+            budget -= cost
+
+    selected = []
+    for t in kept_tables:
+        table = tables_context[t]
+        keep = set(kept_columns[t])
+        selected.append(_with_columns(table, [name for name in table["columns_with_types"] if name in keep]))
+    report.update({
+        "tokens_after": estimate_tokens(render(selected)),
+        "tables_after": len(selected),
+        "columns_after": sum(len(table["columns_with_types"]) for table in selected),
+    })
+    return selected, report
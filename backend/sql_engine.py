@@ -0,0 +1,81 @@
+import textwrap
+from typing import Optional, Union
+
+from config import DUCKDB_THREADS
+from database.models import SqlEngine
+
+
+def _sql_string(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _scan(file_path: Union[str, list]) -> str:
+    if isinstance(file_path, list):
+        # Appended segments share the dataset's Parquet schema
+        return f"read_parquet([{', '.join(_sql_string(path) for path in file_path)}])"
+    if file_path.endswith(".parquet"):
+        return f"read_parquet({_sql_string(file_path)})"
+    return f"read_csv_auto({_sql_string(file_path)})"
+
+
+def pandasql_code(table_names: list) -> str:
+    """Kernel code that runs `sql_query` over the `<table>_df` frames with pandasql."""
+    sql_env_str = "{" + ", ".join(f"'{name}': {name}_df" for name in table_names) + "}"
+    return f"pysqldf = lambda q: sqldf(q, {sql_env_str})\nans_df = pysqldf(sql_query)"
+
+
+# SUM over integers is a 128-bit HUGEINT in DuckDB, which pandas would turn
+# into float64; narrow it back to BIGINT so ans_df matches what pandasql gives.
+_DUCKDB_FETCH = """
+_rel = _con.sql(sql_query)
+if 'HUGEINT' in [str(_t) for _t in _rel.types]:
+    _rel = _rel.project(', '.join(
+        ('CAST({0} AS BIGINT) AS {0}' if str(_t) == 'HUGEINT' else '{0}').format('"' + _c.replace('"', '""') + '"')
+        for _c, _t in zip(_rel.columns, _rel.types)
+    ))
+ans_df = _rel.df()
+""".strip()
+
+
+def duckdb_code(tables: dict, threads: int = DUCKDB_THREADS) -> str:
+    """
+    Kernel code that runs `sql_query` with DuckDB. `tables` maps each table
+    name to the file (or list of Parquet files) to scan, or to None to scan the `<table>_df` frame that is
+    already in memory. Files are exposed as views, so DuckDB pushes filters
+    and column selection into the Parquet scan and nothing is copied.
+    """
+    lines = ["import duckdb as _duckdb", "_con = _duckdb.connect()"]
+    if threads:
+        lines.append(f"_con.execute('SET threads TO {int(threads)}')")
+    for name, file_path in tables.items():
+        if file_path is None:
+            lines.append(f"_con.register({name!r}, {name}_df)")
+        else:
+            view = f'CREATE VIEW "{name}" AS SELECT * FROM {_scan(file_path)}'
+            lines.append(f"_con.execute({view!r})")
+    lines += ["try:", textwrap.indent(_DUCKDB_FETCH, "    "), "finally:", "    _con.close()"]
+    return "\n".join(lines)
+
+
+def sql_query_code(
+    sql: str, engine: SqlEngine, tables: dict, load_lines: Optional[list] = None
+) -> str:
+    """
+    Kernel code that runs a SQL query into `ans_df`. `tables` is as for
+    duckdb_code(); `load_lines` load the `<table>_df` frames pandasql needs
+    and are only run if the query has to go through pandasql.
+    """
+    clean_sql = sql.replace("'''", "''")
+    code = [f"sql_query = '''{clean_sql}'''"]
+    fallback = "\n".join([*(load_lines or []), pandasql_code(list(tables))])
+    if engine == SqlEngine.pandasql:
+        return "\n".join([*code, fallback])
+    # DuckDB speaks a different dialect than SQLite; a query it rejects gets a second try in pandasql
+    code += [
+        "try:",
+        textwrap.indent(duckdb_code(tables), "    "),
+        "except Exception as _duckdb_error:",
+        "    print(f'DuckDB could not run the query, using pandasql: {_duckdb_error}')",
+        textwrap.indent(fallback, "    "),
+    ]
+    return "\n".join(code)
@@ -1,16 +1,26 @@
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlmodel import create_engine, Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database.db import get_async_session
 from main import app, get_session
 
 DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db")
+async_session_maker = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
 def override_get_session():
     with Session(engine) as session:
         yield session
 
+async def override_get_async_session():
+    async with async_session_maker() as session:
+        yield session
+
 app.dependency_overrides[get_session] = override_get_session
+app.dependency_overrides[get_async_session] = override_get_async_session
 
 @pytest.fixture(scope="module")
 def client():
@@ -0,0 +1,139 @@
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from fastapi import BackgroundTasks, UploadFile
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from aggregations import (
+    final_result, fold_files, normalize_aggregates, read_aggregation, refresh_aggregation, refresh_aggregations
+)
+from database.models import Dataset, DatasetSegment, Project, SavedAggregation, User
+from ingestion import ingest_csv, ingest_segment, load_expression
+from main import append_to_dataset
+
+AGGREGATES = [
+    {"function": "sum", "column": "wins"},
+    {"function": "count"},
+    {"function": "min", "column": "year"},
+    {"function": "max", "column": "year"},
+    {"function": "mean", "column": "wins", "alias": "avg_wins"},
+]
+
+
+def test_appended_segment_must_match_the_schema(tmp_path):
+    base = tmp_path / "wins.csv"
+    base.write_text("driver,wins,year\nHamilton,7,2020\n")
+    parquet_path, _ = ingest_csv(str(base))
+    schema = pq.read_schema(parquet_path)
+
+    rows = tmp_path / "more.csv"
+    rows.write_text("driver,wins,year\nVerstappen,3,2021\n")
+    assert ingest_segment(str(rows), str(tmp_path / "1.parquet"), schema) == 1
+    assert pq.read_schema(tmp_path / "1.parquet") == schema
+    files = [parquet_path, str(tmp_path / "1.parquet")]
+    df = eval(load_expression(files, ["driver"]), {"pd": pd})
+    assert df["driver"].tolist() == ["Hamilton", "Verstappen"]
+
+    rows.write_text("driver,year,wins\nVerstappen,2021,3\n")
+    with pytest.raises(ValueError, match="Expected the columns"):
+        ingest_segment(str(rows), str(tmp_path / "2.parquet"), schema)
+    rows.write_text("driver,wins,year\nVerstappen,three,2021\n")
+    with pytest.raises(ValueError, match="schema"):
+        ingest_segment(str(rows), str(tmp_path / "2.parquet"), schema)
+
+
+def test_incremental_refresh_matches_a_full_recompute(tmp_path, monkeypatch):
+    monkeypatch.setattr("aggregations.UPLOAD_DIRECTORY", str(tmp_path))
+    history = pd.DataFrame({
+        "driver": ["Hamilton", "Verstappen", "Hamilton", "Leclerc"],
+        "wins": [7, 3, 2, 1],
+        "year": [2019, 2021, 2020, 2022],
+    })
+    history.iloc[:2].to_parquet(tmp_path / "base.parquet", index=False)
+    history.iloc[2:].to_parquet(tmp_path / "1.parquet", index=False)
+
+    specs = normalize_aggregates(list(history.columns), ["driver"], AGGREGATES)
+    assert [spec["alias"] for spec in specs] == ["sum_wins", "count", "min_year", "max_year", "avg_wins"]
+    with pytest.raises(ValueError):
+        normalize_aggregates(list(history.columns), ["team"], AGGREGATES)
+    with pytest.raises(ValueError):
+        normalize_aggregates(list(history.columns), [], [{"function": "median", "column": "wins"}])
+
+    dataset = Dataset(id=1, file_name="wins.csv", file_path="", table_name="wins", project_id=1,
+                      parquet_path=str(tmp_path / "base.parquet"))
+    aggregation = SavedAggregation(id=1, name="per driver", group_by_json=json.dumps(["driver"]),
+                                   aggregates_json=json.dumps(specs), dataset_id=1)
+    refresh_aggregation(dataset, aggregation)
+    assert (aggregation.status, aggregation.applied_position) == ("ready", 0)
+
+    # The refresh after an append reads the new segment only
+    dataset.segments = [DatasetSegment(position=1, file_path=str(tmp_path / "1.parquet"), row_count=2, dataset_id=1)]
+    (tmp_path / "base.parquet").rename(tmp_path / "moved.parquet")
+    refresh_aggregation(dataset, aggregation)
+    assert (aggregation.status, aggregation.applied_position) == ("ready", 1)
+
+    incremental = final_result(pq.read_table(aggregation.state_path), ["driver"], specs).to_pandas()
+    files = [str(tmp_path / "moved.parquet"), str(tmp_path / "1.parquet")]
+    full = final_result(fold_files(None, files, ["driver"], specs, batch_rows=1), ["driver"], specs).to_pandas()
+    pd.testing.assert_frame_equal(incremental, full)
+    assert incremental.to_dict("list") == {
+        "driver": ["Hamilton", "Leclerc", "Verstappen"],
+        "sum_wins": [9, 1, 3],
+        "count": [2, 1, 1],
+        "min_year": [2019, 2022, 2021],
+        "max_year": [2020, 2022, 2021],
+        "avg_wins": [4.5, 1.0, 3.0],
+    }
+
+
+def test_concurrent_appends_and_refreshes_count_every_row_once(tmp_path, monkeypatch):
+    monkeypatch.setattr("aggregations.UPLOAD_DIRECTORY", str(tmp_path))
+    monkeypatch.setattr("main.UPLOAD_DIRECTORY", str(tmp_path))
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    base = tmp_path / "wins.csv"
+    base.write_text("driver,wins,year\nHamilton,7,2020\n")
+    parquet_path, _ = ingest_csv(str(base))
+    specs = normalize_aggregates(["driver", "wins", "year"], ["driver"], AGGREGATES)
+    with Session(engine) as session:
+        owner = User(username="ada", email="ada@example.com", hashed_password="x")
+        project = Project(name="p", owner=owner)
+        dataset = Dataset(file_name="wins.csv", file_path=str(base), table_name="wins", parquet_path=parquet_path,
+                          project=project)
+        aggregation = SavedAggregation(name="per driver", group_by_json=json.dumps(["driver"]),
+                                       aggregates_json=json.dumps(specs), dataset=dataset)
+        session.add(aggregation)
+        session.commit()
+        refresh_aggregation(dataset, aggregation)
+        session.add(aggregation)
+        session.commit()
+        user, dataset_id = User(id=owner.id, username="ada", email="", hashed_password=""), dataset.id
+
+    def append(i):
+        with Session(engine) as session:
+            rows = UploadFile(io.BytesIO(f"driver,wins,year\nHamilton,1,{2000 + i}\n".encode()), filename="more.csv")
+            return append_to_dataset(dataset_id, BackgroundTasks(), rows, user, session)["position"]
+
+    # Rebuilds race the appends too
+    with ThreadPoolExecutor(8) as pool:
+        refreshes = [pool.submit(refresh_aggregations, engine, dataset_id, True) for _ in range(4)]
+        positions = sorted(pool.map(append, range(12)))
+        [refresh.result() for refresh in refreshes]
+    assert positions == list(range(1, 13))
+
+    with Session(engine) as session:
+        aggregation = session.exec(select(SavedAggregation)).one()
+        assert aggregation.applied_position == 12
+        result = read_aggregation(aggregation).to_pylist()
+        assert result == [{"driver": "Hamilton", "sum_wins": 19, "count": 13, "min_year": 2000, "max_year": 2020,
+                           "avg_wins": 19 / 13}]
+
+        # A position can only be taken once, even by another worker
+        session.add(DatasetSegment(position=12, file_path="", row_count=1, dataset_id=dataset_id))
+        with pytest.raises(IntegrityError):
+            session.commit()
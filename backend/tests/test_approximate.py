@@ -0,0 +1,96 @@
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import main
+import result_store
+from approximate import choose_row_groups, estimate_result, replicate_code, sample_load_code
+from notebook_runner import ExecutionCancelled
+from profiling import RowSample
+from result_store import read_result_table
+from scheduler import SchedulerFull
+
+
+def test_estimates_scale_totals_and_bound_the_true_answer(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, "RESULT_DIRECTORY", str(tmp_path))
+    rng = np.random.default_rng(1)
+    laps = pd.DataFrame({
+        "driver": rng.choice(["Hamilton", "Verstappen", "Leclerc"], size=200_000, p=[0.5, 0.3, 0.2]),
+        "lap_time": rng.normal(90, 2, size=200_000),
+    })
+    sample = RowSample(size=20_000, seed=0)
+    for start in range(0, len(laps), 50_000):
+        sample.add(laps.iloc[start:start + 50_000])
+    sample_path = str(tmp_path / "sample.parquet")
+    sample.result().to_parquet(sample_path, index=False)
+
+    body = "ans_df = laps_df.groupby('driver', as_index=False).agg(laps=('lap_time', 'size'), avg=('lap_time', 'mean'))"
+    code = "\n".join([
+        sample_load_code("laps", sample_path, ["driver", "lap_time"]),
+        replicate_code("laps", body, "a" * 32, "b" * 32),
+    ])
+    exec(code, {"pd": pd, "np": np})
+
+    estimates, bounds, scaled = estimate_result(
+        read_result_table("a" * 32).to_pandas(), read_result_table("b" * 32).to_pandas(), scale=len(laps) / 20_000
+    )
+    assert scaled == ["laps"]
+    exact = laps.groupby("driver", as_index=False).agg(laps=("lap_time", "size"), avg=("lap_time", "mean"))
+    merged = exact.merge(bounds, on="driver")
+    assert (merged["laps"].between(merged["laps_low"], merged["laps_high"])).all()
+    assert (merged["avg"].between(merged["avg_low"], merged["avg_high"])).all()
+    assert (bounds["laps_high"] - bounds["laps_low"] < 0.1 * estimates["laps"]).all()
+
+
+def test_row_groups_cover_a_fraction(tmp_path):
+    path = str(tmp_path / "laps.parquet")
+    pq.write_table(pa.table({"n": range(1000)}), path, row_group_size=100)
+    selection, rows = choose_row_groups([path], 0.3)
+    assert len(selection) == 3 and rows == 300
+    assert choose_row_groups([path], 1.0) is None
+
+
+def test_an_approximate_stream_ends_with_the_stage_that_failed(client, monkeypatch):
+    client.post("/api/users/", json={"username": "estimator", "email": "estimator@example.com", "password": "pw"})
+    token = client.post("/api/token", data={"username": "estimator", "password": "pw"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    project_id = client.post("/api/projects/", headers=headers, json={"name": "laps"}).json()["id"]
+    files = {"file": ("laps.csv", io.BytesIO(b"driver,lap\nHamilton,1\n"), "text/csv")}
+    assert client.post(f"/api/projects/{project_id}/upload-dataset/", headers=headers, files=files).status_code == 200
+
+    async def prepared(*args):
+        return False, "", {}
+
+    async def sampled(http_request, stage, user_id, execution_id):
+        return {"stage": stage["stage"], "approximate": True, "datatable_json": "[]"}
+
+    async def cancelled(*args):
+        raise ExecutionCancelled("Client disconnected")
+
+    async def full(*args):
+        raise SchedulerFull("Too many executions are waiting", 503, 5)
+
+    monkeypatch.setattr(main, "prepare_query", prepared)
+    monkeypatch.setattr(main, "generate_aggregation_code", lambda **kwargs: "ans_df = laps_df")
+    monkeypatch.setattr(main, "approximate_stages", lambda *args: [{"stage": "sample"}, {"stage": "fraction_0.1"}])
+    monkeypatch.setattr(main, "run_approximate_stage", sampled)
+    monkeypatch.setattr(main, "run_aggregation", cancelled)
+
+    def stream():
+        response = client.post(
+            f"/api/projects/{project_id}/query", headers=headers, json={"question": "laps", "approximate": True}
+        )
+        assert response.status_code == 200
+        return [json.loads(line) for line in response.text.splitlines()]
+
+    lines = stream()
+    assert [line["stage"] for line in lines] == ["sample", "fraction_0.1", "exact"]
+    assert lines[-1]["error"] == "Client disconnected"
+
+    monkeypatch.setattr(main, "run_approximate_stage", full)
+    lines = stream()
+    assert [(line["stage"], line["error"]) for line in lines] == [("sample", "Too many executions are waiting")]
@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import auth
+from auth import (
+    PrincipalCache, create_access_token, get_current_user, get_password_hash_async, verify_password_async
+)
+from database.models import User
+
+
+@pytest.fixture
+def users(tmp_path, monkeypatch):
+    """A user table with one user, the async sessions reading it, and the statements they ran."""
+    path = tmp_path / "auth.db"
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(username="ada", email="ada@example.com", hashed_password="x"))
+        session.commit()
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    statements = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    monkeypatch.setattr(auth, "principal_cache", PrincipalCache(ttl=60))
+    yield engine, async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False), statements
+    asyncio.run(async_engine.dispose())
+
+
+def authenticate(sessions, token):
+    async def run():
+        async with sessions() as session:
+            return await get_current_user(token, session)
+    return asyncio.run(run())
+
+
+def test_the_user_is_read_once_per_ttl_and_again_after_it_changes(users):
+    engine, sessions, statements = users
+    token = create_access_token({"sub": "ada"})
+    first = authenticate(sessions, token)
+    assert [authenticate(sessions, token).email for _ in range(5)] == ["ada@example.com"] * 5
+    assert len(statements) == 1
+    assert auth.principal_cache.stats() == {"entries": 1, "hits": 5, "misses": 1}
+
+    with Session(engine) as session:
+        user = session.get(User, first.id)
+        user.email = "lovelace@example.com"
+        session.add(user)
+        session.commit()
+    assert authenticate(sessions, token).email == "lovelace@example.com"
+    assert len(statements) == 2
+
+    auth.principal_cache.ttl = 0.01
+    time.sleep(0.02)
+    authenticate(sessions, token)
+    assert len(statements) == 3
+
+    with pytest.raises(HTTPException):
+        authenticate(sessions, create_access_token({"sub": "nobody"}))
+
+
+def test_least_recently_used_principals_are_evicted():
+    cache = PrincipalCache(ttl=60, max_entries=2)
+    for i in range(3):
+        cache.put(f"user{i}", User(id=i, username=f"user{i}", email="", hashed_password=""))
+    assert cache.get("user0") is None
+    assert cache.get("user2").id == 2
+
+
+def test_passwords_are_hashed_and_checked_off_the_event_loop():
+    async def run():
+        hashed = await get_password_hash_async("secret")
+        return await asyncio.gather(verify_password_async("secret", hashed), verify_password_async("wrong", hashed))
+    assert asyncio.run(run()) == [True, False]
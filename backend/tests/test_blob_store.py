@@ -0,0 +1,129 @@
+import io
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlmodel import Session, SQLModel, create_engine
+
+import blob_store
+import main
+from blob_store import collect_garbage, release_blob, store_upload
+from database.models import Blob
+from ingestion import ingest_csv
+
+CONTENT = b"driver,wins\nHamilton,7\n"
+
+
+def blob_engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, "UPLOAD_DIRECTORY", str(tmp_path))
+    engine = create_engine(f"sqlite:///{tmp_path / 'blobs.db'}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def test_identical_uploads_are_stored_once_and_collected_when_unreferenced(tmp_path, monkeypatch):
+    engine = blob_engine(tmp_path, monkeypatch)
+
+    with Session(engine) as session:
+        blob, created = store_upload(session, io.BytesIO(CONTENT), chunk_size=4)
+        session.commit()
+        first_hash, path = blob.content_hash, blob.file_path
+        assert created and blob.size == len(CONTENT)
+        assert path.startswith(os.path.join(str(tmp_path), "blobs", first_hash[:2], first_hash[2:4]))
+        blob, created = store_upload(session, io.BytesIO(CONTENT))
+        session.commit()
+        assert (blob.content_hash, blob.file_path, blob.ref_count, created) == (first_hash, path, 2, False)
+    assert os.listdir(tmp_path / "blobs" / "tmp") == []
+
+    with Session(engine) as session:
+        release_blob(session, first_hash)
+        session.commit()
+    assert collect_garbage(engine) == 0
+    assert os.path.exists(path)
+
+    with Session(engine) as session:
+        release_blob(session, first_hash)
+        release_blob(session, first_hash)  # Never below zero
+        session.commit()
+        assert session.get(Blob, first_hash).ref_count == 0
+    assert collect_garbage(engine) == 1
+    assert not os.path.exists(path)
+    with Session(engine) as session:
+        assert session.get(Blob, first_hash) is None
+
+    # The same content uploaded after collection is stored afresh
+    with Session(engine) as session:
+        blob, created = store_upload(session, io.BytesIO(CONTENT))
+        session.commit()
+        assert created and blob.ref_count == 1 and os.path.exists(path)
+
+
+def test_concurrent_first_uploads_of_the_same_content_share_one_blob(tmp_path, monkeypatch):
+    engine = blob_engine(tmp_path, monkeypatch)
+
+    def upload(_):
+        with Session(engine) as session:
+            blob, created = store_upload(session, io.BytesIO(CONTENT))
+            session.commit()
+            return blob.content_hash, created
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(upload, range(16)))
+    assert len({content_hash for content_hash, _ in results}) == 1
+    assert sum(created for _, created in results) == 1
+    with Session(engine) as session:
+        assert session.get(Blob, results[0][0]).ref_count == 16
+    assert os.listdir(tmp_path / "blobs" / "tmp") == []
+
+
+def test_collection_leaves_a_blob_an_upload_is_taking_a_reference_to(tmp_path, monkeypatch):
+    engine = blob_engine(tmp_path, monkeypatch)
+    with Session(engine) as session:
+        blob, _ = store_upload(session, io.BytesIO(CONTENT))
+        session.commit()
+        release_blob(session, blob.content_hash)
+        session.commit()
+        content_hash, path = blob.content_hash, blob.file_path
+
+    with Session(engine) as session:
+        # The upload found the file and took its reference, but has not committed yet
+        blob, created = store_upload(session, io.BytesIO(CONTENT))
+        assert not created
+        collector = threading.Thread(target=collect_garbage, args=(engine,))
+        collector.start()
+        collector.join(0.2)
+        session.commit()
+    collector.join()
+    assert os.path.exists(path)
+    with Session(engine) as session:
+        assert session.get(Blob, content_hash).ref_count == 1
+
+
+
+def test_a_new_upload_is_converted_without_holding_the_database_write_lock(client, monkeypatch):
+    client.post("/api/users/", json={"username": "uploader", "email": "uploader@example.com", "password": "pw"})
+    token = client.post("/api/token", data={"username": "uploader", "password": "pw"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    project_id = client.post("/api/projects/", headers=headers, json={"name": "locks"}).json()["id"]
+    writable = []
+
+    def ingest(csv_path):
+        # Another writer gets in straight away while the file converts
+        connection = sqlite3.connect("test.db", timeout=0)
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.rollback()
+            writable.append(True)
+        except sqlite3.OperationalError:
+            writable.append(False)
+        finally:
+            connection.close()
+        return ingest_csv(csv_path)
+
+    monkeypatch.setattr(main, "ingest_csv", ingest)
+    files = {"file": ("locks.csv", io.BytesIO(os.urandom(8).hex().encode() + b"\n1\n"), "text/csv")}
+    response = client.post(f"/api/projects/{project_id}/upload-dataset/", headers=headers, files=files)
+    assert response.status_code == 200, response.text
+    assert writable == [True]
+    assert response.json()["parquet_path"]
@@ -0,0 +1,46 @@
+from code_analysis import merge_plans, projection_plan
+from database.models import QueryLanguage
+
+SCHEMAS = {
+    "wins": ["driver", "wins", "team", "year"],
+    "teams": ["team", "country", "founded"],
+    "laps": ["lap", "time"],
+}
+
+
+def python_plan(code):
+    return projection_plan(code, QueryLanguage.python, SCHEMAS)
+
+
+def test_python_loads_only_the_columns_a_query_selects():
+    assert python_plan("ans_df = wins_df.groupby('driver', as_index=False)['wins'].sum()") == {
+        "wins": ["driver", "wins"]
+    }
+    # Filtered and merged frames are followed through the intermediate variables
+    code = (
+        "recent_df = wins_df[wins_df.year > 2000]\n"
+        "merged_df = pd.merge(recent_df, teams_df, on='team')\n"
+        "ans_df = merged_df.groupby('country').agg(total=('wins', 'sum')).reset_index()"
+    )
+    assert python_plan(code) == {"wins": ["wins", "team", "year"], "teams": ["team", "country"]}
+
+
+def test_python_falls_back_to_full_tables_when_unsure():
+    assert python_plan("ans_df = wins_df[wins_df['year'] > 2000]") == {"wins": None}
+    assert python_plan("ans_df = wins_df.groupby('driver').sum()") == {"wins": None}
+    assert python_plan("ans_df = wins_df.dropna()[['driver']]") == {"wins": None}
+    assert python_plan("wins_df.columns = ['a', 'b', 'c', 'd']\nans_df = wins_df[['a']]") == {"wins": None}
+    assert python_plan("ans_df = globals()['wins_df']") == {"wins": None, "teams": None, "laps": None}
+    assert python_plan("ans_df = wins_df[") == {"wins": None, "teams": None, "laps": None}
+
+
+def test_sql_plan_and_merging():
+    sql = "SELECT w.driver, COUNT(*) FROM wins w JOIN teams t ON w.team = t.team WHERE t.country = 'Italy' GROUP BY 1"
+    # `wins` is also a column name, so it is loaded to be safe
+    assert projection_plan(sql, QueryLanguage.sql, SCHEMAS) == {
+        "wins": ["driver", "wins", "team"], "teams": ["team", "country"]
+    }
+    sql = "SELECT lap FROM laps WHERE time > 90"
+    assert projection_plan(sql, QueryLanguage.sql, SCHEMAS) == {"laps": ["lap", "time"]}
+    assert projection_plan("SELECT * FROM laps", QueryLanguage.sql, SCHEMAS) == {"laps": None}
+    assert merge_plans({"wins": ["driver"]}, {"wins": ["wins"], "laps": None}) == {"wins": ["driver", "wins"], "laps": None}
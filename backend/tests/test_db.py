@@ -0,0 +1,135 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event, inspect, text
+from sqlmodel import Session, SQLModel, create_engine, select
+from starlette.requests import Request
+
+import database.db as db
+from database.db import async_url, create_engines, dispose_engines, engine_options, upgrade_schema
+from database.models import Dataset, DatasetColumn, DatasetProfile, Project, User
+from main import dataset_source, get_owned_project, not_modified, project_validators
+
+
+def test_async_drivers_and_pool_options():
+    assert async_url("postgresql://u:secret@db:5432/app") == "postgresql+asyncpg://u:secret@db:5432/app"
+    assert async_url("postgresql+psycopg2://u@db/app") == "postgresql+asyncpg://u@db/app"
+    assert async_url("sqlite:///./test.db") == "sqlite+aiosqlite:///./test.db"
+    with pytest.raises(ValueError):
+        async_url("mysql://u@db/app")
+    assert engine_options("postgresql://db/app")["pool_size"] > 0
+    assert "pool_size" not in engine_options("sqlite:///./test.db")
+    assert engine_options("sqlite:///./test.db")["echo"] is False
+
+
+@pytest.fixture
+def restore_engines():
+    saved = db.engine, db.async_engine, db.async_session_maker
+    yield
+    db.engine, db.async_engine, db.async_session_maker = saved
+
+
+def test_a_project_loads_with_its_datasets_in_a_fixed_number_of_queries(tmp_path, restore_engines):
+    engine, async_engine = create_engines(f"sqlite:///{tmp_path / 'app.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        owner, other = User(username="a", email="a", hashed_password="x"), User(username="b", email="b", hashed_password="x")
+        session.add_all([owner, other])
+        session.commit()
+        project = Project(name="p", owner_id=owner.id)
+        project.datasets = [
+            Dataset(
+                file_name=f"t{i}.csv", file_path=f"t{i}.csv", table_name=f"t{i}",
+                columns=[DatasetColumn(position=0, name="x", dtype="int64")],
+                profile=DatasetProfile(status="ready", profile_json="{}") if i % 2 else None,
+            )
+            for i in range(5)
+        ]
+        session.add(project)
+        session.commit()
+        project_id, owner_id, other_id = project.id, owner.id, other.id
+
+    statements = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    async def load(user_id):
+        async with db.async_session_maker() as session:
+            return await get_owned_project(session, project_id, User(id=user_id, username="", email="", hashed_password=""))
+
+    loaded = asyncio.run(load(owner_id))
+    assert len(statements) == 4  # The project, its datasets, their columns and their segments
+    # Everything is there after the session has closed, without lazy loads
+    assert [len(ds.columns) for ds in loaded.datasets] == [1] * 5
+    assert [ds.profile is not None for ds in loaded.datasets] == [False, True, False, True, False]
+    assert all(ds.segments == [] for ds in loaded.datasets)
+    with pytest.raises(HTTPException):
+        asyncio.run(load(other_id))
+    asyncio.run(dispose_engines())
+
+
+# The tables as the first release created them, before any column or index was added
+BASELINE_SCHEMA = [
+    """CREATE TABLE user (id INTEGER NOT NULL PRIMARY KEY, username VARCHAR NOT NULL, email VARCHAR NOT NULL,
+       hashed_password VARCHAR NOT NULL, UNIQUE (email))""",
+    "CREATE UNIQUE INDEX ix_user_username ON user (username)",
+    """CREATE TABLE project (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR NOT NULL, description VARCHAR,
+       owner_id INTEGER NOT NULL, FOREIGN KEY(owner_id) REFERENCES user (id))""",
+    "CREATE INDEX ix_project_name ON project (name)",
+    """CREATE TABLE dataset (id INTEGER NOT NULL PRIMARY KEY, file_name VARCHAR NOT NULL, file_path VARCHAR NOT NULL,
+       description VARCHAR, table_name VARCHAR NOT NULL, project_id INTEGER NOT NULL,
+       FOREIGN KEY(project_id) REFERENCES project (id))""",
+    "CREATE INDEX ix_dataset_table_name ON dataset (table_name)",
+    "INSERT INTO user VALUES (1, 'ada', 'ada@example.com', 'x')",
+    "INSERT INTO project VALUES (1, 'p', NULL, 1)",
+    "INSERT INTO dataset VALUES (1, 'wins.csv', '/uploads/wins.csv', NULL, 'wins', 1)",
+]
+
+
+def test_a_database_from_the_first_release_is_upgraded_in_place(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        for statement in BASELINE_SCHEMA:
+            connection.execute(text(statement))
+
+    upgrade_schema(engine)
+    upgrade_schema(engine)  # Idempotent
+    columns = {table: {column["name"] for column in inspect(engine).get_columns(table)} for table in ("project", "dataset")}
+    assert {"updated_at"} <= columns["project"] and {"parquet_path", "content_hash"} <= columns["dataset"]
+    assert "ix_project_owner_id_id" in {index["name"] for index in inspect(engine).get_indexes("project")}
+    assert {"ix_dataset_project_id_id", "ix_dataset_content_hash"} <= {
+        index["name"] for index in inspect(engine).get_indexes("dataset")
+    }
+
+    # Rows from before the upgrade load, with the new columns empty: the dataset still loads from its CSV
+    with Session(engine) as session:
+        project = session.exec(select(Project)).one()
+        assert project.updated_at is None
+        dataset = session.exec(select(Dataset)).one()
+        assert (dataset.parquet_path, dataset.content_hash) == (None, None)
+        assert dataset_source(dataset) == "/uploads/wins.csv"
+        assert [ds.table_name for ds in project.datasets] == ["wins"]
+
+    with engine.connect() as connection:
+        plan = connection.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM project WHERE owner_id = 1 AND id > 10 ORDER BY id LIMIT 51"
+        )).fetchall()
+    assert "ix_project_owner_id_id" in str(plan)
+
+
+def conditional_request(**headers):
+    raw = [(name.replace("_", "-").lower().encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+def test_projects_are_not_modified_while_their_stamp_matches():
+    etag, last_modified = project_validators(7, datetime(2024, 5, 1, 12, 0, 0, 250000))
+    assert etag == '"project-7-1714564800250000"' and last_modified.tzinfo is not None
+    assert not_modified(conditional_request(if_none_match=etag), etag, last_modified)
+    assert not_modified(conditional_request(if_none_match=f'"other", W/{etag}'), etag, last_modified)
+    assert not not_modified(conditional_request(if_none_match='"other"'), etag, last_modified)
+    assert not_modified(conditional_request(if_modified_since="Wed, 01 May 2024 12:00:00 GMT"), etag, last_modified)
+    assert not not_modified(conditional_request(if_modified_since="Wed, 01 May 2024 11:59:59 GMT"), etag, last_modified)
+    assert not not_modified(conditional_request(if_modified_since="yesterday"), etag, last_modified)
+    assert not not_modified(conditional_request(), etag, last_modified)
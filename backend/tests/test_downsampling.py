@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from downsampling import OTHER_LABEL, bin_histogram, bin_scatter, lttb_indices, reduce_for_chart, top_n
+
+
+def test_lttb_keeps_the_ends_and_the_peaks():
+    x = np.arange(10_000, dtype=float)
+    y = np.sin(x / 500)
+    y[4321] = 50.0
+    picked = lttb_indices(x, y, 200)
+    assert len(picked) == 200
+    assert (picked[0], picked[-1]) == (0, 9999)
+    assert 4321 in picked
+    assert np.all(np.diff(picked) > 0)
+
+    df = pd.DataFrame({"t": x, "v": y, "series": np.where(x % 2 == 0, "a", "b")})
+    reduced, note = reduce_for_chart(df, "line", "t", "v", "series", max_points=100)
+    assert note and len(reduced) == 100
+    assert set(reduced["series"]) == {"a", "b"}
+
+
+def test_binned_charts_account_for_every_row():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"a": rng.normal(size=20_000), "b": rng.normal(size=20_000), "w": rng.integers(1, 5, 20_000)})
+    cells = bin_scatter(df, "a", "b", 20)
+    assert len(cells) <= 400
+    assert cells["count"].sum() == len(df)
+
+    counts, column = bin_histogram(df, "a", None, 30)
+    assert (column, len(counts), counts["count"].sum()) == ("count", 30, len(df))
+    totals, column = bin_histogram(df, "a", "w", 30)
+    assert (column, totals["w"].sum()) == ("w", df["w"].sum())
+
+
+def test_top_n_folds_the_tail_into_other():
+    df = pd.DataFrame({"driver": [f"d{i}" for i in range(40)], "wins": list(range(40))})
+    reduced, column = top_n(df, "driver", "wins", 5)
+    assert reduced["driver"].tolist() == ["d39", "d38", "d37", "d36", OTHER_LABEL]
+    assert reduced["wins"].sum() == df["wins"].sum()
+    assert column == "wins"
+
+    small, note = reduce_for_chart(df.head(10), "bar", "driver", "wins")
+    assert note is None and len(small) == 10
@@ -0,0 +1,30 @@
+import pandas as pd
+
+from ingestion import convert_csv_to_parquet, ingest_csv, load_expression
+
+
+def test_column_that_changes_type_late_in_the_file_is_read_as_text(tmp_path):
+    csv_path = tmp_path / "laps.csv"
+    rows = "".join(f"{i},{i * 1.5}\n" for i in range(5000))
+    csv_path.write_text(f"lap,time\n{rows}DNF,1.0\n")
+
+    schema = convert_csv_to_parquet(str(csv_path), str(tmp_path / "laps.parquet"), block_size=4096)
+
+    assert str(schema.field("lap").type) == "string"
+    assert str(schema.field("time").type) == "double"
+    df = pd.read_parquet(tmp_path / "laps.parquet")
+    assert len(df) == 5001
+    assert df["lap"].iloc[-1] == "DNF"
+
+
+def test_ingest_records_dtypes_and_falls_back_to_csv(tmp_path):
+    csv_path = tmp_path / "wins.csv"
+    csv_path.write_text("driver,wins\nHamilton,7\n")
+    parquet_path, columns = ingest_csv(str(csv_path))
+    assert parquet_path.endswith("wins.parquet")
+    assert columns[1] == ("wins", "int64")
+    assert load_expression(parquet_path).startswith("pd.read_parquet(")
+
+    empty_path = tmp_path / "empty.csv"
+    empty_path.write_text("")
+    assert ingest_csv(str(empty_path)) == (None, [])
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from kernel_pool import ExecutionLimits, KernelPool, KernelPoolExhausted
+
+
+def run_with_pool(scenario, **options):
+    """Runs `scenario(pool)` against a fresh single-kernel pool."""
+    async def main():
+        pool = KernelPool(min_size=1, max_size=1, health_check_interval=60, lease_timeout=5, **options)
+        await pool.start()
+        try:
+            return await scenario(pool)
+        finally:
+            await pool.shutdown()
+    return asyncio.run(main())
+
+
+async def wait_for_idle(pool, timeout=60):
+    for _ in range(int(timeout * 10)):
+        if pool.stats()["idle"]:
+            return
+        await asyncio.sleep(0.1)
+
+
+def test_namespace_is_reset_between_leases():
+    async def scenario(pool):
+        async with pool.lease() as kernel:
+            first_pid = kernel.pid
+            await kernel.execute("leftover = 42")
+        await wait_for_idle(pool)
+        async with pool.lease() as kernel:
+            assert kernel.pid == first_pid
+            return await kernel.execute("print('leftover' in dir())")
+
+    results = run_with_pool(scenario)
+    assert results[-1]["text"].strip() == "False"
+
+
+def test_kernel_is_recycled_after_max_executions():
+    async def scenario(pool):
+        pids = []
+        for _ in range(3):
+            await wait_for_idle(pool)
+            async with pool.lease() as kernel:
+                pids.append(kernel.pid)
+        return pids
+
+    pids = run_with_pool(scenario, max_executions=2)
+    assert pids[0] == pids[1]
+    assert pids[2] != pids[0]
+
+
+def test_lease_times_out_when_pool_is_full():
+    async def scenario(pool):
+        async with pool.lease():
+            with pytest.raises(KernelPoolExhausted):
+                async with pool.lease(timeout=0.5):
+                    pass
+
+    run_with_pool(scenario)
+
+
+def test_silent_long_computation_is_not_cut_off():
+    async def scenario(pool):
+        async with pool.lease() as kernel:
+            return await kernel.execute("import time\ntime.sleep(1.5)\nprint('done')", ExecutionLimits(timeout=30))
+
+    results = run_with_pool(scenario)
+    assert results[-1]["text"].strip() == "done"
+
+
+def test_deadline_interrupts_runaway_loop_and_kernel_survives():
+    async def scenario(pool):
+        async with pool.lease() as kernel:
+            timed_out = await kernel.execute("while True:\n    print('x')", ExecutionLimits(timeout=1))
+            after = await kernel.execute("print('still alive')")
+            return timed_out, after, kernel.broken
+
+    timed_out, after, broken = run_with_pool(scenario)
+    assert timed_out[-1]["ename"] == "ExecutionTimeout"
+    assert after[-1]["text"].strip() == "still alive"
+    assert not broken
+
+
+def test_cancelling_the_task_interrupts_the_kernel():
+    async def scenario(pool):
+        async with pool.lease() as kernel:
+            task = asyncio.create_task(kernel.execute("import time\ntime.sleep(60)"))
+            await asyncio.sleep(1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return await asyncio.wait_for(kernel.execute("print('free')"), 10)
+
+    assert run_with_pool(scenario)[-1]["text"].strip() == "free"
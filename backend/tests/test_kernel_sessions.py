@@ -0,0 +1,102 @@
+import asyncio
+import os
+
+import pytest
+
+from kernel_pool import ExecutionLimits
+from kernel_sessions import SessionManager
+
+
+def run_with_manager(scenario):
+    async def main():
+        manager = SessionManager(max_sessions=1, memory_budget_mb=0, idle_timeout=600)
+        await manager.start()
+        try:
+            return await scenario(manager)
+        finally:
+            await manager.shutdown()
+    return asyncio.run(main())
+
+
+def stdout(results):
+    return "".join(res["text"] for res in results if res["type"] == "stdout").strip()
+
+
+def test_session_keeps_tables_and_reloads_only_changed_files(tmp_path):
+    wins = tmp_path / "wins.csv"
+    teams = tmp_path / "teams.csv"
+    wins.write_text("driver,wins\nHamilton,7\n")
+    teams.write_text("team\nMercedes\n")
+    tables = {"wins": str(wins), "teams": str(teams)}
+
+    async def scenario(manager):
+        async with manager.lease(1, tables) as session:
+            # User code must not be able to change the loaded copy.
+            await session.execute("wins_df['wins'] = 0\nteams_marker = id(teams_df)")
+            assert stdout(await session.execute("print(int(wins_df['wins'].sum()))")) == "7"
+            teams_id = stdout(await session.execute("print(id(_session_tables['teams']))"))
+
+        wins.write_text("driver,wins\nHamilton,7\nVerstappen,3\n")
+        os.utime(wins, ns=(1, 1))
+        await manager.refresh_project(1, tables)
+
+        async with manager.lease(1, tables) as session:
+            assert stdout(await session.execute("print(len(wins_df))")) == "2"
+            assert stdout(await session.execute("print(id(_session_tables['teams']))")) == teams_id
+            assert stdout(await session.execute("print('teams_marker' in dir())")) == "False"
+
+    run_with_manager(scenario)
+
+
+def test_least_recently_used_session_is_evicted(tmp_path):
+    data = tmp_path / "data.csv"
+    data.write_text("a\n1\n")
+
+    async def scenario(manager):
+        async with manager.lease(1, {"data": str(data)}):
+            pass
+        async with manager.lease(2, {"data": str(data)}):
+            pass
+        return manager.stats()["sessions"]
+
+    assert run_with_manager(scenario) == 1
+
+
+def test_the_memory_limit_applies_to_what_a_run_adds_to_the_loaded_tables(tmp_path):
+    data = tmp_path / "data.csv"
+    data.write_text("a\n1\n")
+
+    async def scenario(manager):
+        async with manager.lease(1, {"data": str(data)}) as session:
+            # A large preloaded table: the kernel already holds more than the limit
+            await session.execute(
+                "import numpy as np\nimport pandas as pd\n_session_tables['big'] = pd.DataFrame({'x': np.ones(25_000_000)})"
+            )
+            limits = ExecutionLimits(timeout=30, memory_mb=100)
+            small = await session.execute("print(len(data_df))", limits)
+            large = await session.execute(
+                "import time\nimport numpy as np\nextra = np.ones(20_000_000)\ntime.sleep(2)\nprint('done')", limits
+            )
+            return small, large
+
+    small, large = run_with_manager(scenario)
+    assert stdout(small) == "1"
+    assert [res["ename"] for res in large if res["type"] == "error"] == ["MemoryLimitExceeded"]
+
+
+def test_the_memory_budget_is_enforced_after_a_lease_that_failed(tmp_path):
+    data = tmp_path / "data.csv"
+    data.write_text("a\n1\n")
+
+    async def main():
+        manager = SessionManager(max_sessions=1, memory_budget_mb=1, idle_timeout=600)
+        await manager.start()
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                async with manager.lease(1, {"data": str(data)}):
+                    raise asyncio.TimeoutError
+            return manager.stats()["sessions"]
+        finally:
+            await manager.shutdown()
+
+    assert asyncio.run(main()) == 0
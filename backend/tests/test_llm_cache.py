@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+import llm_service
+from database.models import QueryLanguage
+from llm_cache import LLMCache, normalize_question, question_similarity
+from llm_providers import ProviderError
+
+TABLES = [{
+    "variable_name": "wins_df", "table_name": "wins", "description": "Race wins",
+    "columns_with_types": {"driver": "object", "wins": "int64"},
+}]
+
+
+def test_rewordings_match_but_different_questions_do_not():
+    same = normalize_question("Show me the total wins per driver!")
+    assert same == normalize_question("Could you give me total wins per driver") == "sum win per driver"
+    assert normalize_question("How many races per season?") == normalize_question("what is the number races per season")
+    assert question_similarity(normalize_question("wins by driver"), normalize_question("drivers by wins")) < 0.8
+    assert question_similarity(normalize_question("top 10 drivers"), normalize_question("top 5 drivers")) == 0
+    # A range is not two specific years
+    between, both = normalize_question("races from 2010 to 2020"), normalize_question("races in 2010 and 2020")
+    assert between != both and question_similarity(between, both) == 0
+
+
+def test_cache_is_lru_persistent_and_expires(tmp_path):
+    path = str(tmp_path / "llm.db")
+    cache = LLMCache(path, max_entries=2, ttl=0, similarity=0.5)
+    cache.put("scope", "sum win driver", "code-a")
+    cache.put("scope", "count race", "code-b")
+    assert cache.get("scope", "sum win driver") == "code-a"
+    assert cache.get("other", "sum win driver") is None
+    cache.put("scope", "average point team season since 2010", "code-c")
+    assert cache.get("scope", "count race") is None
+    assert cache.get("scope", "since 2010 average point team season") == "code-c"
+    assert cache.stats() == {"entries": 2, "hits": 1, "near_hits": 1, "misses": 2}
+
+    reopened = LLMCache(path, ttl=0)
+    assert reopened.get("scope", "sum win driver") == "code-a"
+    reopened.ttl = 0.01
+    time.sleep(0.02)
+    assert reopened.get("scope", "sum win driver") is None
+
+
+def test_generation_uses_the_cache_unless_bypassed(tmp_path, monkeypatch):
+    cache = LLMCache(str(tmp_path / "llm.db"))
+    monkeypatch.setattr(llm_service, "get_llm_cache", lambda: cache)
+    calls = []
+
+    def provider(prompt, provider, model):
+        calls.append(prompt)
+        if len(calls) == 1:
+            raise ProviderError("rate limited")
+        return f"```python\nans_df = wins_df  # {len(calls)}\n```"
+
+    monkeypatch.setattr(llm_service, "_call_provider", provider)
+
+    def generate(question, tables=TABLES, **kwargs):
+        return llm_service.generate_aggregation_code(question, tables, QueryLanguage.python, "gemini", "m", **kwargs)
+
+    with pytest.raises(ProviderError):
+        generate("Total wins per driver")
+    assert generate("Total wins per driver") == "ans_df = wins_df  # 2"
+    assert generate("Please show total wins per driver?") == "ans_df = wins_df  # 2"
+    assert generate("total wins by driver", use_cache=False) == "ans_df = wins_df  # 3"
+    renamed = [{**TABLES[0], "columns_with_types": {"driver": "object", "victories": "int64"}}]
+    assert generate("total wins by driver", tables=renamed) == "ans_df = wins_df  # 4"
+    assert len(calls) == 4
@@ -0,0 +1,166 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from llm_providers import CircuitOpen, OllamaClient, OpenRouterClient, ProviderError, ProviderPool, RateLimiter
+
+
+class StubProvider:
+    """A local server speaking the OpenAI chat completions and Ollama generate APIs."""
+
+    def __init__(self, answer: str, statuses=(), delay: float = 0):
+        self.answer, self.statuses, self.delay = answer, list(statuses), delay
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.requests += 1
+                status = stub.statuses.pop(0) if stub.statuses else 200
+                time.sleep(stub.delay)
+                if request.get("stream") and status == 200:
+                    return self.stream(self.path.endswith("/chat/completions"))
+                if self.path.endswith("/chat/completions"):
+                    body = {"id": "1", "object": "chat.completion", "created": 0, "model": "m", "choices": [
+                        {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": stub.answer}}
+                    ]}
+                else:
+                    body = {"model": "m", "created_at": "2024-01-01T00:00:00Z", "response": stub.answer, "done": True}
+                if status != 200:
+                    body = {"error": {"message": f"status {status}"}}
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def stream(self, chat: bool):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream" if chat else "application/x-ndjson")
+                self.end_headers()
+                for word in stub.answer.split(" "):
+                    piece = word + " "
+                    if chat:
+                        chunk = {"id": "1", "object": "chat.completion.chunk", "created": 0, "model": "m", "choices": [
+                            {"index": 0, "delta": {"content": piece}, "finish_reason": None}
+                        ]}
+                        line = f"data: {json.dumps(chunk)}\n\n"
+                    else:
+                        line = json.dumps({"model": "m", "created_at": "2024-01-01T00:00:00Z", "response": piece,
+                                           "done": False}) + "\n"
+                    self.wfile.write(line.encode())
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n" if chat else json.dumps({
+                    "model": "m", "created_at": "2024-01-01T00:00:00Z", "response": "", "done": True
+                }).encode() + b"\n")
+                self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.handle_error = lambda request, address: None  # Clients that timed out hang up
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stubs():
+    servers = []
+
+    def start(*args, **kwargs):
+        servers.append(StubProvider(*args, **kwargs))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def openrouter(stub, timeout=5.0):
+    return OpenRouterClient(base_url=f"{stub.url}/v1", api_key="test", timeout=timeout)
+
+
+def test_transient_failures_are_retried_and_bad_requests_are_not(stubs):
+    flaky = stubs("ans_df = wins_df", statuses=[503, 429])
+    pool = ProviderPool({"openrouter": openrouter(flaky)}, retries=2, base_delay=0.01)
+    assert pool.generate("prompt", "openrouter", "m") == "ans_df = wins_df"
+    assert flaky.requests == 3
+
+    rejected = stubs("unused", statuses=[400])
+    pool = ProviderPool({"openrouter": openrouter(rejected)}, retries=2, base_delay=0.01)
+    with pytest.raises(ProviderError):
+        pool.generate("prompt", "openrouter", "m")
+    assert rejected.requests == 1
+
+    slow = stubs("late", delay=0.5)
+    pool = ProviderPool({"openrouter": openrouter(slow, timeout=0.1)}, retries=1, base_delay=0.01)
+    with pytest.raises(ProviderError):
+        pool.generate("prompt", "openrouter", "m")
+    assert slow.requests == 2
+
+
+def test_circuit_opens_after_repeated_failures_and_recovers(stubs):
+    down = stubs("ans_df = wins_df", statuses=[500, 500])
+    pool = ProviderPool({"openrouter": openrouter(down)}, retries=0, breaker_failures=2, breaker_reset=0.2)
+    for _ in range(2):
+        with pytest.raises(ProviderError):
+            pool.generate("prompt", "openrouter", "m")
+    with pytest.raises(CircuitOpen) as opened:
+        pool.generate("prompt", "openrouter", "m")
+    assert opened.value.retry_after == 1
+    assert down.requests == 2
+    assert pool.stats()["circuits"] == {"openrouter": "open"}
+
+    time.sleep(0.25)
+    assert pool.generate("prompt", "openrouter", "m") == "ans_df = wins_df"
+    assert pool.stats()["circuits"] == {"openrouter": "closed"}
+
+
+def test_a_slow_primary_is_hedged_with_the_backup_provider(stubs):
+    slow, fast = stubs("from openrouter", delay=1.0), stubs("from ollama")
+    clients = {"openrouter": openrouter(slow), "ollama": OllamaClient(host=fast.url, timeout=5)}
+    pool = ProviderPool(clients, hedge=("ollama", "llama3"), hedge_delay=0.05)
+    started = time.monotonic()
+    assert pool.generate("prompt", "openrouter", "m") == "from ollama"
+    assert time.monotonic() - started < 0.9
+    assert (pool.stats()["hedged"], pool.stats()["hedge_wins"]) == (1, 1)
+
+    slow.delay = 0
+    assert pool.generate("prompt", "openrouter", "m") == "from openrouter"
+    assert fast.requests == 1
+
+
+def test_streams_arrive_in_pieces_and_retry_before_the_first_one(stubs):
+    chat, local = stubs("ans_df = wins_df.head()", statuses=[503]), stubs("ans_df = wins_df")
+    pool = ProviderPool({"openrouter": openrouter(chat), "ollama": OllamaClient(host=local.url, timeout=5)},
+                        retries=1, base_delay=0.01)
+    pieces = list(pool.stream("openrouter", "prompt", "m"))
+    assert pieces == ["ans_df ", "= ", "wins_df.head() "]
+    assert chat.requests == 2
+    assert "".join(pool.stream("ollama", "prompt", "m")).strip() == "ans_df = wins_df"
+
+
+def test_calls_beyond_the_burst_wait_for_the_rate_limit(stubs):
+    limiter = RateLimiter(per_minute=600, burst=2)
+    assert [limiter.acquire() for _ in range(2)] == [0.0, 0.0]
+    started = time.monotonic()
+    limiter.acquire()
+    limiter.acquire()
+    assert 0.15 < time.monotonic() - started < 0.5
+
+    stub = stubs("ans_df = wins_df")
+    pool = ProviderPool({"openrouter": openrouter(stub)}, rate_limits={"openrouter": 1200, "ollama": 0})
+    for _ in range(8):
+        assert pool.generate("prompt", "openrouter", "m") == "ans_df = wins_df"
+    assert pool.stats()["throttled"] >= 1
+    assert RateLimiter(per_minute=0).acquire() == 0.0
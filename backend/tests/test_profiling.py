@@ -0,0 +1,56 @@
+import pandas as pd
+
+from profiling import HyperLogLog, Reservoir, RowSample, TopK, profile_file
+
+
+def test_hyperloglog_estimate_is_close():
+    hll = HyperLogLog()
+    for start in range(0, 200_000, 50_000):
+        hll.add(pd.Series(range(start, start + 50_000)))
+        hll.add(pd.Series(range(start, start + 1_000)))  # Repeats must not count twice
+    assert abs(hll.count() - 200_000) / 200_000 < 0.05
+
+    small = HyperLogLog()
+    small.add(pd.Series(["a", "b", "c", "a"]))
+    assert small.count() == 3
+
+
+def test_top_k_and_reservoir_over_chunks():
+    top = TopK(k=2, capacity=5)
+    reservoir = Reservoir(size=3, seed=0)
+    for _ in range(10):
+        chunk = pd.Series(["red"] * 50 + ["blue"] * 20 + [f"rare{i}" for i in range(10)])
+        top.add(chunk)
+        reservoir.add(chunk)
+    assert [value for value, _ in top.top()] == ["red", "blue"]
+    assert top.top()[0][1] == 500
+    assert len(reservoir.items) == 3 and reservoir.seen == 800
+
+
+def test_profile_file_reads_in_batches(tmp_path):
+    path = tmp_path / "laps.parquet"
+    pd.DataFrame({
+        "driver": ["Hamilton", "Verstappen", None, "Hamilton"] * 250,
+        "lap_time": [90.5, 91.0, 89.9, None] * 250,
+    }).to_parquet(path)
+
+    profile = profile_file(str(path), batch_rows=64)
+
+    assert profile["row_count"] == 1000
+    driver, lap_time = profile["columns"]["driver"], profile["columns"]["lap_time"]
+    assert driver["null_fraction"] == 0.25
+    assert driver["distinct_count"] == 2
+    assert driver["top_values"][0] == ["Hamilton", 500]
+    assert (lap_time["min"], lap_time["max"]) == (89.9, 91.0)
+    assert len(lap_time["sample"]) == 5
+
+
+def test_row_sample_is_uniform_and_shuffled():
+    sample = RowSample(size=1000, seed=0)
+    for start in range(0, 100_000, 7_000):
+        sample.add(pd.DataFrame({"n": range(start, min(start + 7_000, 100_000))}))
+    rows = sample.result()
+    assert len(rows) == 1000 and sample.seen == 100_000
+    assert rows["n"].is_unique
+    assert abs(rows["n"].mean() - 50_000) < 3_000  # Both early and late batches are represented
+    assert not rows["n"].is_monotonic_increasing
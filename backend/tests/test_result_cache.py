@@ -0,0 +1,151 @@
+import time
+from collections import defaultdict
+
+import pyarrow as pa
+
+import result_store
+from result_cache import DiskResultCache, MemoryResultCache, RedisResultCache, cache_key, is_cacheable
+from result_store import result_exists, write_result_table
+
+
+def test_keys_follow_code_and_data_versions():
+    key = cache_key("code", {"wins": "v1"}, "duckdb")
+    assert key == cache_key("code", {"wins": "v1"}, "duckdb")
+    assert key != cache_key("code", {"wins": "v2"}, "duckdb")
+    assert key != cache_key("code", {"wins": "v1"}, "pandasql")
+    assert is_cacheable("ans_df = wins_df.groupby('driver')['wins'].sum()")
+    assert not is_cacheable("ans_df = wins_df.sample(10)")
+    assert not is_cacheable("ans_df = pd.DataFrame({'t': [pd.Timestamp.now()]})")
+
+
+def results(tmp_path, monkeypatch, count):
+    monkeypatch.setattr(result_store, "RESULT_DIRECTORY", str(tmp_path))
+    return [write_result_table(pa.table({"n": [i]})) for i in range(count)]
+
+
+def test_memory_cache_evicts_least_recently_used_by_size_and_expires(tmp_path, monkeypatch):
+    a, b, c = results(tmp_path, monkeypatch, 3)
+    cache = MemoryResultCache(max_bytes=100, ttl=0)
+    cache.put("a", a, 40, {"wins": "v1"})
+    cache.put("b", b, 40, {"wins": "v1"})
+    assert cache.get("a")["result_id"] == a
+    cache.put("c", c, 40, {"teams": "t1"})
+    assert cache.get("b") is None
+    assert cache.stats()["bytes"] == 80
+    # The budget bounds the files, not just the index
+    assert not result_exists(b)
+
+    assert cache.invalidate_version("v1") == 1
+    assert cache.get("a") is None and not result_exists(a)
+    assert cache.get("c") is not None
+
+    cache.ttl = 0.01
+    time.sleep(0.02)
+    assert cache.get("c") is None and not result_exists(c)
+    assert cache.stats() == {"entries": 0, "bytes": 0, "hits": 2, "misses": 3}
+
+
+def test_disk_cache_survives_a_restart(tmp_path, monkeypatch):
+    a, b = results(tmp_path, monkeypatch, 2)
+    path = str(tmp_path / "cache.db")
+    cache = DiskResultCache(path, max_bytes=100, ttl=0)
+    cache.put("a", a, 10, {"wins": "v1"})
+    cache.put("b", b, 10, {"wins": "v2"})
+    cache.invalidate_version("v2")
+
+    reopened = DiskResultCache(path, max_bytes=100, ttl=0)
+    assert reopened.get("a")["result_id"] == a
+    assert reopened.get("b") is None and not result_exists(b)
+
+
+class FakeRedis:
+    """The Redis commands RedisResultCache uses, in memory, counting round trips."""
+
+    def __init__(self):
+        self.values, self.zsets, self.hashes, self.sets = {}, defaultdict(dict), defaultdict(dict), defaultdict(set)
+        self.commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self, f"_{name}")
+
+        def command(*args, **kwargs):
+            self.commands.append(name)
+            return method(*args, **kwargs)
+        return command
+
+    def pipeline(self):
+        redis, calls = self, []
+
+        class Pipeline:
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: calls.append((name, args, kwargs))
+
+            def execute(self):
+                redis.commands.append("pipeline")
+                return [getattr(redis, f"_{name}")(*args, **kwargs) for name, args, kwargs in calls]
+        return Pipeline()
+
+    def _get(self, key):
+        return self.values.get(key)
+
+    def _set(self, key, value, ex=None):
+        self.values[key] = value.encode()
+
+    def _delete(self, key):
+        self.values.pop(key, None)
+        self.sets.pop(key, None)
+
+    def _zadd(self, key, mapping):
+        self.zsets[key].update({member.encode(): score for member, score in mapping.items()})
+
+    def _zrem(self, key, member):
+        self.zsets[key].pop(member.encode(), None)
+
+    def _zcard(self, key):
+        return len(self.zsets[key])
+
+    def _zpopmin(self, key):
+        member = min(self.zsets[key], key=self.zsets[key].get)
+        return [(member, self.zsets[key].pop(member))]
+
+    def _hset(self, key, field, value):
+        self.hashes[key][field] = str(value).encode()
+
+    def _hget(self, key, field):
+        return self.hashes[key].get(field)
+
+    def _hdel(self, key, field):
+        self.hashes[key].pop(field, None)
+
+    def _hvals(self, key):
+        return list(self.hashes[key].values())
+
+    def _sadd(self, key, member):
+        self.sets[key].add(member.encode())
+
+    def _srem(self, key, member):
+        self.sets[key].discard(member.encode())
+
+    def _smembers(self, key):
+        return set(self.sets.get(key, ()))
+
+
+def test_redis_cache_invalidates_a_version_without_scanning_every_entry(tmp_path, monkeypatch):
+    ids = results(tmp_path, monkeypatch, 12)
+    cache = RedisResultCache(max_bytes=1000, ttl=0)  # Does not connect until it is used
+    cache.redis = FakeRedis()
+    for i, result_id in enumerate(ids[:10]):
+        cache.put(f"k{i}", result_id, 10, {"wins": "v1" if i < 2 else f"other{i}"})
+
+    cache.redis.commands.clear()
+    assert cache.invalidate_version("v1") == 2
+    # One lookup for the version's keys, then a read and a pipelined delete per entry, then the set itself
+    assert cache.redis.commands == ["smembers", "get", "pipeline", "get", "pipeline", "delete"]
+    assert not result_exists(ids[0]) and not result_exists(ids[1]) and result_exists(ids[2])
+    assert cache.get("k0") is None and cache.get("k2")["result_id"] == ids[2]
+
+    # Eviction deletes the files too
+    cache.max_bytes = 20
+    cache.put("k10", ids[10], 10, {"wins": "v2"})
+    assert cache.stats()["entries"] == 2
+    assert sum(result_exists(result_id) for result_id in ids[:11]) == 2
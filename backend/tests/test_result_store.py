@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+import pyarrow as pa
+
+import main
+import result_store
+from kernel_pool import KernelPool
+from result_store import (
+    chart_writer_code, code_fingerprint, new_result_id, pop_chart_json, read_result_table,
+    result_loader_code, result_writer_code, strip_figure_output, write_result_table
+)
+
+
+def test_code_fingerprint_ignores_blank_lines_and_trailing_whitespace():
+    code = "ans_df = wins_df  \n\nans_df = ans_df.head()\n"
+    assert code_fingerprint("python", code) == code_fingerprint("python", "ans_df = wins_df\nans_df = ans_df.head()")
+    assert code_fingerprint("python", code) != code_fingerprint("sql", code)
+
+
+def test_table_and_chart_come_from_one_execution_and_chart_can_be_redrawn(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, "RESULT_DIRECTORY", str(tmp_path))
+    result_id, chart_id = new_result_id(), new_result_id()
+    chart_code = strip_figure_output("fig = px.bar(ans_df, x='driver', y='wins')\nfig.to_json()")
+
+    async def main():
+        pool = KernelPool(min_size=1, max_size=1, health_check_interval=60)
+        await pool.start()
+        try:
+            async with pool.lease() as kernel:
+                first = await kernel.execute("\n".join([
+                    "import pandas as pd", "import plotly.express as px",
+                    "ans_df = pd.DataFrame({'driver': ['Hamilton'], 'wins': [7]})",
+                    result_writer_code(result_id), chart_code, chart_writer_code(result_id),
+                ]))
+            async with pool.lease() as kernel:
+                redrawn = await kernel.execute("\n".join([
+                    "import pandas as pd", "import plotly.express as px",
+                    result_loader_code(result_id), chart_code, chart_writer_code(chart_id),
+                ]))
+            return first, redrawn
+        finally:
+            await pool.shutdown()
+
+    first, redrawn = asyncio.run(main())
+    assert not [res for res in first + redrawn if res["type"] == "error"]
+    assert read_result_table(result_id).to_pydict() == {"driver": ["Hamilton"], "wins": [7]}
+    assert json.loads(pop_chart_json(result_id))["data"][0]["type"] == "bar"
+    assert json.loads(pop_chart_json(chart_id))["data"][0]["x"] == ["Hamilton"]
+    assert pop_chart_json(chart_id) is None
+
+
+def test_responses_embed_the_first_page_unless_more_rows_are_asked_for(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, "RESULT_DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(main, "RESULT_INLINE_MAX_ROWS", 1000)
+    result_id = write_result_table(pa.table({"lap": list(range(2500))}))
+
+    fields = main.collect_result(result_id, owner_id=1)
+    assert (fields["row_count"], fields["truncated"]) == (2500, True)
+    assert len(json.loads(fields["datatable_json"])) == main.RESULT_PAGE_DEFAULT_ROWS
+
+    fields = main.collect_result(result_id, owner_id=1, max_rows=main.inline_rows(5000))
+    assert len(json.loads(fields["datatable_json"])) == 1000
+    assert json.loads(main.collect_result(result_id, owner_id=1, max_rows=main.inline_rows(0))["datatable_json"]) == []
+    small_id = write_result_table(pa.table({"lap": [1, 2]}))
+    assert main.collect_result(small_id, owner_id=1)["truncated"] is False
@@ -0,0 +1,63 @@
+import os
+import time
+
+import pyarrow as pa
+import pytest
+
+import result_store
+from result_store import expire_results, new_result_id, result_path, save_result_meta
+from result_views import result_page
+
+
+def store(table: pa.Table) -> str:
+    result_id = new_result_id()
+    with pa.OSFile(result_path(result_id), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return result_id
+
+
+def test_pages_are_sorted_filtered_and_follow_cursors(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, "RESULT_DIRECTORY", str(tmp_path))
+    result_id = store(pa.table({
+        "driver": ["Hamilton", "Verstappen", "Leclerc", "Norris", "Sainz", None],
+        "wins": [7, 3, 3, 1, 2, 0],
+    }))
+
+    page, info = result_page(result_id, limit=2, sort="-wins,driver")
+    assert page["driver"].to_pylist() == ["Hamilton", "Leclerc"]
+    assert (info["total_rows"], info["next_cursor"]) == (6, "2")
+    page, info = result_page(result_id, limit=2, sort="-wins,driver", cursor=info["next_cursor"])
+    assert page["driver"].to_pylist() == ["Verstappen", "Sainz"]
+    assert info["offset"] == 2
+
+    page, info = result_page(result_id, filters=["wins:ge:2", "driver:contains:A"], sort="driver")
+    assert page["driver"].to_pylist() == ["Hamilton", "Sainz", "Verstappen"]
+    assert info["next_cursor"] is None
+    page, _ = result_page(result_id, filters=["driver:null"])
+    assert page["wins"].to_pylist() == [0]
+    page, _ = result_page(result_id, filters=["wins:in:1,2"], offset=1)
+    assert page["driver"].to_pylist() == ["Sainz"]
+
+    with pytest.raises(ValueError):
+        result_page(result_id, sort="team")
+    with pytest.raises(ValueError):
+        result_page(result_id, filters=["wins:gt:many"])
+    with pytest.raises(ValueError):
+        result_page(result_id, filters=["wins:gt:5"], cursor="1")
+
+
+def test_expired_and_abandoned_results_are_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, "RESULT_DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(result_store, "RESULT_TTL", 60)
+    kept, expired, abandoned = (store(pa.table({"n": [1]})) for _ in range(3))
+    save_result_meta(kept, owner_id=1)
+    meta = save_result_meta(expired, owner_id=1)
+    assert meta["expires_at"] == pytest.approx(time.time() + 60, abs=5)
+    old = time.time() - 120
+    os.utime(result_path(abandoned), (old, old))
+
+    assert expire_results(now=time.time() + 30, ttl=60) == 1
+    assert not os.path.exists(result_path(abandoned))
+    assert expire_results(now=time.time() + 90, ttl=60) == 2
+    assert os.listdir(tmp_path) == []
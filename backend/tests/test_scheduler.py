@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from scheduler import ExecutionScheduler, SchedulerFull
+
+
+def test_slots_are_shared_round_robin_between_users():
+    async def main():
+        scheduler = ExecutionScheduler(max_concurrent=1, max_queue=10, max_queue_per_user=10)
+        order = []
+        gate = asyncio.Event()
+
+        async def job(name):
+            order.append(name)
+            await gate.wait()
+
+        async def blocker():
+            await gate.wait()
+
+        first = asyncio.create_task(scheduler.run("a", blocker()))
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(scheduler.run(user, job(f"{user}{i}")))
+                 for user, i in [("a", 1), ("a", 2), ("a", 3), ("b", 1)]]
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(first, *tasks)
+        return order
+
+    assert asyncio.run(main()) == ["a1", "b1", "a2", "a3"]
+
+
+def test_full_queues_are_rejected_with_the_right_status():
+    async def main():
+        scheduler = ExecutionScheduler(max_concurrent=1, max_queue=2, max_queue_per_user=1)
+        gate = asyncio.Event()
+        running = asyncio.create_task(scheduler.run("a", gate.wait()))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(scheduler.run("a", gate.wait()))
+        await asyncio.sleep(0)
+
+        with pytest.raises(SchedulerFull) as per_user:
+            await scheduler.run("a", gate.wait())
+        other = asyncio.create_task(scheduler.run("b", gate.wait()))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerFull) as global_limit:
+            await scheduler.run("c", gate.wait())
+
+        gate.set()
+        await asyncio.gather(running, queued, other)
+        return per_user.value, global_limit.value
+
+    per_user, global_limit = asyncio.run(main())
+    assert per_user.status_code == 429
+    assert global_limit.status_code == 503
+    assert global_limit.retry_after >= 1
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def main():
+        scheduler = ExecutionScheduler(max_concurrent=1, max_queue=5, max_queue_per_user=5)
+        gate = asyncio.Event()
+        running = asyncio.create_task(scheduler.run("a", gate.wait()))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(scheduler.run("b", gate.wait()))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.sleep(0)
+        gate.set()
+        await running
+        return scheduler.stats()
+
+    assert asyncio.run(main()) == {"running": 0, "queued": 0, "max_concurrent": 1, "max_queue": 5}
+
+
+def test_a_waiter_cancelled_just_before_a_slot_frees_up_leaves_the_queue_consistent():
+    async def main():
+        scheduler = ExecutionScheduler(max_concurrent=1, max_queue=10, max_queue_per_user=10)
+        gate = asyncio.Event()
+        running = asyncio.create_task(scheduler.run("a", gate.wait()))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(scheduler.run("b", gate.wait()))
+        after = asyncio.create_task(scheduler.run("c", asyncio.sleep(0)))
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queued"] == 2
+
+        # The running job finishes (and releases its slot) before the cancelled task resumes
+        gate.set()
+        cancelled.cancel()
+        await running
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        await after
+        return scheduler.stats()
+
+    stats = asyncio.run(main())
+    assert (stats["running"], stats["queued"]) == (0, 0)
+
+
+def test_a_rejected_request_leaves_no_empty_queue_behind():
+    async def main():
+        scheduler = ExecutionScheduler(max_concurrent=1, max_queue=10, max_queue_per_user=0)
+        gate = asyncio.Event()
+        running = asyncio.create_task(scheduler.run("a", gate.wait()))
+        await asyncio.sleep(0)
+        rejected = scheduler.run("b", gate.wait())
+        with pytest.raises(SchedulerFull) as excinfo:
+            await rejected
+        assert excinfo.value.status_code == 429
+        gate.set()
+        await running
+        return scheduler.stats()
+
+    stats = asyncio.run(main())
+    assert (stats["running"], stats["queued"]) == (0, 0)
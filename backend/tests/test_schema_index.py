@@ -0,0 +1,51 @@
+from database.models import QueryLanguage
+from llm_service import aggregation_prompt
+from schema_index import BM25, estimate_tokens, select_schema, terms
+
+
+def table(name, columns, description="", profiles=None):
+    return {
+        "table_name": name, "variable_name": f"{name}_df", "description": description,
+        "columns_with_types": {column: "int64" for column in columns}, "row_count": 100,
+        "column_profiles": profiles or {},
+    }
+
+
+def render(question):
+    return lambda context: aggregation_prompt(question, context, QueryLanguage.python)
+
+
+def test_terms_and_bm25_ranking():
+    assert terms("raceResults_fastestLapTime") == ["race", "result", "fastest", "lap", "time"]
+    index = BM25([["driver", "win"], ["lap", "time"], ["driver", "lap", "time", "pit"]])
+    scores = index.scores(["driver", "win"])
+    assert scores[0] > scores[2] > scores[1] == 0
+
+
+def test_only_relevant_tables_and_columns_are_described():
+    filler = [table(f"telemetry_{i}", [f"sensor_{i}_{j}" for j in range(30)], "Car sensor readings") for i in range(30)]
+    races = table("races", ["race_id", "season", "circuit_id"] + [f"weather_{j}" for j in range(30)], "One row per race")
+    results = table(
+        "results", ["result_id", "race_id", "driver_id", "points", "wins"] + [f"lap_{j}_ms" for j in range(40)],
+        "Race results per driver",
+        profiles={"driver_id": {"top_values": [["hamilton", 5]], "distinct_count": 20}},
+    )
+    context = filler[:15] + [races] + filler[15:] + [results]
+    question = "Total points for hamilton per season"
+
+    selected, report = select_schema(question, context, render(question), token_budget=1200)
+    names = [t["table_name"] for t in selected]
+    assert set(names) == {"races", "results"}
+    by_name = {t["table_name"]: t for t in selected}
+    assert {"points", "driver_id", "race_id"} <= set(by_name["results"]["columns_with_types"])
+    assert {"season", "race_id"} <= set(by_name["races"]["columns_with_types"])
+    assert by_name["results"]["omitted_columns"] > 0
+    assert report["tokens_after"] <= 1200 < report["tokens_before"]
+    assert report["tokens_after"] == estimate_tokens(render(question)(selected))
+    assert (report["tables_before"], report["tables_after"]) == (32, 2)
+    assert "more columns not relevant" in render(question)(selected)
+
+    small = [races, results]
+    unchanged, report = select_schema(question, small, render(question), token_budget=100_000)
+    assert unchanged is small
+    assert report["tokens_after"] == report["tokens_before"]
@@ -0,0 +1,45 @@
+import pandas as pd
+from pandasql import sqldf
+
+from database.models import SqlEngine
+from sql_engine import sql_query_code
+
+
+def run(code, **frames):
+    namespace = {"pd": pd, "sqldf": sqldf, **frames}
+    exec(code, namespace)
+    return namespace
+
+
+def test_duckdb_scans_parquet_without_loading_frames(tmp_path):
+    path = tmp_path / "wins.parquet"
+    pd.DataFrame({"driver": ["Hamilton", "Verstappen", "Hamilton"], "wins": [7, 3, 2]}).to_parquet(path)
+    load_line = f"wins_df = pd.read_parquet(r'{path}')"
+
+    namespace = run(sql_query_code(
+        "SELECT driver, SUM(wins) AS wins FROM wins GROUP BY driver ORDER BY driver",
+        SqlEngine.duckdb, {"wins": str(path)}, [load_line],
+    ))
+
+    assert namespace["ans_df"].to_dict("list") == {"driver": ["Hamilton", "Verstappen"], "wins": [9, 3]}
+    assert "wins_df" not in namespace
+
+
+def test_query_duckdb_rejects_falls_back_to_pandasql(tmp_path):
+    path = tmp_path / "wins.parquet"
+    pd.DataFrame({"driver": ["Hamilton"], "wins": [7]}).to_parquet(path)
+    load_line = f"wins_df = pd.read_parquet(r'{path}')"
+    # julianday() exists in SQLite but not in DuckDB
+    sql = "SELECT driver FROM wins WHERE julianday('2024-01-02') > julianday('2024-01-01')"
+
+    namespace = run(sql_query_code(sql, SqlEngine.duckdb, {"wins": str(path)}, [load_line]))
+
+    assert namespace["ans_df"]["driver"].tolist() == ["Hamilton"]
+    assert "wins_df" in namespace
+
+
+def test_in_memory_frames_and_pandasql_engine():
+    frames = {"wins_df": pd.DataFrame({"driver": ["Hamilton"], "wins": [7]})}
+    for engine in SqlEngine:
+        namespace = run(sql_query_code("SELECT wins * 2 AS doubled FROM wins", engine, {"wins": None}), **frames)
+        assert namespace["ans_df"]["doubled"].tolist() == [14]
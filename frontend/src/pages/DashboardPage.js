@@ -13,18 +13,25 @@ function DashboardPage() {
   const fetchProjects = useCallback(async () => {
     if (!token) return;
     try {
-      const response = await fetch('/api/projects/', {
-        headers: {
-          'Authorization': `Bearer ${token}`,
-        },
-      });
-      if (response.ok) {
-        const data = await response.json();
-        setProjects(data);
-      } else {
-        console.error('Failed to fetch projects');
-        setError('Could not load projects.');
-      }
+      // Projects come a page at a time; follow the cursor until the last page
+      const all = [];
+      let cursor = null;
+      do {
+        const url = cursor ? `/api/projects/?cursor=${encodeURIComponent(cursor)}` : '/api/projects/';
+        const response = await fetch(url, {
+          headers: {
+            'Authorization': `Bearer ${token}`,
+          },
+        });
+        if (!response.ok) {
+          console.error('Failed to fetch projects');
+          setError('Could not load projects.');
+          return;
+        }
+        all.push(...(await response.json()));
+        cursor = response.headers.get('X-Next-Cursor');
+      } while (cursor);
+      setProjects(all);
     } catch (err) {
       setError('An error occurred while fetching projects.');
     }
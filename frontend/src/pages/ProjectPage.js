@@ -37,6 +37,75 @@ function DataTable({ jsonData }) {
     }
 }
 
+const PAGE_SIZE = 50;
+
+// Pages through a result stored on the server; sorting happens there too,
+// so only the rows on screen are transferred.
+function ResultTable({ resultId, token }) {
+    const [page, setPage] = useState(null);
+    const [offset, setOffset] = useState(0);
+    const [sort, setSort] = useState('');
+    const [pageError, setPageError] = useState('');
+
+    useEffect(() => { setOffset(0); setSort(''); }, [resultId]);
+
+    useEffect(() => {
+        const params = new URLSearchParams({ offset, limit: PAGE_SIZE });
+        if (sort) params.set('sort', sort);
+        fetch(`/api/results/${resultId}/rows?${params}`, { headers: { 'Authorization': `Bearer ${token}` } })
+            .then(async (response) => {
+                if (response.ok) {
+                    setPage(await response.json());
+                    setPageError('');
+                } else {
+                    const errorData = await response.json();
+                    setPageError(errorData.detail || 'Failed to load rows.');
+                }
+            })
+            .catch(() => setPageError('An error occurred while loading rows.'));
+    }, [resultId, token, offset, sort]);
+
+    const toggleSort = (column) => {
+        setSort(sort === column ? `-${column}` : column);
+        setOffset(0);
+    };
+
+    if (pageError) return <p style={{ color: 'red' }}>{pageError}</p>;
+    if (!page) return <p>Loading rows...</p>;
+    if (page.total_rows === 0) return <p>Query returned no data.</p>;
+
+    const headers = page.columns.map(column => column.name);
+    return (
+        <div>
+            <table style={{ borderCollapse: 'collapse', width: '100%', marginTop: '10px' }}>
+                <thead>
+                    <tr>
+                        {headers.map(header => (
+                            <th key={header} onClick={() => toggleSort(header)} style={{ border: '1px solid #ddd', padding: '8px', textAlign: 'left', cursor: 'pointer' }}>
+                                {header}{sort === header ? ' ▲' : sort === `-${header}` ? ' ▼' : ''}
+                            </th>
+                        ))}
+                    </tr>
+                </thead>
+                <tbody>
+                    {page.rows.map((row, i) => (
+                        <tr key={page.offset + i}>
+                            {headers.map(header => <td key={header} style={{ border: '1px solid #ddd', padding: '8px' }}>{String(row[header])}</td>)}
+                        </tr>
+                    ))}
+                </tbody>
+            </table>
+            <div style={{ marginTop: '5px' }}>
+                <button onClick={() => setOffset(Math.max(offset - PAGE_SIZE, 0))} disabled={offset === 0}>Previous</button>
+                <span style={{ margin: '0 10px' }}>
+                    Rows {page.offset + 1}-{page.offset + page.rows.length} of {page.total_rows}
+                </span>
+                <button onClick={() => setOffset(offset + PAGE_SIZE)} disabled={!page.next_cursor}>Next</button>
+            </div>
+        </div>
+    );
+}
+
 function ProjectPage() {
     const { projectId } = useParams();
     const { token } = useAuth();
@@ -132,18 +201,42 @@ function ProjectPage() {
         setQueryResult(null);
         setEditableCode("");
         try {
-            const response = await fetch(`/api/projects/${projectId}/query`, {
+            // Server-Sent Events: the code appears while it is being generated
+            const response = await fetch(`/api/projects/${projectId}/query/stream`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` },
                 body: JSON.stringify({ question, language, provider, model }),
             });
-            if (response.ok) {
-                const data = await response.json();
-                setQueryResult(data);
-                setEditableCode(data.aggregation_code || "");
-            } else {
+            if (!response.ok) {
                 const errorData = await response.json();
                 setQueryError(errorData.detail || 'Failed to execute query.');
+                return;
+            }
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let code = '';
+            for (;;) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                for (const raw of events) {
+                    const event = (raw.match(/^event: (.*)$/m) || [])[1];
+                    const data = JSON.parse((raw.match(/^data: (.*)$/m) || [])[1] || '{}');
+                    if (event === 'code') {
+                        code += data.delta;
+                        setEditableCode(code);
+                    } else if (event === 'status') {
+                        setEditableCode(data.aggregation_code);
+                    } else if (event === 'result') {
+                        setQueryResult(data);
+                        setEditableCode(data.aggregation_code || "");
+                    } else if (event === 'error') {
+                        setQueryError(data.detail || 'Failed to execute query.');
+                    }
+                }
             }
         } catch (err) { setQueryError('An error occurred while querying.'); }
         finally { setIsQueryLoading(false); }
@@ -164,6 +257,7 @@ function ProjectPage() {
                 setQueryResult(prevResult => ({
                     ...prevResult,
                     aggregation_code: data.aggregation_code,
+                    result_id: data.result_id,
                     datatable_json: data.datatable_json,
                     plot_json: data.plot_json
                 }));
@@ -199,7 +293,9 @@ function ProjectPage() {
                 headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` },
                 body: JSON.stringify({
                     original_question: question,
-                    datatable_json: queryResult.datatable_json,
+                    ...(queryResult.result_id
+                        ? { result_id: queryResult.result_id }
+                        : { datatable_json: queryResult.datatable_json }),
                     chart_type: chartType,
                     x_axis: xAxis,
                     y_axis: yAxis,
@@ -292,6 +388,7 @@ function ProjectPage() {
                 </form>
                 {queryError && <p style={{ color: 'red' }}>{queryError}</p>}
                 {isQueryLoading && <p>Loading results...</p>}
+                {isQueryLoading && !queryResult && editableCode && <pre>{editableCode}</pre>}
             </div>
 
             {queryResult && (
@@ -316,7 +413,9 @@ function ProjectPage() {
                     {/* Right Column: Data Table */}
                     <div className="results-grid-right">
                         <h3>Data Table Result</h3>
-                        <DataTable jsonData={queryResult.datatable_json} />
+                        {queryResult.result_id
+                            ? <ResultTable resultId={queryResult.result_id} token={token} />
+                            : <DataTable jsonData={queryResult.datatable_json} />}
                     </div>
                 </div>
             )}